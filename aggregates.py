@@ -0,0 +1,48 @@
+# Cubo de agregados para los desgloses por país, origen, sentimiento y cluster.
+# Se calcula una vez por versión de datos con operaciones vectorizadas y todas
+# las gráficas se sirven a partir de él, sin volver a agrupar las filas.
+import numpy as np
+import pandas as pd
+
+DIMENSIONES = ['pais', 'origen', 'sentimiento', 'cluster_dbscan']
+PAIS_NACIONAL = 'colombia'
+
+
+def origen(pais):
+    # "Nacional" para Colombia, "Exterior" para el resto (incluidos vacíos)
+    if isinstance(pais.dtype, pd.CategoricalDtype):
+        # Se evalúa una vez por categoría en lugar de una vez por fila
+        nacional = pais.cat.categories.astype(str).str.strip().str.lower() == PAIS_NACIONAL
+        codigos = pais.cat.codes.to_numpy()
+        es_nacional = np.where(codigos >= 0, nacional[codigos], False)
+    else:
+        es_nacional = (pais.astype(str).str.strip().str.lower() == PAIS_NACIONAL).to_numpy()
+    return pd.Categorical(np.where(es_nacional, 'Nacional', 'Exterior'), categories=['Nacional', 'Exterior'])
+
+
+def build_cube(df):
+    datos = pd.DataFrame({
+        'pais': df['pais'],
+        'origen': origen(df['pais']),
+        'sentimiento': df['sentimiento'].astype(str).str.strip().str.lower(),
+    })
+    if 'cluster_dbscan' in df.columns:
+        datos['cluster_dbscan'] = df['cluster_dbscan']
+    dims = [d for d in DIMENSIONES if d in datos.columns]
+    return datos.groupby(dims, observed=True, dropna=False).size().reset_index(name='cuenta')
+
+
+def rollup(cubo, dims, nombre='cuenta'):
+    # Suma el cubo sobre las dimensiones pedidas (las filas con valores vacíos
+    # en esas dimensiones se descartan, igual que en un groupby directo)
+    resultado = cubo.groupby(dims, observed=True)['cuenta'].sum().reset_index()
+    resultado = resultado[resultado['cuenta'] > 0]
+    return resultado.rename(columns={'cuenta': nombre}).reset_index(drop=True)
+
+
+def share(cubo, grupo, dim, nombre='cuenta'):
+    # Conteos de `dim` dentro de cada valor de `grupo` con su porcentaje
+    resultado = rollup(cubo, [grupo, dim], nombre)
+    total = resultado.groupby(grupo, observed=True)[nombre].transform('sum')
+    resultado['porcentaje'] = resultado[nombre] / total * 100
+    return resultado
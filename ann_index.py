@@ -0,0 +1,137 @@
+# Índice de vecinos más cercanos sobre los embeddings normalizados.
+# - Corpus pequeños: búsqueda exacta con un producto matricial en NumPy.
+# - Corpus grandes: índice IVF (listas invertidas sobre centroides de k-means);
+#   cada consulta solo compara contra las `nprobe` listas más cercanas.
+# El índice se guarda en disco y se abre con memmap.
+import json
+import os
+import re
+
+import numpy as np
+
+import projection
+import utils
+
+ANN_DIR = os.path.join(utils.CACHE_DIR, 'ann')
+
+# Por debajo de este tamaño la búsqueda exacta es más rápida que IVF
+MAX_EXACTO = 50_000
+NPROBE = 8
+
+
+def _normalizar(X):
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X[None, :]
+    return X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+
+def _top_k(scores, k):
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    orden = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1)
+    idx = np.take_along_axis(idx, orden, axis=1)
+    return np.take_along_axis(scores, idx, axis=1), idx
+
+
+class VectorIndex:
+
+    def __init__(self, vectors, keys, centroids=None, offsets=None, fingerprint=None):
+        self.vectors = vectors
+        self.keys = keys
+        self.centroids = centroids
+        self.offsets = offsets
+        self.fingerprint = fingerprint
+
+    @property
+    def kind(self):
+        return 'exact' if self.centroids is None else 'ivf'
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, X, claves, max_exacto=MAX_EXACTO, random_state=42):
+        # Un vector por comentario distinto
+        claves = np.asarray(claves, dtype='S32')
+        _, primeros = np.unique(claves, return_index=True)
+        primeros.sort()
+        X, claves = _normalizar(np.asarray(X)[primeros]), claves[primeros]
+        huella = projection.fingerprint(claves.tolist())
+        if len(X) <= max_exacto:
+            return cls(X, claves, fingerprint=huella)
+
+        from sklearn.cluster import MiniBatchKMeans
+
+        # Unas 4·sqrt(n) listas; los vectores se reordenan por lista para que
+        # cada una sea un bloque contiguo
+        n_listas = int(4 * np.sqrt(len(X)))
+        kmeans = MiniBatchKMeans(n_clusters=n_listas, random_state=random_state, batch_size=4096, n_init=3)
+        asignacion = kmeans.fit_predict(X)
+        orden = np.argsort(asignacion, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(asignacion, minlength=n_listas))])
+        centroides = _normalizar(kmeans.cluster_centers_)
+        return cls(X[orden], claves[orden], centroides, offsets, huella)
+
+    def search(self, consultas, k=10, nprobe=NPROBE):
+        # Devuelve (similitudes, claves) de forma (n_consultas, k), de mayor a menor
+        Q = _normalizar(consultas)
+        if self.kind == 'exact':
+            scores, idx = _top_k(Q @ np.asarray(self.vectors).T, k)
+            return scores, self.keys[idx]
+
+        # Todas las consultas devuelven min(k, n) vecinos, como la búsqueda exacta
+        k = min(k, len(self))
+        resultados_s, resultados_k = [], []
+        tamanos = np.diff(self.offsets)
+        listas = np.argsort(-(Q @ self.centroids.T), axis=1)
+        for q, ls in zip(Q, listas):
+            # Se abren al menos `nprobe` listas, y más si con ellas no se llega a
+            # k candidatos (listas pequeñas o vacías)
+            suficientes = int(np.searchsorted(np.cumsum(tamanos[ls]), k)) + 1
+            ls = ls[:max(nprobe, suficientes)]
+            candidatos = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in ls])
+            scores, idx = _top_k((self.vectors[candidatos] @ q)[None, :], k)
+            resultados_s.append(scores[0])
+            resultados_k.append(self.keys[candidatos[idx[0]]])
+        return np.array(resultados_s), np.array(resultados_k)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'vectors.npy'), self.vectors)
+        np.save(os.path.join(path, 'keys.npy'), self.keys)
+        if self.kind == 'ivf':
+            np.save(os.path.join(path, 'centroids.npy'), self.centroids)
+            np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'kind': self.kind, 'fingerprint': self.fingerprint, 'size': len(self)}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        keys = np.load(os.path.join(path, 'keys.npy'))
+        centroids = offsets = None
+        if meta['kind'] == 'ivf':
+            centroids = np.load(os.path.join(path, 'centroids.npy'))
+            offsets = np.load(os.path.join(path, 'offsets.npy'))
+        return cls(vectors, keys, centroids, offsets, meta['fingerprint'])
+
+
+def index_path(model_name, cache_dir=ANN_DIR):
+    return os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+
+
+def get_or_build(X, claves, model_name, cache_dir=ANN_DIR):
+    # Reutiliza el índice guardado si corresponde al mismo conjunto de embeddings
+    path = index_path(model_name, cache_dir)
+    huella = projection.fingerprint(claves)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        indice = VectorIndex.load(path)
+        if indice.fingerprint == huella:
+            return indice
+
+    indice = VectorIndex.build(X, claves)
+    indice.save(path)
+    return indice
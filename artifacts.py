@@ -0,0 +1,89 @@
+# Lectura de los artefactos precalculados por build_artifacts.py.
+# Estructura en disco:
+#   databases/artifacts/stages/<etapa>/<huella>/   salida de cada etapa (inmutable)
+#   databases/artifacts/versions/<version>.json   huella de cada etapa de una versión
+#   databases/artifacts/CURRENT                   versión publicada
+# El dashboard solo lee: abre la versión publicada y carga sus archivos, sin
+# ejecutar ningún modelo.
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import ann_index
+import storage
+import timeseries
+import utils
+
+ARTIFACTS_DIR = os.path.join(os.path.dirname(utils.CACHE_DIR), 'artifacts')
+
+
+def stages_dir(base=ARTIFACTS_DIR):
+    return os.path.join(base, 'stages')
+
+
+def versions_dir(base=ARTIFACTS_DIR):
+    return os.path.join(base, 'versions')
+
+
+def current_version(base=ARTIFACTS_DIR):
+    try:
+        with open(os.path.join(base, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_manifest(version=None, base=ARTIFACTS_DIR):
+    # Manifiesto de la versión pedida (por defecto la publicada); None si no hay
+    version = version or current_version(base)
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(versions_dir(base), f"{version}.json"), encoding='utf-8') as f:
+            manifiesto = json.load(f)
+    except FileNotFoundError:
+        return None
+    manifiesto['base'] = base
+    return manifiesto
+
+
+def stage_dir(manifiesto, etapa):
+    return os.path.join(stages_dir(manifiesto['base']), etapa, manifiesto['stages'][etapa])
+
+
+def read_table(manifiesto, columns=None, filters=None):
+    return storage.read_dataset(os.path.join(stage_dir(manifiesto, 'dataset'), 'datos.parquet'),
+                                columns=columns, filters=filters)
+
+
+def load_embeddings(manifiesto):
+    # Vectores (memmap, solo lectura) y claves, alineados con la columna `fila`
+    ruta = stage_dir(manifiesto, 'embeddings')
+    vectores = np.load(os.path.join(ruta, 'vectores.npy'), mmap_mode='r')
+    claves = np.load(os.path.join(ruta, 'claves.npy'))
+    return vectores, claves
+
+
+def load_layout(manifiesto):
+    return np.load(os.path.join(stage_dir(manifiesto, 'proyeccion'), 'layout.npy'), mmap_mode='r')
+
+
+def load_term_index(manifiesto):
+    return pd.read_parquet(os.path.join(stage_dir(manifiesto, 'indice_terminos'), 'term_index.parquet'))
+
+
+def load_cube(manifiesto):
+    return pd.read_parquet(os.path.join(stage_dir(manifiesto, 'agregados'), 'cubo.parquet'))
+
+
+def load_ann_index(manifiesto):
+    return ann_index.VectorIndex.load(stage_dir(manifiesto, 'vecinos'))
+
+
+def load_series(manifiesto):
+    # None en versiones sin la etapa o construidas sobre una base sin fechas
+    if 'series' not in manifiesto['stages']:
+        return None
+    return timeseries.load(stage_dir(manifiesto, 'series'))
@@ -0,0 +1,254 @@
+# Banco de pruebas del pipeline sobre corpus sintéticos.
+#
+#   python -m benchmarks.run --sizes 10k 100k 1m
+#   python -m benchmarks.run --sizes 10k --memory
+#   python -m benchmarks.run --compare benchmarks/results/A.json benchmarks/results/B.json
+#
+# Cada tamaño se ejecuta en un proceso nuevo para que la memoria de un tamaño
+# no contamine la del siguiente. Se mide cada etapa del pipeline (tiempo de
+# pared, filas, memoria) y el resultado se guarda en benchmarks/results/ junto
+# con la versión del código y del entorno, para comparar ejecuciones.
+# Los embeddings se calculan con un modelo sustituto local (hashing de
+# n-gramas + proyección aleatoria) para no depender de descargas.
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+ETAPAS = ['read_csv', 'prep_db', 'embeddings', 'clustering', 'projection', 'aggregation',
+          'term_index', 'wordcloud']
+TAMANOS = ['10k', '100k', '1m', '10m']
+# Cambio relativo de tiempo a partir del cual se marca una regresión
+UMBRAL = 0.10
+
+
+class HashingEncoder:
+    # Modelo sustituto con la misma interfaz que SentenceTransformer: n-gramas
+    # de caracteres con hashing y una proyección aleatoria fija a `dim` dimensiones
+
+    name = 'benchmark-hashing-encoder'
+
+    def __init__(self, dim=128, n_features=2**14, seed=0):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.dim = dim
+        self._vectorizer = HashingVectorizer(analyzer='char_wb', ngram_range=(3, 4), n_features=n_features)
+        rng = np.random.default_rng(seed)
+        self._proyeccion = rng.normal(size=(n_features, dim)).astype(np.float32) / np.sqrt(dim)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, textos, batch_size=4096, convert_to_numpy=True, **kwargs):
+        partes = []
+        for inicio in range(0, len(textos), batch_size):
+            disperso = self._vectorizer.transform(textos[inicio:inicio + batch_size])
+            partes.append(np.asarray(disperso @ self._proyeccion, dtype=np.float32))
+        if not partes:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.vstack(partes)
+
+
+def _run_size(n, seed, etapas, memoria, workdir):
+    # Se ejecuta en un proceso hijo: importa el pipeline y mide cada etapa
+    if memoria:
+        tracemalloc.start()
+
+    import aggregates
+    import clustering
+    import embedding_cache
+    import figure_cache
+    import prep_db
+    import profiling
+    import projection
+    import term_index
+    import tokenizer
+    import utils
+
+    from benchmarks import synthetic
+
+    profiling.reset()
+    ruta = os.path.join(workdir, f'corpus_{n}.csv')
+    with profiling.stage('bench.generate', filas=n):
+        synthetic.write_corpus(ruta, n, seed)
+
+    def medir(nombre, funcion):
+        if nombre not in etapas:
+            return None
+        with profiling.stage(f'bench.{nombre}', filas=n):
+            return funcion()
+
+    df = medir('read_csv', lambda: utils.read_csv_auto(ruta))
+    if df is None:
+        df = utils.read_csv_auto(ruta)
+    if df is None:
+        raise RuntimeError(f"No se pudo leer el corpus sintético: {ruta}")
+    tamano_csv = os.path.getsize(ruta)
+    os.remove(ruta)
+
+    medir('prep_db', lambda: prep_db.limpiar(df))
+    df['sentimiento'] = synthetic.sentiment_labels(len(df), seed)
+
+    X = None
+    if {'embeddings', 'clustering', 'projection'} & set(etapas):
+        encoder = HashingEncoder(seed=seed)
+        cache_dir = os.path.join(workdir, 'embeddings')
+
+        def codificar():
+            return embedding_cache.encode_cached(encoder, df['comentario'], encoder.name, cache_dir=cache_dir)
+
+        X = medir('embeddings', codificar)
+        if X is None:
+            X = codificar()
+
+    def agrupar():
+        modelo = clustering.ClusterModel.fit(X)
+        df['cluster_dbscan'] = modelo.assign(X)
+
+    medir('clustering', agrupar)
+    if 'cluster_dbscan' not in df.columns:
+        df['cluster_dbscan'] = 0
+    medir('projection', lambda: projection.compute_layout(X))
+    medir('aggregation', lambda: aggregates.build_cube(df))
+    indice = medir('term_index', lambda: term_index.build(df))
+    if indice is None and 'wordcloud' in etapas:
+        indice = term_index.build(df)
+    stopwords = tokenizer.default().stopwords
+
+    def nubes():
+        from wordcloud import WordCloud
+
+        for sentimiento in ['pos', 'neg', 'neu']:
+            frecuencias = term_index.frequencies(indice, 'sentimiento', sentimiento, stopwords)
+            if frecuencias:
+                wc = WordCloud(width=1000, height=600, background_color='white',
+                               collocations=False).generate_from_frequencies(frecuencias)
+                figure_cache.wordcloud_png(wc)
+
+    medir('wordcloud', nubes)
+
+    registros = profiling.records()
+    resumen = [r for r in profiling.summary() if not r['stage'].startswith('bench.')]
+    return {
+        'rows': n,
+        'csv_bytes': tamano_csv,
+        'stages': [dict(r, stage=r['stage'][len('bench.'):]) for r in registros if r['stage'].startswith('bench.')],
+        'detail': resumen,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _versiones():
+    from importlib import metadata
+
+    versiones = {}
+    for paquete in ['numpy', 'pandas', 'pyarrow', 'scikit-learn', 'wordcloud']:
+        try:
+            versiones[paquete] = metadata.version(paquete)
+        except metadata.PackageNotFoundError:
+            versiones[paquete] = None
+    return versiones
+
+
+def run(sizes, seed=0, etapas=ETAPAS, memoria=False, results_dir=RESULTS_DIR):
+    from benchmarks import synthetic
+
+    resultado = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': seed,
+            'memory_tracing': memoria,
+            'packages': _versiones(),
+        },
+        'results': [],
+    }
+
+    contexto = multiprocessing.get_context('spawn')
+    workdir = tempfile.mkdtemp(prefix='cartagena-bench-')
+    try:
+        for tamano in sizes:
+            n = synthetic.parse_size(tamano)
+            print(f"== {n:,} filas", flush=True)
+            with contexto.Pool(1) as pool:
+                datos = pool.apply(_run_size, (n, seed, list(etapas), memoria, workdir))
+            for r in datos['stages']:
+                print(f"   {r['stage']:<12} {r['seconds']:9.2f} s", flush=True)
+            resultado['results'].append(datos)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(results_dir, exist_ok=True)
+    nombre = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    if resultado['meta']['git']:
+        nombre += f"-{resultado['meta']['git']}"
+    ruta = os.path.join(results_dir, nombre + '.json')
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {ruta}")
+    return ruta
+
+
+def _tiempos(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    return {(r['rows'], e['stage']): e for r in datos['results'] for e in r['stages']}
+
+
+def compare(base, nuevo, umbral=UMBRAL):
+    # Tabla de tiempos por (filas, etapa); devuelve las regresiones encontradas
+    antes, despues = _tiempos(base), _tiempos(nuevo)
+    regresiones = []
+    print(f"{'filas':>11} {'etapa':<12} {'base (s)':>10} {'nuevo (s)':>10} {'cambio':>8}")
+    for clave in sorted(set(antes) & set(despues)):
+        t0, t1 = antes[clave]['seconds'], despues[clave]['seconds']
+        cambio = (t1 - t0) / t0 if t0 > 0 else 0.0
+        marca = ''
+        if cambio > umbral:
+            marca = '  <- regresión'
+            regresiones.append((clave, cambio))
+        print(f"{clave[0]:>11,} {clave[1]:<12} {t0:>10.2f} {t1:>10.2f} {cambio:>+8.0%}{marca}")
+    for clave in sorted(set(antes) ^ set(despues)):
+        print(f"{clave[0]:>11,} {clave[1]:<12} solo en {'base' if clave in antes else 'nuevo'}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banco de pruebas del pipeline con corpus sintéticos")
+    parser.add_argument('--sizes', nargs='+', default=TAMANOS[:2], help="Filas por corpus (ej. 10k 100k 1m 10m)")
+    parser.add_argument('--stages', nargs='+', default=ETAPAS, choices=ETAPAS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true', help="Medir el pico de memoria de cada etapa (más lento)")
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NUEVO'), help="Comparar dos resultados guardados")
+    parser.add_argument('--threshold', type=float, default=UMBRAL)
+    args = parser.parse_args()
+
+    if args.compare:
+        regresiones = compare(*args.compare, umbral=args.threshold)
+        sys.exit(1 if regresiones else 0)
+    run(args.sizes, args.seed, args.stages, args.memory, args.results_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# Generador de corpus sintéticos con el mismo esquema que twitter_coms.csv
+# (nombre;usuario;comentario;fecha;plataforma;ciudad;pais).
+# Los comentarios se arman combinando fragmentos en español sobre la ciudad,
+# con la proporción de vacíos, variantes de país, hashtags, emojis y saltos
+# de línea que tiene la exportación real. Con la misma semilla se genera
+# siempre el mismo archivo.
+import numpy as np
+import pandas as pd
+
+COLUMNAS = ['nombre', 'usuario', 'comentario', 'fecha', 'plataforma', 'ciudad', 'pais']
+BLOQUE = 200_000
+
+NOMBRES = ['Jorge', 'María', 'Andrés', 'Camila', 'Luis', 'Valentina', 'Carlos', 'Daniela',
+           'Juan', 'Laura', 'Santiago', 'Paula', 'Miguel', 'Sofía', 'Diego', 'Ana']
+APELLIDOS = ['Gómez', 'Rodríguez', 'Martínez', 'Pérez', 'Marín', 'Retana', 'Castro', 'Herrera',
+             'Sebastián', 'López', 'Díaz', 'Torres', 'Vargas', 'Rojas', 'Silva', 'Ortiz']
+
+LUGARES = ['la ciudad amurallada', 'getsemaní', 'bocagrande', 'playa blanca', 'el castillo de san felipe',
+           'las islas del rosario', 'el aeropuerto', 'el centro histórico', 'la torre del reloj',
+           'manga', 'el laguito', 'barú', 'la playa', 'el hotel', 'el puerto']
+TEMAS = ['la comida', 'los taxis', 'los vendedores', 'la seguridad', 'la limpieza', 'los precios',
+         'la atención', 'la vida nocturna', 'el transporte', 'los guías', 'el servicio', 'la gente']
+POSITIVOS = ['es espectacular', 'me encantó', 'vale la pena', 'es hermosa', 'fue una experiencia increíble',
+             'es muy segura', 'tiene gente muy amable', 'está muy limpia', 'es lo mejor del viaje']
+NEGATIVOS = ['es un desastre', 'da miedo', 'es una estafa', 'está muy sucia', 'es carísima',
+             'no vale la pena', 'tiene vendedores insistentes', 'nos quisieron cobrar de más', 'fue pésima']
+NEUTROS = ['está como siempre', 'tiene de todo', 'queda cerca', 'abre todos los días',
+           'se puede visitar en una tarde', 'depende de la temporada']
+EXTRAS = ['', '', '', ' volveremos pronto.', ' no lo recomiendo.', ' gracias a todos.',
+          ' $40.000 cop por persona.', ' ojo con los precios!!', ' pa lante!', ' 😡😡', ' 😍', ' 🌴☀️',
+          ' #cartagena', ' #resuena', ' #turismo', '\nlo digo por experiencia.']
+POLARIDADES = [POSITIVOS, NEGATIVOS, NEUTROS]
+PESOS_POLARIDAD = [0.45, 0.4, 0.15]
+
+PLATAFORMAS = ['X', 'TripAdvisor', 'Booking.com', 'Reddit', 'TripAdvisor Foro']
+PESOS_PLATAFORMA = [0.65, 0.16, 0.16, 0.02, 0.01]
+CIUDADES = [None, 'Bogotá', 'bogota', 'Barranquilla', 'cartagena', 'Cartagena', 'California',
+            'Medellín', 'Miami', 'Rio de Janeiro', 'Madrid', 'Quito']
+PESOS_CIUDAD = [0.67, 0.08, 0.07, 0.04, 0.03, 0.02, 0.03, 0.02, 0.02, 0.01, 0.005, 0.005]
+PAISES = [None, 'Colombia', 'colombia', ' Colombia', 'USA', 'Estados Unidos', 'Ecuador', 'Mexico',
+          'Brazil', 'España', 'Canada', 'Peru']
+PESOS_PAIS = [0.34, 0.23, 0.11, 0.1, 0.06, 0.02, 0.02, 0.03, 0.03, 0.03, 0.02, 0.01]
+
+FECHA_INICIO = np.datetime64('2023-01-01')
+DIAS = 730
+
+
+def _elegir(rng, opciones, n, pesos=None):
+    opciones = np.array(opciones, dtype=object)
+    if pesos is not None:
+        pesos = np.asarray(pesos) / np.sum(pesos)
+    return opciones[rng.choice(len(opciones), n, p=pesos)]
+
+
+def _comentarios(rng, n):
+    polaridad = rng.choice(len(POLARIDADES), n, p=PESOS_POLARIDAD)
+    sujeto = np.where(rng.random(n) < 0.5, _elegir(rng, LUGARES, n), _elegir(rng, TEMAS, n))
+    predicado = np.empty(n, dtype=object)
+    for i, frases in enumerate(POLARIDADES):
+        mascara = polaridad == i
+        predicado[mascara] = _elegir(rng, frases, int(mascara.sum()))
+
+    comentario = (
+        pd.Series(sujeto, dtype=object) + ' de cartagena ' + predicado
+        + _elegir(rng, EXTRAS, n) + _elegir(rng, EXTRAS, n)
+    )
+    # Variación de mayúsculas como en los comentarios reales
+    mayusculas = rng.random(n)
+    comentario = comentario.where(mayusculas >= 0.3, comentario.str.capitalize())
+    return comentario.where(mayusculas >= 0.03, comentario.str.upper())
+
+
+def generate(n, seed=0, offset=0):
+    # DataFrame de `n` filas; `offset` desplaza la semilla para generar por bloques
+    rng = np.random.default_rng([seed, offset])
+    nombre = pd.Series(_elegir(rng, NOMBRES, n), dtype=object) + ' ' + _elegir(rng, APELLIDOS, n)
+    usuario = (nombre.str.lower().str.replace(' ', '', regex=False)
+               + pd.Series(rng.integers(0, 1000, n)).astype(str))
+
+    fechas = pd.to_datetime(FECHA_INICIO + rng.integers(0, DIAS, n).astype('timedelta64[D]'))
+    # Mismo formato que la exportación: día sin relleno, mes con dos dígitos
+    fecha = fechas.day.astype(str) + '/' + fechas.strftime('%m/%Y')
+
+    df = pd.DataFrame({
+        'nombre': nombre.where(rng.random(n) >= 0.035),
+        'usuario': usuario.where(rng.random(n) >= 0.04),
+        'comentario': _comentarios(rng, n),
+        'fecha': pd.Series(fecha, dtype=object).where(rng.random(n) >= 0.005),
+        'plataforma': _elegir(rng, PLATAFORMAS, n, PESOS_PLATAFORMA),
+        'ciudad': _elegir(rng, CIUDADES, n, PESOS_CIUDAD),
+        'pais': _elegir(rng, PAISES, n, PESOS_PAIS),
+    })
+    return df[COLUMNAS]
+
+
+def write_corpus(path, n, seed=0, bloque=BLOQUE):
+    # Escribe el corpus por bloques (memoria acotada incluso con 10M filas),
+    # con BOM y separador ';' como el archivo original
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        for i, inicio in enumerate(range(0, n, bloque)):
+            generate(min(bloque, n - inicio), seed, i).to_csv(f, sep=';', header=(i == 0), index=False)
+    return path
+
+
+def sentiment_labels(n, seed=0):
+    # Etiquetas de sentimiento sintéticas (la etapa con BETO no forma parte
+    # del banco de pruebas porque requiere descargar el modelo)
+    rng = np.random.default_rng([seed, 1])
+    return pd.Categorical(_elegir(rng, ['pos', 'neg', 'neu'], n, PESOS_POLARIDAD), categories=['pos', 'neg', 'neu'])
+
+
+def parse_size(texto):
+    # "10k", "1m", "10M" o un número
+    texto = str(texto).strip().lower().replace('_', '')
+    multiplicador = {'k': 1_000, 'm': 1_000_000}.get(texto[-1:], 1)
+    if multiplicador > 1:
+        texto = texto[:-1]
+    return int(float(texto) * multiplicador)
@@ -0,0 +1,371 @@
+# Construcción offline de todo lo que usa el dashboard.
+# Las etapas forman un grafo de dependencias:
+#   limpieza ─┬─ sentimiento ──────────────┐
+#             └─ embeddings ─┬─ clustering ─┴─ dataset ─┬─ indice_terminos
+#                            ├─ proyeccion              ├─ agregados
+#                            └─ vecinos                 └─ series
+# La huella de cada etapa combina su versión de código, sus parámetros y las
+# huellas de sus dependencias (la de limpieza incluye el hash del archivo de
+# entrada). Si ya existe una salida con esa huella la etapa se omite. Las
+# etapas solo leen sus entradas declaradas: el modelo de clusters y el layout
+# se ajustan desde cero y se guardan como parte de la salida, nunca en
+# CACHE_DIR, para que la huella describa todo lo que determina el resultado.
+# Al final se publica una versión nueva que el dashboard abre en modo solo
+# lectura.
+#
+#   python build_artifacts.py
+#   python build_artifacts.py --input ./databases/twitter_coms.csv
+#   python build_artifacts.py --force clustering
+#   python build_artifacts.py --dry-run
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import ann_index
+import artifacts
+import clustering
+import embedding_cache
+import figure_cache
+import label_sentiment
+import models
+import normalization
+import prep_db
+import profiling
+import projection
+import storage
+import term_index
+import timeseries
+import utils
+
+ARTIFACTS_DIR = artifacts.ARTIFACTS_DIR
+META = '_etapa.json'
+MANTENER_VERSIONES = 3
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    run: Callable
+    deps: tuple = ()
+    # Opciones que afectan a la salida (forman parte de la huella)
+    params: tuple = ()
+    # Se incrementa al cambiar el código de la etapa para invalidar sus salidas
+    version: int = 1
+
+
+def _leer(entradas, etapa, archivo, **kwargs):
+    return pd.read_parquet(os.path.join(entradas[etapa], archivo), **kwargs)
+
+
+def _limpieza(entradas, salida, opciones):
+    df = utils.read_csv_auto(opciones['input'])
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {opciones['input']}")
+    if 'nombre' in df.columns:
+        # Exportación original sin limpiar
+        prep_db.limpiar(df)
+    else:
+        # Base ya limpia (p. ej. db_final.csv): las reglas son idempotentes
+        normalization.normalize_frame(df, prep_db.REGLAS)
+        prep_db.set_types(df)
+    df = df.reset_index(drop=True)
+    df.to_parquet(os.path.join(salida, 'datos.parquet'), index=False)
+    return {'rows': len(df)}
+
+
+def _sentimiento(entradas, salida, opciones):
+    df = _leer(entradas, 'limpieza', 'datos.parquet')
+    columnas = label_sentiment.COLUMNAS_CACHE[1:]
+    resultado = pd.DataFrame(index=df.index, columns=columnas, dtype=float)
+    resultado['sentimiento'] = None
+
+    # Se conservan las etiquetas que ya trae la base; BETO solo clasifica las
+    # filas sin etiqueta (o todas con --relabel)
+    if 'sentimiento' in df.columns and not opciones['relabel']:
+        existentes = df['sentimiento'].astype('string').str.strip().str.lower()
+        resultado['sentimiento'] = existentes.astype(object).where(existentes.notna(), None)
+    pendientes = resultado['sentimiento'].isna().to_numpy()
+
+    if pendientes.any():
+        etiquetado = label_sentiment.label_dataframe(df.loc[pendientes, ['comentario']].copy())
+        resultado.loc[pendientes, columnas] = etiquetado[columnas].to_numpy()
+
+    resultado['sentimiento_valor'] = resultado['sentimiento'].map(label_sentiment.SENT_MAP)
+    resultado.to_parquet(os.path.join(salida, 'sentimiento.parquet'), index=False)
+    return {'rows': len(resultado), 'labelled': int(pendientes.sum())}
+
+
+def _embeddings(entradas, salida, opciones):
+    textos = _leer(entradas, 'limpieza', 'datos.parquet', columns=['comentario'])['comentario']
+    modelo = models.get_model(models.EMBEDDINGS)
+    X = embedding_cache.encode_cached(modelo, textos, models.EMBEDDING_MODEL)
+    claves = np.asarray(embedding_cache.keys_for(textos, models.EMBEDDING_MODEL), dtype='S32')
+    np.save(os.path.join(salida, 'vectores.npy'), np.asarray(X, dtype=np.float32))
+    np.save(os.path.join(salida, 'claves.npy'), claves)
+    return {'rows': len(claves)}
+
+
+def _vectores(entradas):
+    ruta = entradas['embeddings']
+    return np.load(os.path.join(ruta, 'vectores.npy'), mmap_mode='r'), np.load(os.path.join(ruta, 'claves.npy'))
+
+
+def _clustering(entradas, salida, opciones):
+    # El modelo ajustado queda en la salida de la etapa (no en la caché global)
+    X, _ = _vectores(entradas)
+    etiquetas = clustering.cluster(np.asarray(X), models.EMBEDDING_MODEL, refit=True, cache_dir=salida)
+    np.save(os.path.join(salida, 'clusters.npy'), etiquetas.astype(np.int32))
+    return {'rows': len(etiquetas), 'clusters': int(len(set(etiquetas.tolist()) - {-1}))}
+
+
+def _proyeccion(entradas, salida, opciones):
+    X, claves = _vectores(entradas)
+    # Layout calculado solo con los embeddings de la entrada; el almacén de
+    # layout se escribe en la salida de la etapa
+    layout = projection.project(np.asarray(X), claves.tolist(), models.EMBEDDING_MODEL, cache_dir=salida,
+                                random_state=42, perplexity=30, max_iter=1000)
+    np.save(os.path.join(salida, 'layout.npy'), np.asarray(layout, dtype=np.float32))
+    return {'rows': len(layout)}
+
+
+def _vecinos(entradas, salida, opciones):
+    X, claves = _vectores(entradas)
+    indice = ann_index.VectorIndex.build(np.asarray(X), claves)
+    indice.save(salida)
+    return {'rows': len(indice), 'kind': indice.kind}
+
+
+def _dataset(entradas, salida, opciones):
+    df = _leer(entradas, 'limpieza', 'datos.parquet')
+    sentimiento = _leer(entradas, 'sentimiento', 'sentimiento.parquet')
+    # Las columnas calculadas reemplazan a las que pudiera traer la base
+    df = df.drop(columns=[c for c in sentimiento.columns if c in df.columns] + ['cluster_dbscan', 'longitud'],
+                 errors='ignore')
+    df = pd.concat([df, sentimiento], axis=1)
+    df['longitud'] = df['comentario'].fillna('').astype(str).str.len()
+    df['cluster_dbscan'] = np.load(os.path.join(entradas['clustering'], 'clusters.npy'))
+    # Posición de la fila en embeddings, layout y clusters
+    df['fila'] = np.arange(len(df), dtype=np.int32)
+    storage.write_dataset(df, os.path.join(salida, 'datos.parquet'))
+    return {'rows': len(df)}
+
+
+def _tabla(entradas):
+    return storage.read_dataset(os.path.join(entradas['dataset'], 'datos.parquet'))
+
+
+def _indice_terminos(entradas, salida, opciones):
+    indice = term_index.build(_tabla(entradas))
+    term_index.save(indice, os.path.join(salida, 'term_index.parquet'))
+    return {'rows': len(indice)}
+
+
+def _agregados(entradas, salida, opciones):
+    cubo = aggregates.build_cube(_tabla(entradas))
+    cubo.to_parquet(os.path.join(salida, 'cubo.parquet'), index=False)
+    return {'rows': len(cubo)}
+
+
+def _series(entradas, salida, opciones):
+    # Sin columna de fecha (p. ej. una db_final.csv anterior) no hay series
+    rollups = timeseries.build(_tabla(entradas))
+    if rollups is None:
+        return {'rows': 0}
+    timeseries.save(rollups, salida)
+    return {'rows': int(rollups['dia']['cuenta'].sum())}
+
+
+# En orden topológico
+STAGES = [
+    Stage('limpieza', _limpieza, params=('input_hash',), version=2),
+    Stage('sentimiento', _sentimiento, deps=('limpieza',), params=('sentiment_model', 'relabel')),
+    Stage('embeddings', _embeddings, deps=('limpieza',), params=('embedding_model',)),
+    Stage('clustering', _clustering, deps=('embeddings',), version=2),
+    Stage('proyeccion', _proyeccion, deps=('embeddings',), version=2),
+    Stage('vecinos', _vecinos, deps=('embeddings',)),
+    Stage('dataset', _dataset, deps=('limpieza', 'sentimiento', 'clustering')),
+    Stage('indice_terminos', _indice_terminos, deps=('dataset',), version=4),
+    Stage('agregados', _agregados, deps=('dataset',)),
+    Stage('series', _series, deps=('dataset',), version=2),
+]
+
+
+def _hash_archivo(path, bloque=2**20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for parte in iter(lambda: f.read(bloque), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def plan(objetivos=None, etapas=STAGES):
+    # Etapas necesarias para los objetivos (con sus dependencias), en orden
+    por_nombre = {e.name: e for e in etapas}
+    if not objetivos:
+        return list(etapas)
+    necesarias = set()
+    pendientes = list(objetivos)
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre not in por_nombre:
+            raise KeyError(f"Etapa desconocida: {nombre!r}")
+        if nombre not in necesarias:
+            necesarias.add(nombre)
+            pendientes.extend(por_nombre[nombre].deps)
+    return [e for e in etapas if e.name in necesarias]
+
+
+def fingerprint(etapa, huellas, opciones):
+    return figure_cache.make_key(
+        etapa.name,
+        etapa.version,
+        {p: opciones[p] for p in etapa.params},
+        [huellas[d] for d in etapa.deps],
+    )
+
+
+def _escribir_json(path, datos):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(tmp, path)
+
+
+def build(opciones, objetivos=None, force=(), dry_run=False, base=ARTIFACTS_DIR):
+    # Ejecuta las etapas cuya huella no tiene salida todavía. Devuelve las
+    # huellas por etapa y el estado de cada una ('omitida' o 'ejecutada')
+    huellas, estados = {}, {}
+    for etapa in plan(objetivos):
+        huella = fingerprint(etapa, huellas, opciones)
+        huellas[etapa.name] = huella
+        destino = os.path.join(artifacts.stages_dir(base), etapa.name, huella)
+        forzada = etapa.name in force or 'all' in force
+
+        if os.path.exists(os.path.join(destino, META)) and not forzada:
+            estados[etapa.name] = 'omitida'
+            print(f"{etapa.name:<16} sin cambios ({huella[:8]})")
+            continue
+        estados[etapa.name] = 'ejecutada'
+        if dry_run:
+            print(f"{etapa.name:<16} se ejecutaría ({huella[:8]})")
+            continue
+
+        print(f"{etapa.name:<16} ejecutando...", flush=True)
+        # Se escribe en un temporal y se renombra al terminar: una salida a
+        # medias nunca queda publicada
+        tmp = f"{destino}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        entradas = {d: os.path.join(artifacts.stages_dir(base), d, huellas[d]) for d in etapa.deps}
+        with profiling.stage(f"build.{etapa.name}") as registro:
+            info = etapa.run(entradas, tmp, opciones) or {}
+            registro['rows'] = info.get('rows')
+        _escribir_json(os.path.join(tmp, META), dict(
+            info,
+            stage=etapa.name,
+            fingerprint=huella,
+            deps={d: huellas[d] for d in etapa.deps},
+            params={p: opciones[p] for p in etapa.params},
+            seconds=registro['seconds'],
+            created=datetime.datetime.now().isoformat(timespec='seconds'),
+        ))
+        if os.path.exists(destino):
+            shutil.rmtree(destino)
+        os.replace(tmp, destino)
+        print(f"{etapa.name:<16} listo en {registro['seconds']:.1f} s ({huella[:8]})")
+    return huellas, estados
+
+
+def publish(huellas, opciones, base=ARTIFACTS_DIR):
+    # Registra una versión con las huellas de todas las etapas y la marca como
+    # publicada; si coincide con la versión actual no se crea una nueva
+    actual = artifacts.load_manifest(base=base)
+    if actual is not None and actual['stages'] == huellas:
+        print(f"Versión publicada sin cambios: {actual['version']}")
+        return actual['version']
+
+    version = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{figure_cache.make_key(huellas)[:8]}"
+    os.makedirs(artifacts.versions_dir(base), exist_ok=True)
+    _escribir_json(os.path.join(artifacts.versions_dir(base), f"{version}.json"), {
+        'version': version,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'input': opciones['input'],
+        'input_hash': opciones['input_hash'],
+        'stages': huellas,
+    })
+    tmp = os.path.join(base, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(base, 'CURRENT'))
+    print(f"Versión publicada: {version}")
+    return version
+
+
+def prune(keep=MANTENER_VERSIONES, base=ARTIFACTS_DIR):
+    # Conserva las últimas `keep` versiones (y la publicada) y borra las salidas
+    # de etapas que ya no usa ninguna de ellas
+    directorio = artifacts.versions_dir(base)
+    if not os.path.isdir(directorio):
+        return
+    versiones = sorted(f[:-len('.json')] for f in os.listdir(directorio) if f.endswith('.json'))
+    conservar = set(versiones[-keep:]) | {artifacts.current_version(base)}
+    for version in versiones:
+        if version not in conservar:
+            os.remove(os.path.join(directorio, f"{version}.json"))
+
+    en_uso = set()
+    for version in conservar - {None}:
+        manifiesto = artifacts.load_manifest(version, base)
+        if manifiesto is not None:
+            en_uso.update(manifiesto['stages'].items())
+    for etapa in os.listdir(artifacts.stages_dir(base)):
+        ruta_etapa = os.path.join(artifacts.stages_dir(base), etapa)
+        for huella in os.listdir(ruta_etapa):
+            if (etapa, huella) not in en_uso and '.tmp-' not in huella:
+                shutil.rmtree(os.path.join(ruta_etapa, huella), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcula los artefactos del dashboard")
+    parser.add_argument('--input', default=prep_db.URL_OUTPUT,
+                        help="Base limpia (db_final.csv) o exportación original (twitter_coms.csv)")
+    parser.add_argument('--stages', nargs='+', default=None, choices=[e.name for e in STAGES],
+                        help="Construir solo estas etapas y sus dependencias (no publica versión)")
+    parser.add_argument('--force', nargs='+', default=(), metavar='ETAPA',
+                        help="Volver a ejecutar estas etapas aunque no hayan cambiado ('all' para todas)")
+    parser.add_argument('--relabel', action='store_true', help="Clasificar con BETO también las filas ya etiquetadas")
+    parser.add_argument('--keep', type=int, default=MANTENER_VERSIONES, help="Versiones a conservar")
+    parser.add_argument('--dry-run', action='store_true', help="Mostrar qué etapas se ejecutarían")
+    parser.add_argument('--profile', default=None, metavar='RUTA',
+                        help="Guardar los tiempos por etapa (.json o .prom para Prometheus)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        raise SystemExit(f"No se encontró el archivo: {args.input}")
+    opciones = {
+        'input': args.input,
+        'input_hash': _hash_archivo(args.input),
+        'embedding_model': models.EMBEDDING_MODEL,
+        'sentiment_model': models.SENTIMENT_MODEL,
+        'relabel': args.relabel,
+    }
+
+    huellas, _ = build(opciones, args.stages, args.force, args.dry_run)
+    if not args.dry_run and not args.stages:
+        publish(huellas, opciones)
+        prune(args.keep)
+    if args.profile:
+        profiling.export(args.profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,358 @@
 # # Librerías para dashboard, gráficos y procesamiento de texto
 import streamlit as st
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import plotly.express as px
 
 import io
-from wordcloud import WordCloud
-from sentence_transformers import SentenceTransformer
-from sklearn.manifold import TSNE
+import os
 import utils as utils
+import embedding_cache
+import models
+import storage
+import projection
+import ann_index
+import normalization
+import term_index
+import tokenizer
+import figure_cache
+import aggregates
+import scatter_lod
+import profiling
+import artifacts
+import jobs
+import timeseries
+
+# Stopwords personalizadas, plegadas sin tildes por el tokenizador compartido
+STOPWORDS = tokenizer.default().stopwords
+
+
+# Modelos compartidos entre sesiones: se cargan una sola vez por servidor
+@st.cache_resource(show_spinner="Cargando modelo de embeddings...")
+def cargar_modelo_embeddings():
+    return models.get_model(models.EMBEDDINGS)
+
+
+# Precarga opcional (CARTAGENA_WARMUP=1): la primera visita ya encuentra el modelo listo
+@st.cache_resource(show_spinner=False)
+def calentar_modelos():
+    models.warm_up([models.EMBEDDINGS])
+    return True
+
+
+if os.environ.get("CARTAGENA_WARMUP") == "1":
+    calentar_modelos()
 
-# Cargar stopwords personalizadas
-STOPWORDS = utils.load_stopwords()
 
 # Rutas de archivos CSV
 csv_path = './databases/db_final.csv'
 csv_path_old = './databases/twitter_coms.csv'
 
-# Leer bases de datos
-df = utils.read_csv_auto(csv_path)
-df_old = utils.read_csv_auto(csv_path_old)
+# Columnas que usa el dashboard (proyección al leer el Parquet)
+COLUMNAS_DASHBOARD = ['usuario', 'comentario', 'pais', 'sentimiento', 'longitud', 'cluster_dbscan', 'sentimiento_valor']
+SENTIMIENTOS = ['pos', 'neg', 'neu']
+
+
+# Artefactos precalculados (build_artifacts.py): si hay una versión publicada
+# el dashboard solo lee archivos y no ejecuta ningún modelo
+ARTEFACTOS = artifacts.load_manifest()
+
+
+# Se prefieren los artefactos, luego el conjunto Parquet; el CSV queda como
+# respaldo y formato de exportación.
+# Los DataFrames se guardan con cache_resource: todas las sesiones comparten
+# el mismo objeto (cache_data devolvería una copia en cada ejecución), por lo
+# que el dashboard nunca los modifica; las vistas derivadas son proyecciones
+@st.cache_resource(show_spinner=False)
+def cargar_datos(sentimientos, version):
+    if ARTEFACTOS:
+        df = artifacts.read_table(
+            artifacts.load_manifest(version),
+            columns=COLUMNAS_DASHBOARD + ["fila"],
+            filters=[('sentimiento', 'in', list(sentimientos))],
+        )
+    elif storage.dataset_exists():
+        df = storage.read_dataset(
+            columns=COLUMNAS_DASHBOARD,
+            filters=[('sentimiento', 'in', list(sentimientos))],
+        )
+    else:
+        df = utils.read_csv_auto(csv_path)
+        if df is not None:
+            df = df[df['sentimiento'].isin(sentimientos)].reset_index(drop=True)
+    # Categorías y cadenas Arrow en lugar de columnas de objetos Python
+    return storage.compact_frame(df) if df is not None else None
+
+
+# Filtro de sentimientos: con Parquet solo se leen las particiones elegidas
+sentimientos_sel = st.sidebar.multiselect("Sentimientos", SENTIMIENTOS, default=SENTIMIENTOS)
+if not sentimientos_sel:
+    st.warning("Selecciona al menos un sentimiento.")
+    st.stop()
+
+# La versión invalida la caché de lectura cuando cambian los datos en disco
+if ARTEFACTOS:
+    version_datos = ARTEFACTOS["version"]
+elif storage.dataset_exists():
+    version_datos = storage.dataset_version()
+elif os.path.exists(csv_path):
+    version_datos = os.path.getmtime(csv_path)
+else:
+    version_datos = 0.0
+
+# Base original: solo la usa la sección de limpieza
+@st.cache_resource(show_spinner=False)
+def cargar_datos_originales(version):
+    df = utils.read_csv_auto(csv_path_old)
+    return storage.compact_frame(df) if df is not None else None
+
+
+# Leer base de datos (en caché: solo se lee de nuevo si cambia la versión)
+SEL = tuple(sentimientos_sel)
+df = cargar_datos(SEL, version_datos)
 
 # Validación de existencia de archivos
 if df is None:
     st.error(f"No se encontró o no se pudo leer el archivo: {csv_path}")
     st.stop()
-if df_old is None:
-    st.error(f"No se encontró o no se pudo leer el archivo: {csv_path_old}")
-    st.stop()
+
+# Caché de figuras renderizadas compartida entre sesiones (memoria y disco):
+# las claves combinan la huella de los datos con los parámetros de render
+cache_figuras = figure_cache.get_cache()
+HUELLA_STOPWORDS = figure_cache.stopwords_fingerprint(STOPWORDS)
+COLORES_PIE = ["#A8E6CF", "#FF8B94", "#DCD6F7"]
+COLORES_SENTIMIENTO = {"pos": "green", "neu": "gray", "neg": "red"}
+
+
+@st.cache_data(show_spinner=False)
+def huella_datos(sentimientos, version):
+    return utils.dataset_fingerprint(cargar_datos(sentimientos, version))
+
+
+# Cubo de conteos por (pais, origen, sentimiento, cluster): una sola agrupación
+# por versión de datos; todas las gráficas de conteos salen de aquí
+@st.cache_resource(show_spinner=False)
+def cargar_cubo(sentimientos, version):
+    if ARTEFACTOS:
+        # El sentimiento es una dimensión del cubo: filtrar filas es exacto
+        cubo = artifacts.load_cube(artifacts.load_manifest(version))
+        return cubo[cubo["sentimiento"].isin(sentimientos)].reset_index(drop=True)
+    return aggregates.build_cube(cargar_datos(sentimientos, version))
+
+
+def render_wordcloud(frecuencias, colormap, width=1000, height=600):
+    # PNG vacío si no hay palabras que dibujar
+    if not frecuencias:
+        return b""
+    # WordCloud y matplotlib se importan al dibujar la primera figura: con la
+    # caché de figuras caliente no llegan a cargarse
+    from wordcloud import WordCloud
+
+    with profiling.stage("wordcloud", filas=len(frecuencias)):
+        wc = WordCloud(
+            width=width,
+            height=height,
+            background_color="white",
+            colormap=colormap,
+            collocations=False
+        ).generate_from_frequencies(frecuencias)
+        return figure_cache.wordcloud_png(wc)
+
+
+def render_pie(valores, etiquetas, equal=False):
+    import matplotlib.pyplot as plt
+
+    with profiling.stage("chart.pie", filas=len(valores)):
+        fig, ax = plt.subplots(figsize=(5, 5))
+        ax.pie(valores, labels=etiquetas, autopct="%1.1f%%", colors=COLORES_PIE, startangle=90)
+        if equal:
+            ax.axis("equal")
+        return figure_cache.matplotlib_png(fig)
+
+
+# Índice de frecuencias de términos: los comentarios se tokenizan una sola vez
+# por versión de datos y las nubes se dibujan a partir de los conteos
+@st.cache_resource(show_spinner=False)
+def cargar_indice_terminos(sentimientos, version):
+    # El índice precalculado cubre todos los sentimientos; con un filtro parcial
+    # los conteos por cluster y país se recalculan (sin modelos)
+    if set(sentimientos) == set(SENTIMIENTOS):
+        if ARTEFACTOS:
+            return artifacts.load_term_index(artifacts.load_manifest(version))
+        # En vivo, el índice que mantienen term_index.py e ingest.py si es más
+        # reciente que la base
+        if term_index.index_version() >= version:
+            return term_index.load()
+    return term_index.build(cargar_datos(sentimientos, version))
+
+
+# Generación de nubes de palabras por sentimiento
+def generar_wordcloud(sentimiento, color, sw, indice_terminos, huella):
+    # Frecuencias de los comentarios con el sentimiento, sin stopwords; la
+    # imagen solo se dibuja si no está en la caché de figuras
+    png = figura_en_segundo_plano(
+        figure_cache.make_key("wordcloud", huella, "sentimiento", sentimiento, color, 1000, 600,
+                              figure_cache.stopwords_fingerprint(sw)),
+        lambda: render_wordcloud(
+            term_index.frequencies(indice_terminos, "sentimiento", sentimiento, sw), color
+        ),
+        mensaje=f"Dibujando la nube de palabras ({sentimiento})",
+    )
+
+    # Solo mostrar si hay texto válido
+    if png:
+        st.subheader(f"Nube de Palabras - Comentarios {sentimiento.capitalize()}")
+        st.image(
+            png,
+            width="stretch"
+        )
+
+
+# Embeddings y layout 2D: se calculan solo al abrir la sección de clusters y
+# se reutilizan mientras no cambien los datos. La huella de las claves (que
+# ordena las N claves) se calcula aquí una sola vez, no en cada ejecución
+@st.cache_resource(show_spinner=False)
+def calcular_embeddings(sentimientos, version):
+    if ARTEFACTOS:
+        # Filas de la selección dentro de los vectores precalculados
+        X_todos, claves_todas = artifacts.load_embeddings(artifacts.load_manifest(version))
+        filas = cargar_datos(sentimientos, version)["fila"].to_numpy()
+        claves_emb = [bytes(k) for k in claves_todas[filas]]
+        return np.asarray(X_todos[filas]), claves_emb, projection.fingerprint(claves_emb)
+    textos = cargar_datos(sentimientos, version)["comentario"]
+    modelo = models.get_model(models.EMBEDDINGS)
+    # Solo se codifican los comentarios que no estén ya en la caché de embeddings
+    X_emb = embedding_cache.encode_cached(modelo, textos, models.EMBEDDING_MODEL)
+    claves_emb = embedding_cache.keys_for(textos, models.EMBEDDING_MODEL)
+    return X_emb, claves_emb, projection.fingerprint(claves_emb)
+
+
+@st.cache_resource(show_spinner=False)
+def calcular_layout(sentimientos, version):
+    # Layout 2D en caché: solo se ubican los comentarios que aún no tiene
+    if ARTEFACTOS:
+        layout = artifacts.load_layout(artifacts.load_manifest(version))
+        return np.asarray(layout[cargar_datos(sentimientos, version)["fila"].to_numpy()])
+    X_emb, claves_emb, _ = calcular_embeddings(sentimientos, version)
+    return projection.project(X_emb, claves_emb, models.EMBEDDING_MODEL,
+                              random_state=42, perplexity=30, max_iter=1000)
+
+
+# Tabla del mapa 2D compartida entre sesiones: coordenadas, cluster y la
+# posición de la fila en `df` (los detalles de cada punto se consultan solo al
+# seleccionarlo, en lugar de enviarlos todos como hover)
+@st.cache_resource(show_spinner=False)
+def mapa_2d(sentimientos, version):
+    X_2D = calcular_layout(sentimientos, version)
+    return pd.DataFrame({
+        "x": X_2D[:, 0],
+        "y": X_2D[:, 1],
+        "cluster_dbscan": cargar_datos(sentimientos, version)["cluster_dbscan"].to_numpy(),
+        "fila": np.arange(len(X_2D), dtype=np.int32),
+    })
+
+
+# Nivel de detalle del mapa 2D: el navegador recibe una muestra estratificada
+# o celdas de densidad, nunca todos los puntos
+@st.cache_data(show_spinner=False)
+def muestra_mapa(sentimientos, version):
+    estratos = df[["cluster_dbscan", "sentimiento"]].reset_index(drop=True)
+    return scatter_lod.stratified_sample(estratos, ["cluster_dbscan", "sentimiento"])
+
+
+@st.cache_data(show_spinner=False)
+def celdas_mapa(sentimientos, version):
+    X_2D = calcular_layout(sentimientos, version)
+    return scatter_lod.density_tiles(X_2D[:, 0], X_2D[:, 1], etiquetas=df["cluster_dbscan"].to_numpy())
+
+
+# Series de tiempo (conteos diarios y semanales): los filtros de fechas se
+# responden desde los rollups, sin volver a leer los comentarios. Solo las
+# carga la sección de tendencias. En vivo se usa el almacén que mantienen
+# timeseries.py e ingest.py si es más reciente que la base; si no, los rollups
+# se calculan en memoria (el dashboard no escribe el almacén)
+@st.cache_resource(show_spinner=False)
+def cargar_series(version):
+    if ARTEFACTOS:
+        return artifacts.load_series(artifacts.load_manifest(version))
+    if timeseries.store_version() >= version:
+        return timeseries.load()
+    if storage.dataset_exists():
+        columnas = [c for c in timeseries.COLUMNAS if c in storage.dataset_columns()]
+        base = storage.read_dataset(columns=columnas) if 'fecha' in columnas else None
+    else:
+        base = utils.read_csv_auto(csv_path)
+    return timeseries.build(base) if base is not None else None
+
+
+# Búsqueda de comentarios similares sobre el índice de vecinos cercanos. Junto
+# al índice se guarda la fila de cada clave en la selección, así una consulta
+# no recorre las N claves
+@st.cache_resource(show_spinner=False)
+def cargar_indice(huella, _X, _claves):
+    if ARTEFACTOS:
+        indice = artifacts.load_ann_index(ARTEFACTOS)
+    else:
+        indice = ann_index.get_or_build(_X, _claves, models.EMBEDDING_MODEL)
+    return indice, {k: i for i, k in enumerate(_claves)}
+
+
+# Cálculos pesados en la cola de trabajos compartida: peticiones iguales de
+# varias sesiones comparten el cálculo y, mientras dura, la sección muestra su
+# estado en lugar de bloquear el script. Las funciones que se envían no usan
+# elementos de la interfaz (se ejecutan fuera del hilo de la sesión)
+COLA = jobs.get_queue()
+# Espera breve antes de mostrar el estado "calculando": los resultados que ya
+# están en caché llegan sin parpadeo
+ESPERA_TRABAJO = 0.3
+INTERVALO_SONDEO = 2
+# (clave, función, argumentos): la función solo se guarda si la cola rechazó el
+# envío y hay que reintentarlo
+TRABAJOS_PENDIENTES = []
+
+
+def en_segundo_plano(clave, funcion, *args, mensaje="Calculando"):
+    # Resultado del trabajo o None si sigue en curso
+    try:
+        trabajo = COLA.submit(clave, funcion, *args)
+    except jobs.JobQueueFull:
+        st.warning("El servidor está ocupado con otros cálculos; la sección se actualizará en unos segundos.")
+        TRABAJOS_PENDIENTES.append((clave, funcion, args))
+        return None
+    try:
+        return trabajo.result(timeout=ESPERA_TRABAJO)
+    except TimeoutError:
+        st.info(f"{mensaje} ({COLA.status(clave) or 'en cola'}); la sección se actualizará al terminar.", icon="⏳")
+        TRABAJOS_PENDIENTES.append((clave, None, ()))
+        return None
+
+
+def figura_en_segundo_plano(clave, render, mensaje="Dibujando la figura"):
+    # PNG de la caché de figuras; si falta se dibuja en la cola de trabajos
+    png = cache_figuras.get(clave)
+    if png is None:
+        png = en_segundo_plano(("figura", clave), cache_figuras.get_or_render, clave, render, mensaje=mensaje)
+    return png
+
+
+# Vuelve a ejecutar la página cuando terminan los trabajos que esperaba. Los
+# envíos rechazados por la cola llena se reintentan en cada sondeo; un estado
+# desconocido (p. ej. un resultado ya descartado por la cola) también recarga
+# la página, que vuelve a pedir el trabajo
+@st.fragment(run_every=INTERVALO_SONDEO)
+def sondear_trabajos(pendientes):
+    for i, (clave, funcion, args) in enumerate(pendientes):
+        if funcion is not None:
+            try:
+                COLA.submit(clave, funcion, *args)
+            except jobs.JobQueueFull:
+                continue
+            pendientes[i] = (clave, None, ())
+    if all(funcion is None and COLA.status(clave) in (None, "listo", "error")
+           for clave, funcion, _ in pendientes):
+        st.rerun()
+
 
 # Personalización de estilo CSS para tarjetas
 st.markdown(
@@ -55,521 +379,737 @@ st.markdown(
 # Título y descripción del dashboard
 st.title("Cartagena 360°: Análisis de Opiniones Turísticas")
 st.subheader('Dashboard de Sentimientos Turísticos en Cartagena de Indias')
-st.markdown("""
-El dashboard fue creado con el objetivo de analizar las opiniones de turistas 
-sobre la ciudad de Cartagena de Indias mediante técnicas de procesamiento de 
-lenguaje natural y análisis de sentimientos, con el propósito de identificar 
-patrones, percepciones y factores determinantes que contribuyan a mejorar la 
-experiencia del visitante y fortalecer la competitividad del sector turístico local.
-            """)
-
-# Métricas principales
-col1, col2, col3 = st.columns(3)
-col1.metric('Total de comentarios', len(df))
-col2.metric('Promedio longitud', f"{df['comentario'].str.len().mean():.1f}")
-col3.metric('Sentimientos únicos', len(df['sentimiento'].unique()))
-st.markdown('---')
-
-st.header("Fuente y descripción de los datos")
-st.markdown("""
-El conjunto de datos utilizado en este proyecto **fue elaborado de manera manual 
-por los integrantes del equipo**, a partir de la recopilación de información 
-proveniente de plataformas digitales de opinión turística como X.com, TripAdvisor 
-y Booking, entre otras.
-            """)
 
-# Comparación de bases de datos: viejas vs actualizadas
-st.subheader("Comparación de las bases de datos")
-col4, col5 = st.columns(2)
-
-with col4:
-    st.markdown("#### Base de Datos Actualizada")
-    buffer1 = io.StringIO()
-    df.iloc[:, :3].info(buf=buffer1)
-    st.text(buffer1.getvalue())
-
-with col5:
-    st.markdown("#### Base de Datos Original")
-    buffer2 = io.StringIO()
-    df_old.info(buf=buffer2)
-    st.text(buffer2.getvalue())
-
-# Limpieza y depuración de datos
-st.subheader("Procesamiento y depuración de los datos")
-st.markdown("""
-Dado que no todas las fuentes ofrecían de manera consistente la totalidad 
-de estas variables, se procedió a depurar el conjunto de datos conservando 
-únicamente las columnas más frecuentes y relevantes para el análisis
-            
-El proceso de limpieza incluyó:
-- Conversión de texto a minúsculas y eliminación de espacios innecesarios.
-- Eliminación de caracteres no válidos.
-- Estandarización de valores categóricos.
-- Eliminación de filas con valores nulos en las columnas principales
-- Eliminación de registros duplicados.
-
-> El nombre y el usuario son dos formas distintas de identificar la persona 
-que escribió el comentario registrado en la base de datos. Sin embargo, ninguno 
-de los dos está verdaderamente completo, por lo que se fusionaron los valores
-de las dos columnas, priorizando los valores de la columna usuario.
-            """)
 
-st.markdown("#### Vista previa de los primeros registros del DataFrame Viejo:")
-st.dataframe(df_old.head(10))
-
-st.markdown("#### Vista previa de los primeros registros del DataFrame Actualizado:")
-st.dataframe(df.iloc[:, :3].head(10))
-
-st.markdown("""
-**Código utilizado**    
-```
-    # Rellenar NAs en la columna usuario
-    df['usuario'] = df['usuario'].fillna(df['nombre'])
-            
-    df = df.drop('ciudad', axis=1)
-    df = df.drop('fecha', axis=1)
-    df = df.drop('plataforma', axis=1)
-    df = df.drop('nombre', axis=1)
-    
-    # Limpieza
-    columnas_texto = df.select_dtypes(include='object').columns
-    print(columnas_texto)
-
-    for col in columnas_texto:
-        df[col] = df[col].str.lower().str.strip()
-        df[col] = df[col].str.replace(r"[^a-z0-9áéíóúüñ ]", "", regex=True)
-    
-    # Corrección
-    df['pais'] = df['pais'].replace('estados unidos', "usa")
-    df['pais'] = df['pais'].replace('brazil', 'brasil')
-```
-* *Todos estos algoritmos fueron proporcionados en clase*
----
-            """)
+# ===== SECCIONES =====
+def seccion_resumen():
+    st.markdown("""
+    El dashboard fue creado con el objetivo de analizar las opiniones de turistas 
+    sobre la ciudad de Cartagena de Indias mediante técnicas de procesamiento de 
+    lenguaje natural y análisis de sentimientos, con el propósito de identificar 
+    patrones, percepciones y factores determinantes que contribuyan a mejorar la 
+    experiencia del visitante y fortalecer la competitividad del sector turístico local.
+                """)
 
-# Clasificación de comentarios
-st.header("Expansión de la base de datos")
-col6, col7 = st.columns(2)
+    # Métricas principales
+    col1, col2, col3 = st.columns(3)
+    col1.metric('Total de comentarios', len(df))
+    col2.metric('Promedio longitud', f"{df['comentario'].str.len().mean():.1f}")
+    col3.metric('Sentimientos únicos', len(df['sentimiento'].unique()))
+    st.markdown('---')
 
-with col6:
-    st.markdown("#### Clasificación de los comentarios por sentimiento")
+    st.header("Fuente y descripción de los datos")
     st.markdown("""
-    Se utilizó un pipeline de la librería Transformers con el modelo BETO, 
-    especializado en análisis de sentimiento para texto en español. Este modelo 
-    permite clasificar los comentarios según su polaridad emocional: positivo, 
-    negativo o neutral.
-        """)
-
-with col7:
-    st.markdown("#### Clasificación de los comentarios por contenido")
+    El conjunto de datos utilizado en este proyecto **fue elaborado de manera manual 
+    por los integrantes del equipo**, a partir de la recopilación de información 
+    proveniente de plataformas digitales de opinión turística como X.com, TripAdvisor 
+    y Booking, entre otras.
+                """)
+
+
+def seccion_limpieza():
+    df_old = cargar_datos_originales(version_datos)
+    if df_old is None:
+        st.error(f"No se encontró o no se pudo leer el archivo: {csv_path_old}")
+        return
+
+    # Comparación de bases de datos: viejas vs actualizadas
+    st.subheader("Comparación de las bases de datos")
+    col4, col5 = st.columns(2)
+
+    with col4:
+        st.markdown("#### Base de Datos Actualizada")
+        buffer1 = io.StringIO()
+        df.iloc[:, :3].info(buf=buffer1)
+        st.text(buffer1.getvalue())
+
+    with col5:
+        st.markdown("#### Base de Datos Original")
+        buffer2 = io.StringIO()
+        df_old.info(buf=buffer2)
+        st.text(buffer2.getvalue())
+
+    # Limpieza y depuración de datos
+    st.subheader("Procesamiento y depuración de los datos")
     st.markdown("""
-                Con el propósito de analizar las relaciones semánticas 
-                entre los comentarios y detectar posibles similitudes o 
-                diferencias en su contenido o tono, se utilizó un modelo 
-                de sentence embeddings.
-
-                Finalizando en la aplicación de un algoritmo de agrupamiento 
-                mediante DBSCAN, con el fin de identificar conjuntos de 
-                comentarios con alto grado de similitud en su contenido o tono 
-                emocional. Cada grupo resultante se asignó a una nueva 
-                columna denominada “cluster_dbscan”.
+    Dado que no todas las fuentes ofrecían de manera consistente la totalidad 
+    de estas variables, se procedió a depurar el conjunto de datos conservando 
+    únicamente las columnas más frecuentes y relevantes para el análisis
+
+    El proceso de limpieza incluyó:
+    - Conversión de texto a minúsculas y eliminación de espacios innecesarios.
+    - Eliminación de caracteres no válidos.
+    - Estandarización de valores categóricos.
+    - Eliminación de filas con valores nulos en las columnas principales
+    - Eliminación de registros duplicados.
+
+    > El nombre y el usuario son dos formas distintas de identificar la persona 
+    que escribió el comentario registrado en la base de datos. Sin embargo, ninguno 
+    de los dos está verdaderamente completo, por lo que se fusionaron los valores
+    de las dos columnas, priorizando los valores de la columna usuario.
                 """)
 
-st.markdown("""
-**Código utilizado**            
-```
-    # Agregar columna de sentimiento con BETO
-    sentiment = pipeline("sentiment-analysis", model="finiteautomata/beto-sentiment-analysis") 
-    df["sentimiento"] = df["comentario"].apply(lambda x: sentiment(x)[0]["label"])
-            
-    # Agrupamiento de comentarios por contenido
-    dbscan = DBSCAN(eps=0.4, min_samples=2, metric="cosine")
-    df["cluster_dbscan"] = dbscan.fit_predict(X_emb)
-```
-""")
-
-st.markdown("#### Vista previa de los primeros registros del DataFrame con sentimientos:")
-st.dataframe(df.head(10))
-st.markdown("---")
-
-# Vista previa de sentimientos
-st.header("Análisis exploratorio de los datos globales")
-st.subheader("Análisis de Sentimientos")
-
-# Análisis de sentimientos global
-conteo = df["sentimiento"].value_counts()
-total = len(df)
-
-col1, col2, col3 = st.columns(3)
-col1.metric("🟢 Positivos", conteo.get("pos", 0), f"{conteo.get('pos', 0)/total*100:.1f}%")
-col2.metric("🔴 Negativos", conteo.get("neg", 0), f"{conteo.get('neg', 0)/total*100:.1f}%")
-col3.metric("⚪ Neutros", conteo.get("neu", 0), f"{conteo.get('neu', 0)/total*100:.1f}%")
-
-# Gráfico de torta de proporción de sentimientos
-st.markdown("#### Proporción de Comentarios por Sentimiento")
-fig2, ax2 = plt.subplots(figsize=(5,5))
-ax2.pie(conteo, labels=conteo.index, autopct='%1.1f%%', colors=["#A8E6CF", "#FF8B94", "#DCD6F7"], startangle=90)
-st.pyplot(fig2)
-
-
-st.subheader("Frecuencia de las palabras")
+    st.markdown("#### Vista previa de los primeros registros del DataFrame Viejo:")
+    st.dataframe(df_old.head(10))
 
-# Generación de nubes de palabras por sentimiento
-def generar_wordcloud(sentimiento, color, sw):
-    # Seleccionar los comentarios según el sentimiento
-    texto = " ".join(df[df["sentimiento"] == sentimiento]["comentario"])
-    
-    # Solo generar si hay texto válido
-    if texto.strip():
-        wc = WordCloud(
-            width=1000,
-            height=600,
-            background_color="white",
-            colormap=color,
-            stopwords=sw,
-            collocations=False
-        ).generate(texto)
+    st.markdown("#### Vista previa de los primeros registros del DataFrame Actualizado:")
+    st.dataframe(df.iloc[:, :3].head(10))
 
-        # Mostrar la nube directamente en Streamlit
-        st.subheader(f"Nube de Palabras - Comentarios {sentimiento.capitalize()}")
-        st.image(
-            wc.to_array(),
-            use_container_width=True
-        )
+    st.markdown("""
+    **Código utilizado**    
+    ```
+        # Rellenar NAs en la columna usuario
+        df['usuario'] = df['usuario'].fillna(df['nombre'])
+
+        df = df.drop('nombre', axis=1)
+
+        # Fecha (día/mes/año) y plataforma tipadas para las series de tiempo
+        df['fecha'] = pd.to_datetime(df['fecha'], format='%d/%m/%Y', errors='coerce')
+        df['plataforma'] = df['plataforma'].str.strip().astype('category')
+
+        # Limpieza
+        columnas_texto = df.select_dtypes(include='object').columns
+        print(columnas_texto)
+
+        for col in columnas_texto:
+            df[col] = df[col].str.lower().str.strip()
+            df[col] = df[col].str.replace(r"[^a-z0-9áéíóúüñ ]", "", regex=True)
+
+        # Corrección
+        df['pais'] = df['pais'].replace('estados unidos', "usa")
+        df['pais'] = df['pais'].replace('brazil', 'brasil')
+    ```
+    * *Todos estos algoritmos fueron proporcionados en clase*
+    ---
+                """)
 
-for tipo, color in zip(["pos", "neg", "neu"], ["Greens", "Reds", "Blues"]):
-    generar_wordcloud(tipo, color, STOPWORDS)
-
-# Boxplot de longitud de comentarios
-st.subheader('Variación entre los comentarios')
-fig_len = px.box(df, x='sentimiento', y='longitud')
-st.plotly_chart(fig_len, use_container_width=True)
-
-# Embeddings y reducción dimensional para visualización
-st.subheader('Comparación entre los comentarios')
-modelo = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-X_emb = modelo.encode(df["comentario"], convert_to_tensor=False)
-tsne = TSNE(n_components=2, random_state=42, perplexity=30, max_iter=1000)
-X_2D = tsne.fit_transform(X_emb)
-
-df_2D = pd.DataFrame(X_2D, columns=["x", "y"])
-df_2D["sentimiento"] = df["sentimiento"]
-df_2D["pais"] = df["pais"]
-df_2D["cluster_dbscan"] = df["cluster_dbscan"]
-
-# Gráfico interactivo de clusters
-fig = px.scatter(
-    df_2D,
-    x="x",
-    y="y",
-    color="cluster_dbscan",
-    hover_data=["sentimiento", "pais"],
-    title="Visualización 2D de comentarios (DBSCAN + SentenceTransformer)",
-    color_continuous_scale="Viridis"
-)
 
-fig.update_traces(marker=dict(size=6, opacity=0.7))
-
-# Nubes de palabras por cluster
-st.plotly_chart(fig, use_container_width=True)
-
-col8, col9 = st.columns(2)
-for c, cluster in enumerate(sorted(df["cluster_dbscan"].unique())):
-    textos = df.loc[df["cluster_dbscan"] == cluster, "comentario"]
-    texto = " ".join(textos)
-    wc = WordCloud(
-        width=1000,
-        height=600,
-        background_color="white",
-        colormap="viridis",
-        stopwords=STOPWORDS,
-        collocations=False
-    ).generate(texto)
-
-    if (c + 1) % 2 == 0:
-        with col9:
-            st.markdown(f"### Nube de Palabras - Cluster {cluster}")
-            st.image(wc.to_array(), use_container_width=True)
-    else:
-        with col8:
-            st.markdown(f"### Nube de Palabras - Cluster {cluster}")
-            st.image(wc.to_array(), use_container_width=True)
-
-# Análisis por países: nacional vs exterior
-st.header("Análisis exploratorio de los datos por países")
-df_extended = df
-df_extended["origen"] = df_extended["pais"].apply(
-    lambda x: "Nacional" if str(x).strip().lower() == "colombia" else "Exterior"
-)
+def seccion_sentimiento():
+    cubo = cargar_cubo(SEL, version_datos)
+    huella = huella_datos(SEL, version_datos)
+    indice_terminos = cargar_indice_terminos(SEL, version_datos)
 
-# Calcular distribución de sentimientos por origen ---
-conteo_sent = (
-    df_extended.groupby(["origen", "sentimiento"])
-    .size()
-    .reset_index(name="cuenta")
-)
+    # Clasificación de comentarios
+    st.header("Expansión de la base de datos")
+    col6, col7 = st.columns(2)
 
+    with col6:
+        st.markdown("#### Clasificación de los comentarios por sentimiento")
+        st.markdown("""
+        Se utilizó un pipeline de la librería Transformers con el modelo BETO, 
+        especializado en análisis de sentimiento para texto en español. Este modelo 
+        permite clasificar los comentarios según su polaridad emocional: positivo, 
+        negativo o neutral.
+            """)
+
+    with col7:
+        st.markdown("#### Clasificación de los comentarios por contenido")
+        st.markdown("""
+                    Con el propósito de analizar las relaciones semánticas 
+                    entre los comentarios y detectar posibles similitudes o 
+                    diferencias en su contenido o tono, se utilizó un modelo 
+                    de sentence embeddings.
+
+                    Finalizando en la aplicación de un algoritmo de agrupamiento 
+                    mediante DBSCAN, con el fin de identificar conjuntos de 
+                    comentarios con alto grado de similitud en su contenido o tono 
+                    emocional. Cada grupo resultante se asignó a una nueva 
+                    columna denominada “cluster_dbscan”.
+                    """)
+
+    st.markdown("""
+    **Código utilizado**            
+    ```
+        # Agregar columna de sentimiento con BETO (label_sentiment.py): lotes
+        # ordenados por longitud y caché por hash del comentario
+        df = label_sentiment.label_dataframe(df, batch_size=32)
+
+        # Agrupamiento de comentarios por contenido (clustering.py): DBSCAN
+        # (eps=0.4 coseno, min_samples=2) sobre vectores normalizados con índice
+        # de vecinos; los comentarios nuevos se asignan a los grupos existentes
+        df["cluster_dbscan"] = clustering.cluster(X_emb, MODELO_EMBEDDINGS)
+
+        # Todo el proceso (limpieza, sentimiento, embeddings, clusters,
+        # proyección 2D, índices y agregados) se precalcula con:
+        #     python build_artifacts.py
+    ```
+    """)
+
+    st.markdown("#### Vista previa de los primeros registros del DataFrame con sentimientos:")
+    st.dataframe(df.head(10))
+    st.markdown("---")
+
+    # Vista previa de sentimientos
+    st.header("Análisis exploratorio de los datos globales")
+    st.subheader("Análisis de Sentimientos")
+
+    # Análisis de sentimientos global
+    conteo = (
+        aggregates.rollup(cubo, ["sentimiento"])
+        .set_index("sentimiento")["cuenta"]
+        .sort_values(ascending=False)
+    )
+    total = len(df)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("🟢 Positivos", conteo.get("pos", 0), f"{conteo.get('pos', 0)/total*100:.1f}%")
+    col2.metric("🔴 Negativos", conteo.get("neg", 0), f"{conteo.get('neg', 0)/total*100:.1f}%")
+    col3.metric("⚪ Neutros", conteo.get("neu", 0), f"{conteo.get('neu', 0)/total*100:.1f}%")
+
+    # Gráfico de torta de proporción de sentimientos
+    st.markdown("#### Proporción de Comentarios por Sentimiento")
+    png = cache_figuras.get_or_render(
+        figure_cache.make_key("pie", huella, "sentimiento", COLORES_PIE),
+        lambda: render_pie(conteo, conteo.index),
+    )
+    st.image(png)
+
+
+    st.subheader("Frecuencia de las palabras")
+
+    for tipo, color in zip(["pos", "neg", "neu"], ["Greens", "Reds", "Blues"]):
+        generar_wordcloud(tipo, color, STOPWORDS, indice_terminos, huella)
+
+    # Boxplot de longitud de comentarios
+    st.subheader('Variación entre los comentarios')
+    fig_len = px.box(df, x='sentimiento', y='longitud')
+    st.plotly_chart(fig_len)
+
+
+def seccion_clusters():
+    huella = huella_datos(SEL, version_datos)
+    indice_terminos = cargar_indice_terminos(SEL, version_datos)
+
+    # Embeddings y reducción dimensional para visualización
+    st.subheader('Comparación entre los comentarios')
+    df_2D = en_segundo_plano(("mapa_2d", SEL, version_datos), mapa_2d, SEL, version_datos,
+                             mensaje="Calculando embeddings y proyección 2D")
+    if df_2D is not None:
+        mostrar_mapa(df_2D)
+
+    # Nubes de palabras por cluster
+    col8, col9 = st.columns(2)
+    for c, cluster in enumerate(sorted(df["cluster_dbscan"].unique())):
+        with col9 if (c + 1) % 2 == 0 else col8:
+            png = figura_en_segundo_plano(
+                figure_cache.make_key("wordcloud", huella, "cluster_dbscan", cluster, "viridis", 1000, 600,
+                                      HUELLA_STOPWORDS),
+                lambda cluster=cluster: render_wordcloud(
+                    term_index.frequencies(indice_terminos, "cluster_dbscan", cluster, STOPWORDS), "viridis"
+                ),
+                mensaje=f"Dibujando la nube del cluster {cluster}",
+            )
+            if png:
+                st.markdown(f"### Nube de Palabras - Cluster {cluster}")
+                st.image(png, width="stretch")
+
+    # Búsqueda de comentarios similares sobre el índice de vecinos cercanos
+    st.subheader("Buscar comentarios similares")
+    # Los campos se muestran aunque el índice no esté listo, así la consulta se
+    # conserva mientras se calcula
+    col_busq, col_k = st.columns([4, 1])
+    consulta = col_busq.text_input(
+        "Busca un comentario del conjunto" if ARTEFACTOS else "Escribe un comentario o tema",
+        placeholder="ej. playa sucia y vendedores insistentes",
+    )
+    k_similares = col_k.number_input("Resultados", min_value=1, max_value=50, value=10)
+    embeddings = en_segundo_plano(("embeddings", SEL, version_datos), calcular_embeddings, SEL, version_datos,
+                                  mensaje="Calculando embeddings")
+    if embeddings is None:
+        return
+    X_emb, claves_emb, huella_emb = embeddings
+    indice = en_segundo_plano(("indice", huella_emb), cargar_indice, huella_emb, X_emb, claves_emb,
+                              mensaje="Construyendo índice de similitud")
+    if indice is not None:
+        mostrar_busqueda(consulta, k_similares, X_emb, *indice)
+
+
+def mostrar_mapa(df_2D):
+    vista = st.radio(
+        "Vista del mapa",
+        ["Muestra", "Densidad"],
+        horizontal=True,
+        help="Selecciona una región con el recuadro o el lazo para ver todos sus puntos.",
+    )
 
-conteo_sent["sentimiento"] = conteo_sent["sentimiento"].str.upper().str.strip()
-
-col4, col5 = st.columns(2)
-with col4:
-    st.markdown("#### Sentimientos - Nacional")
-    nacional = conteo_sent[conteo_sent["origen"] == "Nacional"]
-    if not nacional.empty:
-        fig1, ax1 = plt.subplots(figsize=(5, 5))
-        ax1.pie(
-            nacional["cuenta"],
-            labels=nacional["sentimiento"],
-            autopct="%1.1f%%",
-            startangle=90,
-            colors=["#A8E6CF", "#FF8B94", "#DCD6F7"],  # POS, NEU, NEG
+    # Gráfico interactivo de clusters (WebGL)
+    if vista == "Muestra":
+        muestra = muestra_mapa(SEL, version_datos)
+        fig = px.scatter(
+            df_2D.iloc[muestra],
+            x="x",
+            y="y",
+            color="cluster_dbscan",
+            custom_data=["fila"],
+            title="Visualización 2D de comentarios (DBSCAN + SentenceTransformer)",
+            color_continuous_scale="Viridis",
+            render_mode="webgl",
         )
-        ax1.axis("equal")
-        st.pyplot(fig1, use_container_width=True)
+        fig.update_traces(marker=dict(size=6, opacity=0.7), hovertemplate="Cluster %{marker.color}<extra></extra>")
+        leyenda = f"{len(muestra):,} de {len(df_2D):,} comentarios (muestra estratificada por cluster y sentimiento)"
     else:
-        st.info("No hay datos de origen Nacional.")
-with col5:
-    st.markdown("#### Sentimientos - Exterior")
-    exterior = conteo_sent[conteo_sent["origen"] == "Exterior"]
-    if not exterior.empty:
-        fig2, ax2 = plt.subplots(figsize=(5, 5))
-        ax2.pie(
-            exterior["cuenta"],
-            labels=exterior["sentimiento"],
-            autopct="%1.1f%%",
-            startangle=90,
-            colors=["#A8E6CF", "#FF8B94", "#DCD6F7"],
+        celdas = celdas_mapa(SEL, version_datos)
+        fig = px.scatter(
+            celdas,
+            x="x",
+            y="y",
+            color="cuenta",
+            hover_data={"cuenta": True, "etiqueta": True, "x": False, "y": False},
+            labels={"cuenta": "Comentarios", "etiqueta": "Cluster principal"},
+            title="Densidad de comentarios en el espacio 2D",
+            color_continuous_scale="Viridis",
+            render_mode="webgl",
         )
-        ax2.axis("equal")
-        st.pyplot(fig2, use_container_width=True)
-    else:
-        st.info("No hay datos de origen Exterior.")
-
-pais_sentimiento = df.groupby(["pais", "sentimiento"]).size().reset_index(name="cantidad")
-fig = px.bar(
-    pais_sentimiento,
-    x="pais",
-    y="cantidad",
-    color="sentimiento",
-    barmode="group",
-    title="Distribución de sentimientos por país",
-    color_discrete_map={"POS": "green", "NEU": "gray", "NEG": "red"},
-    labels={
-        "pais": "País",
-        "cantidad": "Cantidad de comentarios",
-        "sentimiento": "Sentimiento"
-    }
-)
+        fig.update_traces(marker=dict(symbol="square", size=8, opacity=0.9))
+        leyenda = f"{len(celdas):,} celdas con {len(df_2D):,} comentarios"
+
+    evento = st.plotly_chart(
+        fig,
+        on_select="rerun",
+        selection_mode=("box", "lasso"),
+        key=f"mapa_{vista}",
+    )
+    st.caption(leyenda)
+
+    # Región seleccionada: todos sus puntos y detalle de los que se marquen
+    caja = scatter_lod.selection_box(evento)
+    if caja:
+        filas_region, total_region = scatter_lod.points_in_region(df_2D["x"], df_2D["y"], *caja)
+        st.markdown(f"#### Región seleccionada ({total_region:,} comentarios)")
+        fig_region = px.scatter(
+            df_2D.iloc[filas_region],
+            x="x",
+            y="y",
+            color="cluster_dbscan",
+            custom_data=["fila"],
+            color_continuous_scale="Viridis",
+            render_mode="webgl",
+        )
+        fig_region.update_traces(marker=dict(size=6, opacity=0.8), hovertemplate="Cluster %{marker.color}<extra></extra>")
+        evento_region = st.plotly_chart(
+            fig_region,
+            on_select="rerun",
+            selection_mode=("box", "lasso", "points"),
+            key="mapa_region",
+        )
+        filas = scatter_lod.selected_rows(evento_region) or scatter_lod.selected_rows(evento)
+        if filas:
+            detalle = df.iloc[filas[:500]][["comentario", "sentimiento", "pais", "cluster_dbscan"]]
+            st.dataframe(detalle, width="stretch", hide_index=True)
+
+
+def mostrar_busqueda(consulta, k_similares, X_emb, indice, fila_por_clave):
+    # La consulta se limpia con las mismas reglas que los comentarios
+    texto_consulta = normalization.normalize_text(consulta)
+    vector_consulta = None
+    if texto_consulta and ARTEFACTOS:
+        # Sin modelos en el servidor: la consulta es un comentario del conjunto
+        # y se usa su vector precalculado
+        coincidencias = np.flatnonzero(
+            df["comentario"].str.contains(texto_consulta, regex=False, na=False).to_numpy()
+        )[:50]
+        if len(coincidencias) == 0:
+            st.info("Ningún comentario contiene ese texto.")
+        else:
+            referencia = st.selectbox(
+                "Comentario de referencia",
+                coincidencias,
+                format_func=lambda i: df["comentario"].iloc[i][:150],
+            )
+            vector_consulta = X_emb[[referencia]]
+    elif texto_consulta:
+        vector_consulta = cargar_modelo_embeddings().encode([texto_consulta], convert_to_numpy=True)
+
+    if vector_consulta is not None:
+        # El índice precalculado incluye todos los sentimientos: se piden más
+        # vecinos y se conservan los de la selección actual
+        k_busqueda = int(k_similares) * (5 if ARTEFACTOS else 1)
+        similitudes, claves_top = indice.search(vector_consulta, k=k_busqueda)
+        pares = [(fila_por_clave[k], s) for k, s in zip(claves_top[0], similitudes[0]) if k in fila_por_clave]
+        pares = pares[:int(k_similares)]
+        similares = df.iloc[[f for f, _ in pares]][["comentario", "sentimiento", "pais", "cluster_dbscan"]]
+        similares = similares.assign(similitud=[round(float(s), 3) for _, s in pares])
+        st.dataframe(similares, width="stretch", hide_index=True)
+
+
+ETIQUETAS_DIMENSION = {
+    "sentimiento": "Sentimiento",
+    "pais": "País",
+    "plataforma": "Plataforma",
+    "cluster_dbscan": "Cluster",
+}
+
+
+def seccion_tendencias():
+    st.header("Evolución de las opiniones en el tiempo")
+    series = cargar_series(version_datos)
+    inicio, fin = timeseries.date_range(series) if series is not None else (None, None)
+    if inicio is None:
+        st.info("La base actual no tiene fechas. Regenera db_final.csv con `python prep_db.py` "
+                "(conserva fecha, plataforma y ciudad) para ver las tendencias.")
+        return
+
+    col1, col2 = st.columns(2)
+    granularidad = col1.radio("Agrupación", timeseries.GRANULARIDADES, index=1, horizontal=True,
+                              format_func={"dia": "Diaria", "semana": "Semanal"}.get)
+    por = col2.selectbox("Desglose", timeseries.DIMENSIONES, format_func=ETIQUETAS_DIMENSION.get)
+    desde, hasta = st.slider("Rango de fechas", min_value=inicio.date(), max_value=fin.date(),
+                             value=(inicio.date(), fin.date()), format="DD/MM/YYYY")
+
+    # El filtro de sentimientos de la barra lateral también aplica aquí
+    with profiling.stage("series.query"):
+        serie = timeseries.query(series, granularidad, desde, hasta, por, {"sentimiento": SEL})
+    if serie.empty:
+        st.info("No hay comentarios en el rango de fechas elegido.")
+        return
+    serie[por] = serie[por].astype(str)
+
+    col3, col4 = st.columns(2)
+    col3.metric("Comentarios en el rango", int(serie["cuenta"].sum()))
+    col4.metric("Periodos con comentarios", serie["periodo"].nunique())
+
+    fig = px.line(
+        serie,
+        x="periodo",
+        y="cuenta",
+        color=por,
+        markers=True,
+        color_discrete_map=COLORES_SENTIMIENTO if por == "sentimiento" else None,
+        title=f"Comentarios por {ETIQUETAS_DIMENSION[por].lower()}",
+        labels={"periodo": "Fecha", "cuenta": "Cantidad de comentarios", por: ETIQUETAS_DIMENSION[por]},
+    )
+    st.plotly_chart(fig)
+    st.markdown('---')
+
+
+def seccion_paises():
+    cubo = cargar_cubo(SEL, version_datos)
+    huella = huella_datos(SEL, version_datos)
+
+    # Análisis por países: nacional vs exterior
+    st.header("Análisis exploratorio de los datos por países")
+
+    # Distribución de sentimientos por origen (Nacional / Exterior) desde el cubo;
+    # las etiquetas en mayúsculas son solo de presentación
+    conteo_sent = aggregates.rollup(cubo, ["origen", "sentimiento"])
+    conteo_sent["sentimiento"] = conteo_sent["sentimiento"].str.upper()
+
+    col4, col5 = st.columns(2)
+    with col4:
+        st.markdown("#### Sentimientos - Nacional")
+        nacional = conteo_sent[conteo_sent["origen"] == "Nacional"]
+        if not nacional.empty:
+            png = cache_figuras.get_or_render(
+                figure_cache.make_key("pie", huella, "origen", "Nacional", COLORES_PIE),
+                lambda: render_pie(nacional["cuenta"], nacional["sentimiento"], equal=True),
+            )
+            st.image(png, width="stretch")
+        else:
+            st.info("No hay datos de origen Nacional.")
+    with col5:
+        st.markdown("#### Sentimientos - Exterior")
+        exterior = conteo_sent[conteo_sent["origen"] == "Exterior"]
+        if not exterior.empty:
+            png = cache_figuras.get_or_render(
+                figure_cache.make_key("pie", huella, "origen", "Exterior", COLORES_PIE),
+                lambda: render_pie(exterior["cuenta"], exterior["sentimiento"], equal=True),
+            )
+            st.image(png, width="stretch")
+        else:
+            st.info("No hay datos de origen Exterior.")
+
+    pais_sentimiento = aggregates.rollup(cubo, ["pais", "sentimiento"], nombre="cantidad")
+    fig = px.bar(
+        pais_sentimiento,
+        x="pais",
+        y="cantidad",
+        color="sentimiento",
+        barmode="group",
+        title="Distribución de sentimientos por país",
+        color_discrete_map=COLORES_SENTIMIENTO,
+        labels={
+            "pais": "País",
+            "cantidad": "Cantidad de comentarios",
+            "sentimiento": "Sentimiento"
+        }
+    )
 
-fig.update_layout(
-    xaxis_tickangle=-45,
-    yaxis_title="Cantidad de comentarios",
-    xaxis_title="País"
-)
+    fig.update_layout(
+        xaxis_tickangle=-45,
+        yaxis_title="Cantidad de comentarios",
+        xaxis_title="País"
+    )
 
-st.plotly_chart(fig, use_container_width=True)  
+    st.plotly_chart(fig)  
 
 
-# Mapeo numérico de sentimientos y gráfico apilado por porcentaje
-sent_map = {"POS": 1, "NEU": 0, "NEG": -1}
-df["sentimiento"] = df["sentimiento"].str.upper().str.strip()
-df["sentimiento_valor"] = df["sentimiento"].map(sent_map)
-df_bar = (
-    df.groupby(["pais", "sentimiento"])
-      .size()
-      .reset_index(name="cuenta")
-)
-df_total = df_bar.groupby("pais")["cuenta"].transform("sum")
-df_bar["porcentaje"] = df_bar["cuenta"] / df_total * 100
-
-fig = px.bar(
-    df_bar,
-    x="pais",
-    y="porcentaje",
-    color="sentimiento",
-    color_discrete_map={"pos": "green", "neu": "gray", "neg": "red"},
-    title="Porcentaje de sentimientos por país",
-    text="porcentaje",
-    barmode="stack"
-)
+    # Gráfico apilado por porcentaje de sentimientos dentro de cada país
+    df_bar = aggregates.share(cubo, "pais", "sentimiento")
 
-fig.update_traces(
-    texttemplate="%{text:.1f}%",
-    textposition="inside"
-)
-fig.update_layout(
-    xaxis_tickangle=-45,
-    yaxis_title="Porcentaje (%)",
-    xaxis_title="País",
-    legend_title="Sentimiento",
-    uniformtext_minsize=8,
-    uniformtext_mode="hide"
-)
+    fig = px.bar(
+        df_bar,
+        x="pais",
+        y="porcentaje",
+        color="sentimiento",
+        color_discrete_map=COLORES_SENTIMIENTO,
+        title="Porcentaje de sentimientos por país",
+        text="porcentaje",
+        barmode="stack"
+    )
 
-st.plotly_chart(fig, use_container_width=True)
-
-st.markdown('---')
-
-# ===== FACTORES NEGATIVOS =====
-st.header('Factores en comentarios negativos')
-st.markdown('<h3 style="color:#1b2b4a; font-weight:700;">Factores sociales y estructurales que influyen en los comentarios negativos</h3>', unsafe_allow_html=True)
-st.markdown('<p style="color:#3f4b6b;">Análisis contextual de los temas más mencionados en comentarios con percepción negativa sobre la experiencia turística en Cartagena.</p>', unsafe_allow_html=True)
-
-factores = [
-    {
-        'titulo': '🔒 Seguridad y confianza ciudadana',
-        'descripcion': 'Los visitantes mencionan robos menores, estafas o sensación de inseguridad en zonas turísticas como el Centro Histórico y Bocagrande. La presencia irregular de control policial afecta la percepción general del visitante.',
-        'impacto': 'Alto',
-        'facilidad': 'Media'
-    },
-    {
-        'titulo': '💰 Precios y turismo excluyente',
-        'descripcion': 'Se perciben sobrecostos en comidas, transporte o actividades recreativas. La falta de regulación visible en precios genera desconfianza, especialmente entre turistas nacionales.',
-        'impacto': 'Alto',
-        'facilidad': 'Baja'
-    },
-    {
-        'titulo': '🚗 Infraestructura y movilidad urbana',
-        'descripcion': 'La congestión vehicular y el acceso limitado a zonas turísticas generan incomodidad. Se recomienda fortalecer transporte sostenible y señalización clara.',
-        'impacto': 'Medio',
-        'facilidad': 'Media'
-    },
-    {
-        'titulo': '🌿 Gestión ambiental y limpieza',
-        'descripcion': 'Durante la temporada alta se reporta acumulación de residuos en playas y calles. Se requieren campañas de cultura ambiental y mantenimiento urbano constante.',
-        'impacto': 'Medio',
-        'facilidad': 'Alta'
-    },
-    {
-        'titulo': '🤝 Calidad del servicio y atención al cliente',
-        'descripcion': 'Algunos comentarios reflejan deficiencias en atención al turista y trato desigual entre visitantes nacionales y extranjeros. Urge fortalecer la capacitación en hospitalidad.',
-        'impacto': 'Medio',
-        'facilidad': 'Alta'
-    }
-]
-
-for f in factores:
-    st.markdown(
-        f"""
-        <div class="card">
-            <h4 style="color:#1b2b4a; margin-bottom:4px;">{f['titulo']}</h4>
-            <p style="color:#3f4b6b; font-size:15px;">{f['descripcion']}</p>
-            <p style="font-size:13px; color:#5c6b88;"><b>Impacto:</b> {f['impacto']} &nbsp; | &nbsp; <b>Facilidad:</b> {f['facilidad']}</p>
-        </div>
-        """,
-        unsafe_allow_html=True
+    fig.update_traces(
+        texttemplate="%{text:.1f}%",
+        textposition="inside"
+    )
+    fig.update_layout(
+        xaxis_tickangle=-45,
+        yaxis_title="Porcentaje (%)",
+        xaxis_title="País",
+        legend_title="Sentimiento",
+        uniformtext_minsize=8,
+        uniformtext_mode="hide"
     )
 
-# ===== RECOMENDACIONES AMPLIADAS =====
-st.markdown("""
-    <style>
-    .rec-title {font-size: 32px; font-weight: 800; color: #1b2b4a; margin-bottom: 25px; text-align: center;}
-    .rec-card {background: rgba(255, 255, 255, 0.95); border-radius: 18px; box-shadow: 0 8px 20px rgba(40, 60, 100, 0.15); padding: 28px 32px; margin: 20px 0; transition: all 0.3s ease;}
-    .rec-card:hover {transform: translateY(-3px); box-shadow: 0 12px 28px rgba(30, 60, 120, 0.25);}
-    .rec-title-item {font-size: 22px; font-weight: 700; color: #264778; margin-bottom: 10px;}
-    .rec-desc {font-size: 17px; color: #34495e; line-height: 1.6; text-align: justify;}
-    </style>
-""", unsafe_allow_html=True)
-
-st.markdown('<div class="rec-title">Recomendaciones a futuro — Cartagena360</div>', unsafe_allow_html=True)
-
-recs = [
-    ('🛡️ Mejorar la seguridad integral en zonas turísticas',
-     'Fortalecer la seguridad ciudadana no solo desde la vigilancia policial, sino desde la percepción de confianza. Se recomienda la instalación de puntos seguros y cámaras visibles en zonas de alto flujo, la iluminación eficiente de calles y senderos, y campañas de convivencia ciudadana. La articulación entre autoridades locales y la comunidad es esencial para generar una experiencia turística positiva.'),
-    ('🌊 Fortalecer la limpieza y sostenibilidad ambiental de las playas',
-     'Implementar programas permanentes de limpieza y educación ambiental, con brigadas locales y señalización visible sobre el manejo de residuos. El turismo sostenible debe reflejarse en la práctica diaria: promover la economía circular, instalar puntos de reciclaje, y asociar la limpieza a campañas de orgullo local ("Cartagena limpia, Cartagena viva"). Esto mejora tanto la imagen internacional como el bienestar local.'),
-    ('🤝 Reforzar la atención turística y capacitación del personal',
-     'El trato humano y la calidad del servicio son el rostro de la ciudad. Se recomienda desarrollar programas cortos de capacitación para guías, vendedores y personal hotelero, centrados en empatía, comunicación intercultural y resolución pacífica de conflictos. Además, la creación de un “sello Cartagena360” de atención de calidad puede elevar el estándar de hospitalidad.'),
-    ('🚏 Ordenamiento y movilidad inteligente',
-     'Optimizar la movilidad turística mediante rutas definidas, transporte público confiable y reducción del caos vehicular en sectores históricos. Incorporar señalización inteligente en varios idiomas, transporte ecológico (bicicletas, buses eléctricos) y zonas peatonales seguras. Esto contribuye a un flujo armónico entre visitantes y residentes.'),
-    ('🎭 Promoción cultural y orgullo local',
-     'Rescatar y visibilizar la identidad cartagenera a través del arte, la música y la gastronomía local. Impulsar festivales barriales, murales y circuitos turísticos culturales que integren comunidades locales y turistas. Esto refuerza el sentido de pertenencia y diversifica la oferta más allá del turismo de lujo.')
-]
-
-for titulo, desc in recs:
-    st.markdown(f'''<div class="rec-card"><div class="rec-title-item">{titulo}</div><div class="rec-desc">{desc}</div></div>''', unsafe_allow_html=True)
-
-st.markdown('---')
-# ===== FESTIVAL DE PROYECTOS DE CIENCIA DE DATOS =====
-st.markdown('---')
-st.markdown("""
-    <style>
-    .festival-title {
-        font-size: 32px;
-        font-weight: 800;
-        color: #1b2b4a;
-        text-align: center;
-        margin-top: 30px;
-        margin-bottom: 10px;
-    }
-    .festival-sub {
-        text-align: center;
-        font-size: 18px;
-        color: #3f4b6b;
-        margin-bottom: 25px;
-    }
-    .festival-card {
-        background: rgba(255, 255, 255, 0.95);
-        border-left: 6px solid #2e5fa8;
-        border-radius: 16px;
-        box-shadow: 0 8px 20px rgba(40, 60, 100, 0.15);
-        padding: 22px 28px;
-        margin: 15px 0;
-        transition: all 0.3s ease;
-    }
-    .festival-card:hover {
-        transform: translateY(-3px);
-        box-shadow: 0 12px 28px rgba(30, 60, 120, 0.25);
-    }
-    .festival-item-title {
-        font-size: 20px;
-        font-weight: 700;
-        color: #264778;
-        margin-bottom: 6px;
-    }
-    .festival-item-desc {
-        font-size: 16px;
-        color: #3f4b6b;
-        margin: 0;
-    }
-    </style>
-""", unsafe_allow_html=True)
-
-st.markdown('<div class="festival-title">🎓 Festival de Proyectos de Ciencia de Datos</div>', unsafe_allow_html=True)
-st.markdown('<div class="festival-sub">20 de noviembre — Evaluación integral de proyectos con base en criterios de impacto, rigor, reproducibilidad y ética</div>', unsafe_allow_html=True)
-
-criterios = [
-    {
-        'titulo': '🌍 Impacto y relevancia (20%)',
-        'desc': 'Evalúa el grado en que el proyecto aborda un problema real con valor social o económico.',
-        'relacion': 'Cartagena360 responde a la necesidad de analizar percepciones ciudadanas y turísticas en Cartagena de Indias. Al identificar factores sociales, económicos y ambientales a partir de comentarios reales, el proyecto contribuye a la toma de decisiones en turismo sostenible y gobernanza local.'
-    },
-    {
-        'titulo': '📊 Rigor metodológico (25%)',
-        'desc': 'Considera la calidad de la preparación de datos, la elección y justificación de modelos y la validez de los resultados.',
-        'relacion': 'El dashboard aplica técnicas de procesamiento de lenguaje natural (tokenización, TF-IDF, n-gramas) y un enfoque interpretativo de regresión logística. Cada etapa del análisis está documentada y justificada en función de la exploración de sentimientos y temas críticos.'
-    },
-    {
-        'titulo': '🔁 Reproducibilidad (15%)',
-        'desc': 'Evalúa la disponibilidad del código, los datos y la facilidad para replicar los resultados.',
-        'relacion': 'El proyecto mantiene un flujo reproducible con código abierto en Python y dependencias estándar (Streamlit, scikit-learn, Plotly). Los datos se cargan automáticamente desde archivos CSV y el análisis puede repetirse en cualquier entorno local o en la nube.'
-    },
-    {
-        'titulo': '⚖️ Ética y gobernanza de datos (15%)',
-        'desc': 'Considera la protección de la privacidad, la gestión de sesgos y el cumplimiento de licencias y permisos de uso de datos.',
-        'relacion': 'Cartagena360 utiliza comentarios públicos anonimizados y promueve la interpretación responsable de datos sociales. Se evita el uso de información sensible y se mantiene la transparencia metodológica para reducir sesgos o interpretaciones erróneas.'
-    }
-]
-
-for c in criterios:
-    st.markdown(f"""
-        <div class="festival-card">
-            <div class="festival-item-title">{c['titulo']}</div>
-            <p class="festival-item-desc"><b>Criterio:</b> {c['desc']}</p>
-            <p class="festival-item-desc"><b>Relación con Cartagena360:</b> {c['relacion']}</p>
-        </div>
+    st.plotly_chart(fig)
+
+    st.markdown('---')
+
+
+def seccion_recomendaciones():
+    # ===== FACTORES NEGATIVOS =====
+    st.header('Factores en comentarios negativos')
+    st.markdown('<h3 style="color:#1b2b4a; font-weight:700;">Factores sociales y estructurales que influyen en los comentarios negativos</h3>', unsafe_allow_html=True)
+    st.markdown('<p style="color:#3f4b6b;">Análisis contextual de los temas más mencionados en comentarios con percepción negativa sobre la experiencia turística en Cartagena.</p>', unsafe_allow_html=True)
+
+    factores = [
+        {
+            'titulo': '🔒 Seguridad y confianza ciudadana',
+            'descripcion': 'Los visitantes mencionan robos menores, estafas o sensación de inseguridad en zonas turísticas como el Centro Histórico y Bocagrande. La presencia irregular de control policial afecta la percepción general del visitante.',
+            'impacto': 'Alto',
+            'facilidad': 'Media'
+        },
+        {
+            'titulo': '💰 Precios y turismo excluyente',
+            'descripcion': 'Se perciben sobrecostos en comidas, transporte o actividades recreativas. La falta de regulación visible en precios genera desconfianza, especialmente entre turistas nacionales.',
+            'impacto': 'Alto',
+            'facilidad': 'Baja'
+        },
+        {
+            'titulo': '🚗 Infraestructura y movilidad urbana',
+            'descripcion': 'La congestión vehicular y el acceso limitado a zonas turísticas generan incomodidad. Se recomienda fortalecer transporte sostenible y señalización clara.',
+            'impacto': 'Medio',
+            'facilidad': 'Media'
+        },
+        {
+            'titulo': '🌿 Gestión ambiental y limpieza',
+            'descripcion': 'Durante la temporada alta se reporta acumulación de residuos en playas y calles. Se requieren campañas de cultura ambiental y mantenimiento urbano constante.',
+            'impacto': 'Medio',
+            'facilidad': 'Alta'
+        },
+        {
+            'titulo': '🤝 Calidad del servicio y atención al cliente',
+            'descripcion': 'Algunos comentarios reflejan deficiencias en atención al turista y trato desigual entre visitantes nacionales y extranjeros. Urge fortalecer la capacitación en hospitalidad.',
+            'impacto': 'Medio',
+            'facilidad': 'Alta'
+        }
+    ]
+
+    for f in factores:
+        st.markdown(
+            f"""
+            <div class="card">
+                <h4 style="color:#1b2b4a; margin-bottom:4px;">{f['titulo']}</h4>
+                <p style="color:#3f4b6b; font-size:15px;">{f['descripcion']}</p>
+                <p style="font-size:13px; color:#5c6b88;"><b>Impacto:</b> {f['impacto']} &nbsp; | &nbsp; <b>Facilidad:</b> {f['facilidad']}</p>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+    # ===== RECOMENDACIONES AMPLIADAS =====
+    st.markdown("""
+        <style>
+        .rec-title {font-size: 32px; font-weight: 800; color: #1b2b4a; margin-bottom: 25px; text-align: center;}
+        .rec-card {background: rgba(255, 255, 255, 0.95); border-radius: 18px; box-shadow: 0 8px 20px rgba(40, 60, 100, 0.15); padding: 28px 32px; margin: 20px 0; transition: all 0.3s ease;}
+        .rec-card:hover {transform: translateY(-3px); box-shadow: 0 12px 28px rgba(30, 60, 120, 0.25);}
+        .rec-title-item {font-size: 22px; font-weight: 700; color: #264778; margin-bottom: 10px;}
+        .rec-desc {font-size: 17px; color: #34495e; line-height: 1.6; text-align: justify;}
+        </style>
+    """, unsafe_allow_html=True)
+
+    st.markdown('<div class="rec-title">Recomendaciones a futuro — Cartagena360</div>', unsafe_allow_html=True)
+
+    recs = [
+        ('🛡️ Mejorar la seguridad integral en zonas turísticas',
+         'Fortalecer la seguridad ciudadana no solo desde la vigilancia policial, sino desde la percepción de confianza. Se recomienda la instalación de puntos seguros y cámaras visibles en zonas de alto flujo, la iluminación eficiente de calles y senderos, y campañas de convivencia ciudadana. La articulación entre autoridades locales y la comunidad es esencial para generar una experiencia turística positiva.'),
+        ('🌊 Fortalecer la limpieza y sostenibilidad ambiental de las playas',
+         'Implementar programas permanentes de limpieza y educación ambiental, con brigadas locales y señalización visible sobre el manejo de residuos. El turismo sostenible debe reflejarse en la práctica diaria: promover la economía circular, instalar puntos de reciclaje, y asociar la limpieza a campañas de orgullo local ("Cartagena limpia, Cartagena viva"). Esto mejora tanto la imagen internacional como el bienestar local.'),
+        ('🤝 Reforzar la atención turística y capacitación del personal',
+         'El trato humano y la calidad del servicio son el rostro de la ciudad. Se recomienda desarrollar programas cortos de capacitación para guías, vendedores y personal hotelero, centrados en empatía, comunicación intercultural y resolución pacífica de conflictos. Además, la creación de un “sello Cartagena360” de atención de calidad puede elevar el estándar de hospitalidad.'),
+        ('🚏 Ordenamiento y movilidad inteligente',
+         'Optimizar la movilidad turística mediante rutas definidas, transporte público confiable y reducción del caos vehicular en sectores históricos. Incorporar señalización inteligente en varios idiomas, transporte ecológico (bicicletas, buses eléctricos) y zonas peatonales seguras. Esto contribuye a un flujo armónico entre visitantes y residentes.'),
+        ('🎭 Promoción cultural y orgullo local',
+         'Rescatar y visibilizar la identidad cartagenera a través del arte, la música y la gastronomía local. Impulsar festivales barriales, murales y circuitos turísticos culturales que integren comunidades locales y turistas. Esto refuerza el sentido de pertenencia y diversifica la oferta más allá del turismo de lujo.')
+    ]
+
+    for titulo, desc in recs:
+        st.markdown(f'''<div class="rec-card"><div class="rec-title-item">{titulo}</div><div class="rec-desc">{desc}</div></div>''', unsafe_allow_html=True)
+
+    st.markdown('---')
+    # ===== FESTIVAL DE PROYECTOS DE CIENCIA DE DATOS =====
+    st.markdown('---')
+    st.markdown("""
+        <style>
+        .festival-title {
+            font-size: 32px;
+            font-weight: 800;
+            color: #1b2b4a;
+            text-align: center;
+            margin-top: 30px;
+            margin-bottom: 10px;
+        }
+        .festival-sub {
+            text-align: center;
+            font-size: 18px;
+            color: #3f4b6b;
+            margin-bottom: 25px;
+        }
+        .festival-card {
+            background: rgba(255, 255, 255, 0.95);
+            border-left: 6px solid #2e5fa8;
+            border-radius: 16px;
+            box-shadow: 0 8px 20px rgba(40, 60, 100, 0.15);
+            padding: 22px 28px;
+            margin: 15px 0;
+            transition: all 0.3s ease;
+        }
+        .festival-card:hover {
+            transform: translateY(-3px);
+            box-shadow: 0 12px 28px rgba(30, 60, 120, 0.25);
+        }
+        .festival-item-title {
+            font-size: 20px;
+            font-weight: 700;
+            color: #264778;
+            margin-bottom: 6px;
+        }
+        .festival-item-desc {
+            font-size: 16px;
+            color: #3f4b6b;
+            margin: 0;
+        }
+        </style>
     """, unsafe_allow_html=True)
 
-st.caption('Festival de Proyectos de Ciencia de Datos — Evaluación y alineación de Cartagena360 con criterios académicos y éticos')
-st.caption('Dashboard Cartagena360💙')
\ No newline at end of file
+    st.markdown('<div class="festival-title">🎓 Festival de Proyectos de Ciencia de Datos</div>', unsafe_allow_html=True)
+    st.markdown('<div class="festival-sub">20 de noviembre — Evaluación integral de proyectos con base en criterios de impacto, rigor, reproducibilidad y ética</div>', unsafe_allow_html=True)
+
+    criterios = [
+        {
+            'titulo': '🌍 Impacto y relevancia (20%)',
+            'desc': 'Evalúa el grado en que el proyecto aborda un problema real con valor social o económico.',
+            'relacion': 'Cartagena360 responde a la necesidad de analizar percepciones ciudadanas y turísticas en Cartagena de Indias. Al identificar factores sociales, económicos y ambientales a partir de comentarios reales, el proyecto contribuye a la toma de decisiones en turismo sostenible y gobernanza local.'
+        },
+        {
+            'titulo': '📊 Rigor metodológico (25%)',
+            'desc': 'Considera la calidad de la preparación de datos, la elección y justificación de modelos y la validez de los resultados.',
+            'relacion': 'El dashboard aplica técnicas de procesamiento de lenguaje natural (tokenización, TF-IDF, n-gramas) y un enfoque interpretativo de regresión logística. Cada etapa del análisis está documentada y justificada en función de la exploración de sentimientos y temas críticos.'
+        },
+        {
+            'titulo': '🔁 Reproducibilidad (15%)',
+            'desc': 'Evalúa la disponibilidad del código, los datos y la facilidad para replicar los resultados.',
+            'relacion': 'El proyecto mantiene un flujo reproducible con código abierto en Python y dependencias estándar (Streamlit, scikit-learn, Plotly). Los datos se cargan automáticamente desde archivos CSV y el análisis puede repetirse en cualquier entorno local o en la nube.'
+        },
+        {
+            'titulo': '⚖️ Ética y gobernanza de datos (15%)',
+            'desc': 'Considera la protección de la privacidad, la gestión de sesgos y el cumplimiento de licencias y permisos de uso de datos.',
+            'relacion': 'Cartagena360 utiliza comentarios públicos anonimizados y promueve la interpretación responsable de datos sociales. Se evita el uso de información sensible y se mantiene la transparencia metodológica para reducir sesgos o interpretaciones erróneas.'
+        }
+    ]
+
+    for c in criterios:
+        st.markdown(f"""
+            <div class="festival-card">
+                <div class="festival-item-title">{c['titulo']}</div>
+                <p class="festival-item-desc"><b>Criterio:</b> {c['desc']}</p>
+                <p class="festival-item-desc"><b>Relación con Cartagena360:</b> {c['relacion']}</p>
+            </div>
+        """, unsafe_allow_html=True)
+
+    st.caption('Festival de Proyectos de Ciencia de Datos — Evaluación y alineación de Cartagena360 con criterios académicos y éticos')
+    st.caption('Dashboard Cartagena360💙')
+
+
+# Navegación por secciones: solo se ejecuta la sección abierta, así la
+# primera carga muestra el resumen sin esperar embeddings ni proyecciones
+pagina = st.navigation([
+    st.Page(seccion_resumen, title="Resumen", icon="📊", default=True),
+    st.Page(seccion_limpieza, title="Limpieza de datos", icon="🧹"),
+    st.Page(seccion_sentimiento, title="Sentimientos", icon="💬"),
+    st.Page(seccion_clusters, title="Clusters", icon="🧭"),
+    st.Page(seccion_tendencias, title="Tendencias", icon="📈"),
+    st.Page(seccion_paises, title="Países", icon="🌎"),
+    st.Page(seccion_recomendaciones, title="Recomendaciones", icon="💡"),
+])
+with profiling.stage(f"seccion.{pagina.title}"):
+    pagina.run()
+if TRABAJOS_PENDIENTES:
+    sondear_trabajos(TRABAJOS_PENDIENTES)
+
+# Estado de los modelos compartidos del servidor
+with st.sidebar.expander("Modelos cargados"):
+    stats = models.memory_stats()
+    if stats['rss_bytes'] is not None:
+        st.metric("Memoria del proceso", f"{stats['rss_bytes'] / 2**20:.0f} MB")
+    for nombre, info in stats['models'].items():
+        st.markdown(f"**{nombre}** — carga {info['load_seconds']:.1f} s ({info['backend']})")
+        if info['param_bytes'] is not None:
+            st.caption(f"Pesos: {info['param_bytes'] / 2**20:.0f} MB")
+
+# Memoria: datos compartidos por todas las sesiones y estado propio de esta.
+# Los compartidos se miden a pedido: medirlos en cada ejecución obligaría a
+# construir el cubo aunque la sección abierta no lo use
+with st.sidebar.expander("Memoria"):
+    if st.button("Medir datos compartidos"):
+        compartidos = {
+            "Comentarios": df,
+            "Cubo de conteos": cargar_cubo(SEL, version_datos),
+        }
+        for nombre, objeto in compartidos.items():
+            st.markdown(f"**{nombre}** — {profiling.object_bytes(objeto) / 2**20:.1f} MB (compartido)")
+    st.markdown(f"**Esta sesión** — {profiling.object_bytes(st.session_state.to_dict()) / 2**20:.2f} MB")
+    rss = profiling.rss_bytes()
+    if rss is not None:
+        st.caption(f"Proceso: {rss / 2**20:.0f} MB residentes")
+    ultima = next((r for r in reversed(profiling.records()) if r["stage"] == f"seccion.{pagina.title}"), None)
+    if ultima and ultima["rss_delta_bytes"] is not None:
+        st.caption(f"Esta ejecución de «{pagina.title}»: {ultima['rss_delta_bytes'] / 2**20:+.1f} MB residentes")
+
+# Tiempos por etapa del proceso del servidor (todas las sesiones)
+with st.sidebar.expander("Diagnóstico"):
+    resumen = profiling.summary()
+    if resumen:
+        tabla = pd.DataFrame(resumen)[["stage", "calls", "total_seconds", "p95_seconds", "rows", "peak_bytes"]]
+        tabla["peak_bytes"] = pd.to_numeric(tabla["peak_bytes"]) / 2**20
+        st.dataframe(
+            tabla.rename(columns={
+                "stage": "Etapa",
+                "calls": "Llamadas",
+                "total_seconds": "Total (s)",
+                "p95_seconds": "p95 (s)",
+                "rows": "Filas",
+                "peak_bytes": "Pico (MB)",
+            }),
+            hide_index=True,
+            width="stretch",
+        )
+        trabajos = COLA.stats()
+        st.caption(
+            f"Trabajos en segundo plano: {trabajos['running']} en curso, {trabajos['queued']} en cola, "
+            f"{trabajos['completed']} terminados, {trabajos['coalesced']} peticiones compartidas "
+            f"({trabajos['workers']} trabajadores × {trabajos['threads_per_job']} hilos)"
+        )
+        st.download_button("Exportar JSON", profiling.to_json(), "etapas.json", "application/json")
+        st.download_button("Exportar Prometheus", profiling.to_prometheus(), "etapas.prom", "text/plain")
+    else:
+        st.caption("Aún no se ha medido ninguna etapa.")
@@ -0,0 +1,179 @@
+# Agrupamiento de comentarios por contenido (columna `cluster_dbscan`).
+# - Los embeddings se normalizan (L2), así la distancia coseno equivale a la
+#   euclidiana: d_euc = sqrt(2 · d_cos). DBSCAN usa entonces un índice de
+#   vecinos (árbol) en lugar de la matriz completa de distancias coseno.
+# - Con corpus grandes DBSCAN se ajusta sobre una muestra; el resto, y los
+#   comentarios nuevos, se asignan al grupo de su punto núcleo más cercano.
+# - Los identificadores se mantienen entre ejecuciones emparejando los
+#   centroides nuevos con los guardados.
+import argparse
+import os
+import re
+
+import numpy as np
+
+import profiling
+import utils
+
+CLUSTERS_DIR = os.path.join(utils.CACHE_DIR, 'clusters')
+
+EPS_COSENO = 0.4
+MIN_SAMPLES = 2
+MAX_AJUSTE = 50_000
+# Similitud mínima entre centroides para conservar el identificador anterior
+MIN_SIMILITUD_ID = 0.8
+RUIDO = -1
+
+
+def _normalizar(X):
+    X = np.asarray(X, dtype=np.float32)
+    return X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+
+def _eps_euclidiano(eps_coseno):
+    return float(np.sqrt(2 * eps_coseno))
+
+
+def _centroides(X, etiquetas):
+    ids = np.array(sorted(set(etiquetas.tolist()) - {RUIDO}), dtype=np.int64)
+    if len(ids) == 0:
+        return ids, np.empty((0, X.shape[1]), dtype=np.float32)
+    return ids, _normalizar(np.vstack([X[etiquetas == i].mean(axis=0) for i in ids]))
+
+
+class ClusterModel:
+
+    def __init__(self, core_vectors, core_labels, ids, centroids, next_id, eps=EPS_COSENO):
+        self.core_vectors = core_vectors
+        self.core_labels = core_labels
+        self.ids = ids
+        self.centroids = centroids
+        self.next_id = int(next_id)
+        self.eps = eps
+        self._nn = None
+
+    @classmethod
+    def fit(cls, X, eps=EPS_COSENO, min_samples=MIN_SAMPLES, max_ajuste=MAX_AJUSTE,
+            previo=None, random_state=42):
+        from sklearn.cluster import DBSCAN
+
+        X = _normalizar(X)
+        rng = np.random.default_rng(random_state)
+        muestra = np.arange(len(X)) if len(X) <= max_ajuste else rng.choice(len(X), max_ajuste, replace=False)
+
+        dbscan = DBSCAN(eps=_eps_euclidiano(eps), min_samples=min_samples, algorithm='ball_tree')
+        with profiling.stage('clustering.fit', filas=len(muestra)):
+            etiquetas = dbscan.fit_predict(X[muestra])
+        core = dbscan.core_sample_indices_
+
+        ids, centroides = _centroides(X[muestra], etiquetas)
+        mapeo, next_id = _emparejar(ids, centroides, previo)
+        etiquetas = np.array([mapeo.get(e, RUIDO) for e in etiquetas.tolist()], dtype=np.int64)
+        ids = np.array([mapeo[i] for i in ids.tolist()], dtype=np.int64)
+
+        return cls(X[muestra][core], etiquetas[core], ids, centroides, next_id, eps)
+
+    def assign(self, X, batch_size=65_536):
+        # Cada punto toma el grupo de su punto núcleo más cercano si está a menos
+        # de eps; si no, queda como ruido (-1), igual que en DBSCAN
+        from sklearn.neighbors import NearestNeighbors
+
+        X = _normalizar(X)
+        etiquetas = np.full(len(X), RUIDO, dtype=np.int64)
+        if len(self.core_vectors) == 0:
+            return etiquetas
+        if self._nn is None:
+            self._nn = NearestNeighbors(n_neighbors=1, algorithm='ball_tree').fit(self.core_vectors)
+
+        eps = _eps_euclidiano(self.eps)
+        with profiling.stage('clustering.assign', filas=len(X)):
+            for inicio in range(0, len(X), batch_size):
+                dist, idx = self._nn.kneighbors(X[inicio:inicio + batch_size])
+                lote = self.core_labels[idx[:, 0]]
+                etiquetas[inicio:inicio + batch_size] = np.where(dist[:, 0] <= eps, lote, RUIDO)
+        return etiquetas
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(
+            tmp,
+            core_vectors=self.core_vectors,
+            core_labels=self.core_labels,
+            ids=self.ids,
+            centroids=self.centroids,
+            next_id=self.next_id,
+            eps=self.eps,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        datos = np.load(path)
+        return cls(datos['core_vectors'], datos['core_labels'], datos['ids'],
+                   datos['centroids'], int(datos['next_id']), float(datos['eps']))
+
+
+def _emparejar(ids, centroides, previo):
+    # Asigna a cada grupo nuevo el identificador del grupo anterior más parecido
+    # (emparejamiento óptimo); los grupos sin pareja reciben identificadores nuevos
+    if previo is None or len(previo.ids) == 0 or len(ids) == 0:
+        return {int(i): n for n, i in enumerate(ids.tolist())}, len(ids)
+
+    from scipy.optimize import linear_sum_assignment
+
+    similitud = centroides @ previo.centroids.T
+    filas, columnas = linear_sum_assignment(-similitud)
+    mapeo = {}
+    for f, c in zip(filas, columnas):
+        if similitud[f, c] >= MIN_SIMILITUD_ID:
+            mapeo[int(ids[f])] = int(previo.ids[c])
+
+    next_id = previo.next_id
+    for i in ids.tolist():
+        if i not in mapeo:
+            mapeo[i] = next_id
+            next_id += 1
+    return mapeo, next_id
+
+
+def model_path(model_name, cache_dir=CLUSTERS_DIR):
+    return os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name) + '.npz')
+
+
+def cluster(X, model_name, refit=False, cache_dir=CLUSTERS_DIR, **kwargs):
+    # Asigna grupos a X. Con un modelo guardado solo se asignan (incremental);
+    # con refit=True se vuelve a ajustar conservando los identificadores
+    path = model_path(model_name, cache_dir)
+    previo = ClusterModel.load(path) if os.path.exists(path) else None
+
+    if previo is None or refit:
+        modelo = ClusterModel.fit(X, previo=previo, **kwargs)
+        modelo.save(path)
+    else:
+        modelo = previo
+    return modelo.assign(X)
+
+
+def main():
+    import embedding_cache
+    import models
+
+    parser = argparse.ArgumentParser(description="Agrupa los comentarios por contenido")
+    parser.add_argument('--input', default='./databases/db_final.csv')
+    parser.add_argument('--output', default=None, help="Por defecto se sobrescribe el archivo de entrada")
+    parser.add_argument('--refit', action='store_true', help="Reajustar los grupos con todo el corpus")
+    args = parser.parse_args()
+
+    df = utils.read_csv_auto(args.input)
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {args.input}")
+
+    modelo = models.get_model(models.EMBEDDINGS)
+    X = embedding_cache.encode_cached(modelo, df['comentario'], models.EMBEDDING_MODEL)
+    df['cluster_dbscan'] = cluster(X, models.EMBEDDING_MODEL, refit=args.refit)
+    df.to_csv(args.output or args.input, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# Caché persistente de embeddings direccionada por contenido.
+# Cada vector se identifica por el hash del comentario normalizado más el nombre
+# del modelo, de modo que solo se codifican los comentarios nuevos o modificados.
+import os
+import re
+import threading
+
+import numpy as np
+
+import profiling
+import utils
+
+EMBEDDINGS_DIR = os.path.join(utils.CACHE_DIR, 'embeddings')
+
+
+class EmbeddingStore:
+    # Los vectores se guardan en un archivo float32 plano (leído con memmap) y el
+    # índice es un arreglo de claves cuyo orden coincide con las filas del archivo
+
+    def __init__(self, model_name, dim, cache_dir=EMBEDDINGS_DIR):
+        self.model_name = model_name
+        self.dim = int(dim)
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.dir = os.path.join(cache_dir, slug)
+        self.vectors_path = os.path.join(self.dir, 'vectors.f32')
+        self.index_path = os.path.join(self.dir, 'index.npy')
+        self.lock_path = os.path.join(self.dir, '.lock')
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            self._keys = np.load(self.index_path)
+        else:
+            self._keys = np.empty(0, dtype='S32')
+
+        # Si el proceso se interrumpió entre escribir vectores e índice, el archivo
+        # de vectores puede tener filas de más: solo se confía en las indexadas
+        filas = 0
+        if os.path.exists(self.vectors_path):
+            filas = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        if filas < len(self._keys):
+            self._keys = self._keys[:filas]
+
+        self._pos = {k: i for i, k in enumerate(self._keys.tolist())}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def key(self, texto):
+        return utils.comment_hash(texto, self.model_name).encode('ascii')
+
+    def missing(self, claves):
+        return [k for k in dict.fromkeys(claves) if k not in self._pos]
+
+    def vectors(self):
+        # Vista de solo lectura sobre todas las filas indexadas
+        n = len(self._keys)
+        if n == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(n, self.dim))
+
+    def add(self, claves, vectores):
+        vectores = np.ascontiguousarray(vectores, dtype=np.float32)
+        if vectores.shape != (len(claves), self.dim):
+            raise ValueError(
+                f"Se esperaban {len(claves)} vectores de dimensión {self.dim}, "
+                f"se recibió {vectores.shape}"
+            )
+
+        # Otro proceso (u otra instancia) pudo anexar filas desde la última
+        # lectura: el índice y el número de filas se releen bajo el bloqueo
+        # antes de truncar y anexar, así ninguna escritura pisa a otra
+        with self._lock, utils.file_lock(self.lock_path):
+            self._load_index()
+            nuevas = [(k, i) for i, k in enumerate(claves) if k not in self._pos]
+            if not nuevas:
+                return
+
+            # Truncar filas huérfanas de una escritura interrumpida antes de anexar
+            n = len(self._keys)
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(n * 4 * self.dim)
+                f.write(vectores[[i for _, i in nuevas]].tobytes())
+
+            keys = np.concatenate([self._keys, np.array([k for k, _ in nuevas], dtype='S32')])
+            tmp = self.index_path + '.tmp.npy'
+            np.save(tmp, keys)
+            os.replace(tmp, self.index_path)
+
+            for j, (k, _) in enumerate(nuevas):
+                self._pos[k] = n + j
+            self._keys = keys
+
+    def get(self, claves):
+        filas = np.fromiter((self._pos[k] for k in claves), dtype=np.int64, count=len(claves))
+        return np.asarray(self.vectors()[filas])
+
+
+def keys_for(textos, model_name):
+    # Claves de la caché para una lista de comentarios (las mismas que usa EmbeddingStore)
+    return [utils.comment_hash(t, model_name).encode('ascii') for t in textos]
+
+
+def encode_cached(modelo, textos, model_name, cache_dir=EMBEDDINGS_DIR, batch_size=64):
+    # Devuelve los embeddings de `textos` (n, dim) en float32 codificando solo
+    # los comentarios que aún no están en la caché
+    textos = list(textos)
+    store = EmbeddingStore(model_name, modelo.get_sentence_embedding_dimension(), cache_dir)
+    claves = keys_for(textos, model_name)
+
+    faltantes = set(store.missing(claves))
+    if faltantes:
+        por_codificar = {}
+        for k, t in zip(claves, textos):
+            if k in faltantes and k not in por_codificar:
+                por_codificar[k] = utils.normalize_comment(t)
+
+        with profiling.stage('embeddings.encode', filas=len(por_codificar)):
+            vectores = modelo.encode(
+                list(por_codificar.values()),
+                batch_size=batch_size,
+                convert_to_numpy=True,
+            )
+        store.add(list(por_codificar.keys()), vectores)
+
+    return store.get(claves)
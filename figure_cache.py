@@ -0,0 +1,189 @@
+# Caché de figuras renderizadas (nubes de palabras y gráficos de matplotlib).
+# Las imágenes PNG se guardan por una clave que combina la huella de los datos
+# con los parámetros de render. Hay dos niveles:
+# - memoria: LRU limitado por bytes, compartido por todas las sesiones del proceso;
+# - disco (opcional): compartido entre procesos del servidor.
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import utils
+
+FIGURES_DIR = os.path.join(utils.CACHE_DIR, 'figures')
+MAX_MEMORY_BYTES = int(os.environ.get('CARTAGENA_FIG_CACHE_MB', 128)) * 2**20
+MAX_DISK_BYTES = int(os.environ.get('CARTAGENA_FIG_DISK_MB', 1024)) * 2**20
+# Cada cuántas escrituras se vuelve a medir el disco aunque el total estimado
+# no pase del límite (otros procesos también escriben en el directorio)
+DISK_RESCAN_EVERY = 256
+# Al podar se baja hasta esta fracción del límite, para que con el disco lleno
+# no haga falta recorrer el directorio en cada escritura
+DISK_PRUNE_TARGET = 0.9
+
+
+def make_key(*partes):
+    # Clave estable a partir de cualquier combinación de valores serializables
+    datos = json.dumps(partes, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(datos.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def stopwords_fingerprint(stopwords):
+    return make_key(sorted(stopwords))
+
+
+class FigureCache:
+
+    def __init__(self, max_bytes=MAX_MEMORY_BYTES, disk_dir=None, max_disk_bytes=MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Bytes en disco estimados sin recorrer el directorio; None hasta la
+        # primera medición
+        self._disk_bytes = None
+        self._puts_sin_medir = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.png")
+
+    def _put_memory(self, key, datos):
+        if len(datos) > self.max_bytes:
+            return
+        if key in self._items:
+            self._bytes -= len(self._items.pop(key))
+        self._items[key] = datos
+        self._bytes += len(datos)
+        # Expulsar las figuras usadas hace más tiempo hasta volver al límite
+        while self._bytes > self.max_bytes:
+            _, viejo = self._items.popitem(last=False)
+            self._bytes -= len(viejo)
+
+    def get(self, key):
+        with self._lock:
+            datos = self._items.get(key)
+            if datos is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return datos
+
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    datos = f.read()
+            except OSError:
+                datos = None
+            if datos is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._put_memory(key, datos)
+                return datos
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, datos):
+        with self._lock:
+            self._put_memory(key, datos)
+        if self.disk_dir:
+            # Escritura atómica: otro proceso nunca lee un archivo a medias
+            ruta = self._disk_path(key)
+            try:
+                anterior = os.path.getsize(ruta)
+            except OSError:
+                anterior = 0
+            tmp = f"{ruta}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(datos)
+            os.replace(tmp, ruta)
+            with self._lock:
+                if self._disk_bytes is not None:
+                    self._disk_bytes += len(datos) - anterior
+                self._puts_sin_medir += 1
+                medir = (self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+                         or self._puts_sin_medir >= DISK_RESCAN_EVERY)
+                if medir:
+                    self._puts_sin_medir = 0
+            # Solo se lista el directorio cuando el total estimado pasa del
+            # límite o cada DISK_RESCAN_EVERY escrituras
+            if medir:
+                self._prune_disk()
+
+    def get_or_render(self, key, render):
+        # render() debe devolver los bytes PNG de la figura
+        datos = self.get(key)
+        if datos is None:
+            datos = render()
+            self.put(key, datos)
+        return datos
+
+    def _prune_disk(self):
+        archivos = []
+        for nombre in os.listdir(self.disk_dir):
+            if nombre.endswith('.png'):
+                ruta = os.path.join(self.disk_dir, nombre)
+                try:
+                    info = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                archivos.append((info.st_mtime, info.st_size, ruta))
+        total = sum(a[1] for a in archivos)
+        objetivo = self.max_disk_bytes * DISK_PRUNE_TARGET if total > self.max_disk_bytes else total
+        for _, tamano, ruta in sorted(archivos):
+            if total <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamano
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    # Caché única por proceso; CARTAGENA_FIG_CACHE_DIR="" desactiva el nivel de disco
+    global _default
+    with _default_lock:
+        if _default is None:
+            disk_dir = os.environ.get('CARTAGENA_FIG_CACHE_DIR', FIGURES_DIR) or None
+            _default = FigureCache(disk_dir=disk_dir)
+        return _default
+
+
+def wordcloud_png(wc):
+    buffer = io.BytesIO()
+    wc.to_image().save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def matplotlib_png(fig):
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
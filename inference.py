@@ -0,0 +1,358 @@
+# Backends de inferencia en CPU para los modelos de embeddings y sentimiento.
+#   torch      fp32 con sentence-transformers / pipeline (por defecto, models.py)
+#   int8       cuantización dinámica int8 de las capas lineales con torch
+#   onnx       grafo exportado a ONNX y optimizado por onnxruntime (opcional)
+#   onnx-int8  lo mismo con los pesos cuantizados a int8
+# Se elige con CARTAGENA_INFERENCE. Los backends de este módulo tokenizan una
+# sola vez, ordenan los textos por número de tokens y arman lotes con un
+# presupuesto de tokens: cada lote se rellena solo hasta su texto más largo.
+# CARTAGENA_INTRA_OP_THREADS fija los hilos intra-op (por defecto, los de torch).
+#
+#   python inference.py --parity --backend int8 --sample 500
+#   python inference.py --parity --backend onnx-int8 --output paridad.json
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+import utils
+
+BACKENDS = ['torch', 'int8', 'onnx', 'onnx-int8']
+ONNX_DIR = os.path.join(utils.CACHE_DIR, 'onnx')
+
+HILOS = int(os.environ['CARTAGENA_INTRA_OP_THREADS']) if os.environ.get('CARTAGENA_INTRA_OP_THREADS') else None
+# Tokens por lote (lote x longitud del texto más largo). La longitud máxima de
+# secuencia es la de cada modelo (ver _longitud_maxima)
+MAX_TOKENS_LOTE = 8192
+# Sin model_max_length en el tokenizer, transformers usa este valor centinela
+_SIN_LIMITE = int(1e20)
+
+
+def length_batches(longitudes, max_tokens=MAX_TOKENS_LOTE, max_batch=64):
+    # Índices agrupados por longitud creciente; un lote se cierra cuando al
+    # agregar el siguiente texto el relleno superaría el presupuesto de tokens
+    lote = []
+    for i in np.argsort(longitudes, kind='stable').tolist():
+        # En orden creciente el texto actual es el más largo del lote
+        largo = int(longitudes[i])
+        if lote and (len(lote) >= max_batch or (len(lote) + 1) * largo > max_tokens):
+            yield lote
+            lote = []
+        lote.append(i)
+    if lote:
+        yield lote
+
+
+def _configurar_hilos(hilos=HILOS):
+    import torch
+
+    if hilos:
+        torch.set_num_threads(hilos)
+    return torch.get_num_threads()
+
+
+class _TorchRunner:
+    # Ejecuta el modelo de transformers y devuelve su primera salida
+    # (estados ocultos o logits) como arreglo de numpy
+
+    def __init__(self, modelo):
+        self.model = modelo.eval()
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+
+        with torch.inference_mode():
+            salida = self.model(input_ids=torch.from_numpy(input_ids), attention_mask=torch.from_numpy(attention_mask))
+        return salida[0].float().numpy()
+
+
+class _OnnxRunner:
+
+    def __init__(self, ruta, hilos=HILOS):
+        import onnxruntime as ort
+
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if hilos:
+            opciones.intra_op_num_threads = hilos
+        self.model = None
+        self.session = ort.InferenceSession(ruta, opciones, providers=['CPUExecutionProvider'])
+
+    def __call__(self, input_ids, attention_mask):
+        return self.session.run(None, {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+
+
+class _Batcher:
+    # Tokenización única y lotes por longitud comunes a los dos modelos
+
+    def __init__(self, tokenizer, runner, max_length, max_tokens=MAX_TOKENS_LOTE):
+        self.tokenizer = tokenizer
+        self.runner = runner
+        self.max_length = max_length
+        self.max_tokens = max_tokens
+
+    @property
+    def model(self):
+        return self.runner.model
+
+    def _lotes(self, textos, batch_size):
+        codificados = self.tokenizer(list(textos), truncation=True, max_length=self.max_length)
+        ids = codificados['input_ids']
+        for lote in length_batches([len(x) for x in ids], self.max_tokens, batch_size):
+            # Relleno a la derecha hasta el texto más largo del lote
+            largo = max(len(ids[i]) for i in lote)
+            input_ids = np.full((len(lote), largo), self.tokenizer.pad_token_id, dtype=np.int64)
+            mascara = np.zeros((len(lote), largo), dtype=np.int64)
+            for j, i in enumerate(lote):
+                input_ids[j, :len(ids[i])] = ids[i]
+                mascara[j, :len(ids[i])] = 1
+            yield lote, input_ids, mascara
+
+
+class EmbeddingModel(_Batcher):
+    # Misma interfaz que SentenceTransformer (la que usa embedding_cache):
+    # estados ocultos del transformer con pooling de media sobre la máscara
+
+    def __init__(self, tokenizer, runner, dim, **kwargs):
+        super().__init__(tokenizer, runner, **kwargs)
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, textos, batch_size=64, convert_to_numpy=True, **kwargs):
+        if isinstance(textos, str):
+            return self.encode([textos], batch_size)[0]
+        resultado = np.empty((len(textos), self.dim), dtype=np.float32)
+        for lote, input_ids, mascara in self._lotes(textos, batch_size):
+            ocultos = self.runner(input_ids, mascara)
+            peso = mascara[:, :, None].astype(np.float32)
+            resultado[lote] = (ocultos * peso).sum(axis=1) / np.clip(peso.sum(axis=1), 1e-9, None)
+        return resultado
+
+
+class SentimentModel(_Batcher):
+    # Misma interfaz que el pipeline de transformers con top_k=None: por cada
+    # texto, la lista de {'label', 'score'} de todas las clases
+
+    def __init__(self, tokenizer, runner, id2label, **kwargs):
+        super().__init__(tokenizer, runner, **kwargs)
+        self.etiquetas = [id2label[i] for i in range(len(id2label))]
+
+    def __call__(self, textos, batch_size=32, top_k=None, truncation=True, **kwargs):
+        if isinstance(textos, str):
+            return self([textos], batch_size)[0]
+        resultado = [None] * len(textos)
+        for lote, input_ids, mascara in self._lotes(textos, batch_size):
+            logits = self.runner(input_ids, mascara)
+            probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            for i, p in zip(lote, probs.tolist()):
+                resultado[i] = sorted(
+                    ({'label': e, 'score': s} for e, s in zip(self.etiquetas, p)),
+                    key=lambda x: x['score'], reverse=True,
+                )
+        return resultado
+
+
+def _onnx_path(model_id, cuantizado):
+    slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_id)
+    return os.path.join(ONNX_DIR, slug, 'model.int8.onnx' if cuantizado else 'model.onnx')
+
+
+def _exportar_onnx(modelo, model_id, cuantizado, ejes_salida):
+    # Exporta una vez con ejes dinámicos (lote y secuencia) y reutiliza el archivo
+    import torch
+
+    ruta = _onnx_path(model_id, False)
+    if not os.path.exists(ruta):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+        class Salida(torch.nn.Module):
+            def __init__(self, interno):
+                super().__init__()
+                self.interno = interno
+
+            def forward(self, input_ids, attention_mask):
+                return self.interno(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+        ejemplo = torch.ones((2, 8), dtype=torch.long)
+        tmp = ruta + '.tmp'
+        torch.onnx.export(
+            Salida(modelo.eval()), (ejemplo, ejemplo), tmp,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['salida'],
+            dynamic_axes={'input_ids': {0: 'lote', 1: 'secuencia'},
+                          'attention_mask': {0: 'lote', 1: 'secuencia'},
+                          'salida': ejes_salida},
+            opset_version=17,
+            dynamo=False,
+        )
+        os.replace(tmp, ruta)
+
+    if not cuantizado:
+        return ruta
+    ruta_int8 = _onnx_path(model_id, True)
+    if not os.path.exists(ruta_int8):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp = ruta_int8 + '.tmp'
+        quantize_dynamic(ruta, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, ruta_int8)
+    return ruta_int8
+
+
+def _runner(modelo, model_id, backend, ejes_salida):
+    if backend == 'int8':
+        import torch
+
+        return _TorchRunner(torch.ao.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8))
+    if backend in ('onnx', 'onnx-int8'):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            raise ImportError(f"El backend {backend!r} requiere onnxruntime (pip install onnxruntime)") from None
+        return _OnnxRunner(_exportar_onnx(modelo, model_id, backend == 'onnx-int8', ejes_salida))
+    if backend == 'torch':
+        return _TorchRunner(modelo)
+    raise ValueError(f"Backend de inferencia desconocido: {backend!r}")
+
+
+def _longitud_maxima(tokenizer, config):
+    # La misma a la que trunca el pipeline fp32: model_max_length del
+    # tokenizer, o las posiciones del modelo si el tokenizer no la define
+    longitud = tokenizer.model_max_length
+    if not longitud or longitud >= _SIN_LIMITE:
+        longitud = config.max_position_embeddings
+    return int(longitud)
+
+
+def _longitud_sentence_transformers(model_id, tokenizer, config):
+    # sentence-transformers trunca a max_seq_length de sentence_bert_config.json
+    # (128 para MiniLM), que puede ser menor que la del tokenizer
+    try:
+        if os.path.isdir(model_id):
+            ruta = os.path.join(model_id, 'sentence_bert_config.json')
+        else:
+            from huggingface_hub import hf_hub_download
+
+            ruta = hf_hub_download(model_id, 'sentence_bert_config.json')
+        with open(ruta) as f:
+            longitud = json.load(f).get('max_seq_length')
+    except Exception:
+        longitud = None
+    return int(longitud) if longitud else _longitud_maxima(tokenizer, config)
+
+
+def load_embeddings(model_id, backend):
+    from transformers import AutoModel, AutoTokenizer
+
+    _configurar_hilos()
+    modelo = AutoModel.from_pretrained(model_id)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    # Salida: estados ocultos (lote, secuencia, dimensión)
+    runner = _runner(modelo, model_id, backend, {0: 'lote', 1: 'secuencia'})
+    return EmbeddingModel(tokenizer, runner, dim=modelo.config.hidden_size,
+                          max_length=_longitud_sentence_transformers(model_id, tokenizer, modelo.config))
+
+
+def load_sentiment(model_id, backend):
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    _configurar_hilos()
+    modelo = AutoModelForSequenceClassification.from_pretrained(model_id)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    # Salida: logits (lote, clases)
+    runner = _runner(modelo, model_id, backend, {0: 'lote'})
+    return SentimentModel(tokenizer, runner, id2label=modelo.config.id2label,
+                          max_length=_longitud_maxima(tokenizer, modelo.config))
+
+
+def _por_segundo(n, segundos, hilos):
+    return {'seconds': segundos, 'per_second': n / segundos, 'per_second_per_thread': n / segundos / hilos}
+
+
+def parity(textos, backend, batch_size=32):
+    # Compara el backend con la inferencia fp32 actual sobre los mismos textos:
+    # deriva coseno de los embeddings, acuerdo de etiquetas y rendimiento
+    import models
+
+    hilos = _configurar_hilos()
+    informe = {'backend': backend, 'rows': len(textos), 'threads': hilos}
+
+    vectores, tiempos = {}, {}
+    for nombre in ['torch', backend]:
+        modelo = models.load_model(models.EMBEDDINGS, nombre)
+        modelo.encode(textos[:8], batch_size=batch_size)
+        inicio = time.perf_counter()
+        vectores[nombre] = np.asarray(modelo.encode(textos, batch_size=batch_size, convert_to_numpy=True))
+        tiempos[nombre] = _por_segundo(len(textos), time.perf_counter() - inicio, hilos)
+        del modelo
+    a, b = vectores['torch'], vectores[backend]
+    coseno = (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+    deriva = 1.0 - coseno
+    informe['embeddings'] = {
+        'cosine_drift_mean': float(deriva.mean()),
+        'cosine_drift_p99': float(np.quantile(deriva, 0.99)),
+        'cosine_drift_max': float(deriva.max()),
+        'fp32': tiempos['torch'],
+        backend: tiempos[backend],
+        'speedup': tiempos['torch']['seconds'] / tiempos[backend]['seconds'],
+    }
+
+    salidas, tiempos, longitud = {}, {}, None
+    for nombre in [backend, 'torch']:
+        pipe = models.load_model(models.SENTIMIENTO, nombre)
+        # El pipeline de referencia trunca a la misma longitud que el backend:
+        # así la diferencia no incluye textos cortados en distinto punto
+        longitud = getattr(pipe, 'max_length', longitud)
+        pipe(textos[:8], batch_size=batch_size, top_k=None, truncation=True, max_length=longitud)
+        inicio = time.perf_counter()
+        resultado = pipe(textos, batch_size=batch_size, top_k=None, truncation=True, max_length=longitud)
+        tiempos[nombre] = _por_segundo(len(textos), time.perf_counter() - inicio, hilos)
+        salidas[nombre] = [{s['label'].lower(): s['score'] for s in r} for r in resultado]
+        del pipe
+    etiquetas = sorted(salidas['torch'][0])
+    p_ref = np.array([[r[e] for e in etiquetas] for r in salidas['torch']])
+    p_new = np.array([[r[e] for e in etiquetas] for r in salidas[backend]])
+    informe['sentiment'] = {
+        'label_agreement': float((p_ref.argmax(axis=1) == p_new.argmax(axis=1)).mean()),
+        'prob_abs_diff_mean': float(np.abs(p_ref - p_new).mean()),
+        'prob_abs_diff_max': float(np.abs(p_ref - p_new).max()),
+        'fp32': tiempos['torch'],
+        backend: tiempos[backend],
+        'speedup': tiempos['torch']['seconds'] / tiempos[backend]['seconds'],
+    }
+    return informe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backends de inferencia en CPU y comprobación de paridad con fp32")
+    parser.add_argument('--parity', action='store_true', help="Comparar un backend con la inferencia fp32")
+    parser.add_argument('--backend', default='int8', choices=BACKENDS[1:])
+    parser.add_argument('--input', default='./databases/db_final.csv')
+    parser.add_argument('--sample', type=int, default=500, help="Comentarios a comparar")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--output', default=None, help="Guardar el informe en JSON")
+    args = parser.parse_args()
+
+    if not args.parity:
+        parser.error("Indica --parity")
+    df = utils.read_csv_auto(args.input)
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {args.input}")
+    textos = df['comentario'].dropna().astype(str)
+    textos = textos.sample(min(args.sample, len(textos)), random_state=0).map(utils.normalize_comment).tolist()
+
+    informe = parity(textos, args.backend, args.batch_size)
+    print(json.dumps(informe, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
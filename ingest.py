@@ -0,0 +1,272 @@
+# Ingesta incremental de nuevas exportaciones de comentarios.
+# Se mantiene un índice de solo anexado con el hash de (usuario, comentario)
+# normalizados de cada registro ya incorporado a la base final. Cada
+# exportación nueva se compara contra ese índice y solo las filas que no están
+# pasan por limpieza, etiquetado de sentimiento, embeddings y asignación de
+# cluster; después se anexan a db_final.csv (y al conjunto Parquet, al índice
+# de términos y a las series de tiempo si existen).
+#
+#   python ingest.py --input ./databases/exportacion_2024-06-01.csv
+#   python ingest.py --input ./databases/exportacion_2024-06-01.csv --dry-run
+#   python ingest.py --rebuild-index
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+import clustering
+import embedding_cache
+import label_sentiment
+import models
+import normalization
+import prep_db
+import profiling
+import storage
+import term_index
+import timeseries
+import utils
+
+INDEX_DIR = os.path.join(utils.CACHE_DIR, 'ingesta')
+TAMANO_CLAVE = 16
+# El delta se funde con la base cuando pasa de esta fracción de ella (o de un
+# mínimo de claves): la fusión, O(N), se amortiza entre muchas ingestas
+DELTA_FRACCION = 0.05
+DELTA_MINIMO = 100_000
+
+
+def record_keys(usuario, comentario):
+    # Hash de (usuario, comentario) ya normalizados con las reglas de limpieza,
+    # así la misma fila da la misma clave en la exportación original y en la
+    # base limpia
+    usuario = normalization.normalize_series(usuario.astype(object), normalization.REGLAS_TEXTO).fillna('')
+    comentario = normalization.normalize_series(comentario.astype(object), normalization.REGLAS_TEXTO).fillna('')
+    claves = np.empty(len(usuario), dtype=f'S{TAMANO_CLAVE}')
+    for i, (u, c) in enumerate(zip(usuario.tolist(), comentario.tolist())):
+        h = hashlib.blake2b(digest_size=TAMANO_CLAVE)
+        h.update(str(u).encode('utf-8'))
+        h.update(b'\x00')
+        h.update(utils.normalize_comment(c).encode('utf-8'))
+        claves[i] = h.digest()
+    return claves
+
+
+class DedupIndex:
+    # Las claves viven en dos archivos binarios de registros de tamaño fijo:
+    # una base ordenada y sin repetidos, que se abre mapeada en memoria y se
+    # consulta con búsqueda binaria sin leerla entera, y un delta de solo
+    # anexado con las claves de las últimas ingestas. Una ejecución solo ordena
+    # el delta y las claves nuevas; el delta se funde con la base cuando crece
+    # más que una fracción de ella
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.dir = index_dir
+        self.path = os.path.join(index_dir, 'base.bin')
+        self.delta_path = os.path.join(index_dir, 'delta.bin')
+        os.makedirs(self.dir, exist_ok=True)
+        self._migrar()
+        self._load()
+
+    def _migrar(self):
+        # Formato anterior: un solo archivo de solo anexado sin ordenar
+        anterior = os.path.join(self.dir, 'claves.bin')
+        if os.path.exists(anterior) and not os.path.exists(self.path):
+            self._escribir_base(np.unique(_leer_claves(anterior)))
+            os.remove(anterior)
+
+    def _load(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= TAMANO_CLAVE:
+            n = os.path.getsize(self.path) // TAMANO_CLAVE
+            self._base = np.memmap(self.path, dtype=f'S{TAMANO_CLAVE}', mode='r', shape=(n,))
+        else:
+            self._base = np.empty(0, dtype=f'S{TAMANO_CLAVE}')
+        delta = _leer_claves(self.delta_path)
+        self._n_delta = len(delta)
+        self._delta = np.unique(delta)
+
+    def _escribir_base(self, ordenadas):
+        tmp = self.path + '.tmp'
+        ordenadas.tofile(tmp)
+        os.replace(tmp, self.path)
+
+    def exists(self):
+        return os.path.exists(self.path) or os.path.exists(self.delta_path)
+
+    def __len__(self):
+        return len(self._base) + len(self._delta)
+
+    def contains(self, claves):
+        encontradas = np.zeros(len(claves), dtype=bool)
+        for ordenadas in (self._base, self._delta):
+            if len(ordenadas) == 0:
+                continue
+            pos = np.searchsorted(ordenadas, claves)
+            pos[pos == len(ordenadas)] = 0
+            encontradas |= np.asarray(ordenadas[pos]) == claves
+        return encontradas
+
+    def add(self, claves):
+        nuevas = np.unique(claves[~self.contains(claves)])
+        if len(nuevas) == 0:
+            return 0
+        with open(self.delta_path, 'ab') as f:
+            # Un registro incompleto al final (escritura interrumpida) se descarta
+            f.truncate(self._n_delta * TAMANO_CLAVE)
+            f.write(nuevas.tobytes())
+        self._n_delta += len(nuevas)
+        self._delta = np.union1d(self._delta, nuevas)
+        if len(self._delta) > max(DELTA_MINIMO, DELTA_FRACCION * len(self._base)):
+            self.compact()
+        return len(nuevas)
+
+    def compact(self):
+        # Funde el delta con la base; si el proceso se interrumpe después de
+        # reemplazar la base, las claves del delta quedan repetidas y la
+        # próxima fusión las descarta
+        base = np.union1d(np.asarray(self._base), self._delta)
+        self._base = np.empty(0, dtype=f'S{TAMANO_CLAVE}')
+        self._escribir_base(base)
+        if os.path.exists(self.delta_path):
+            os.remove(self.delta_path)
+        self._load()
+
+    def rebuild(self, claves):
+        # Reemplaza el índice completo (p. ej. a partir de la base final)
+        self._base = np.empty(0, dtype=f'S{TAMANO_CLAVE}')
+        self._escribir_base(np.unique(claves))
+        if os.path.exists(self.delta_path):
+            os.remove(self.delta_path)
+        self._load()
+
+
+def _leer_claves(path):
+    if not os.path.exists(path):
+        return np.empty(0, dtype=f'S{TAMANO_CLAVE}')
+    n = os.path.getsize(path) // TAMANO_CLAVE
+    return np.fromfile(path, dtype=f'S{TAMANO_CLAVE}', count=n)
+
+
+def _columnas_salida(salida):
+    # Columnas de la base existente, para anexar en el mismo orden
+    if not os.path.exists(salida):
+        return None
+    info = utils.sniff_csv(salida)
+    return list(pd.read_csv(salida, sep=info['sep'], encoding=info['encoding'], nrows=0).columns)
+
+
+def rebuild_index(salida=prep_db.URL_OUTPUT, index_dir=INDEX_DIR):
+    df = utils.read_csv_auto(salida)
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {salida}")
+    indice = DedupIndex(index_dir)
+    with profiling.stage('ingest.index', filas=len(df)):
+        indice.rebuild(record_keys(df['usuario'], df['comentario']))
+    print(f"Índice reconstruido: {len(indice)} registros únicos de {len(df)} filas")
+    return indice
+
+
+def _procesar_nuevas(df):
+    # Limpieza, sentimiento, embeddings y cluster solo para las filas nuevas
+    if 'nombre' in df.columns:
+        prep_db.limpiar(df)
+    else:
+        normalization.normalize_frame(df, prep_db.REGLAS)
+        prep_db.set_types(df)
+    df = label_sentiment.label_dataframe(df)
+    df['longitud'] = df['comentario'].fillna('').astype(str).str.len()
+
+    # Los comentarios nuevos se asignan a los grupos del modelo guardado; ajustar
+    # un modelo solo con el lote diario daría grupos sin relación con la base
+    if not os.path.exists(clustering.model_path(models.EMBEDDING_MODEL)):
+        raise SystemExit("No hay un modelo de clusters guardado: ejecuta primero "
+                         "`python clustering.py` sobre la base completa")
+    modelo = models.get_model(models.EMBEDDINGS)
+    X = embedding_cache.encode_cached(modelo, df['comentario'], models.EMBEDDING_MODEL)
+    df['cluster_dbscan'] = clustering.cluster(X, models.EMBEDDING_MODEL)
+    return df
+
+
+def ingest(entrada, salida=prep_db.URL_OUTPUT, index_dir=INDEX_DIR, dry_run=False):
+    exportacion = utils.read_csv_auto(entrada)
+    if exportacion is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {entrada}")
+    # Las claves dependen del texto decodificado: con caracteres reemplazados
+    # las filas ya ingresadas no coincidirían y se anexarían como nuevas
+    csv = exportacion.attrs.get('csv', {})
+    if csv.get('encoding_errors'):
+        raise SystemExit(f"{entrada} no se pudo decodificar sin errores ({csv['encoding']}): "
+                         "conviértelo a UTF-8 antes de ingerirlo")
+    if csv.get('encoding') not in (None, 'utf-8', 'utf-8-sig'):
+        print(f"Aviso: {entrada} no es UTF-8; se leyó como {csv['encoding']}")
+
+    indice = DedupIndex(index_dir)
+    if not indice.exists() and os.path.exists(salida):
+        print("No hay índice de ingesta: se construye a partir de la base final")
+        indice = rebuild_index(salida, index_dir)
+
+    with profiling.stage('ingest.dedup', filas=len(exportacion)):
+        usuario = exportacion['usuario']
+        if 'nombre' in exportacion.columns:
+            usuario = usuario.fillna(exportacion['nombre'])
+        claves = record_keys(usuario, exportacion['comentario'])
+        conocidas = indice.contains(claves)
+        repetidas = pd.Series(claves).duplicated().to_numpy() & ~conocidas
+        nuevas = ~conocidas & ~repetidas
+
+    print(f"{len(exportacion)} filas en la exportación: {int(conocidas.sum())} ya ingresadas, "
+          f"{int(repetidas.sum())} repetidas en el archivo, {int(nuevas.sum())} nuevas")
+    if dry_run or not nuevas.any():
+        return int(nuevas.sum())
+
+    df = exportacion.loc[nuevas].reset_index(drop=True)
+    df = _procesar_nuevas(df)
+
+    columnas = _columnas_salida(salida)
+    procesadas = df
+    if columnas is not None:
+        df = df.reindex(columns=columnas)
+    with profiling.stage('ingest.write', filas=len(df)):
+        df.to_csv(salida, mode='a', header=columnas is None, index=False)
+        if storage.dataset_exists():
+            storage.write_dataset(df, mode='append')
+        # El índice de términos y las series de tiempo solo suman los conteos
+        # del lote nuevo
+        indice_terminos = term_index.load()
+        if indice_terminos is not None:
+            term_index.save(term_index.update(indice_terminos, procesadas))
+        series = timeseries.load()
+        if series is not None:
+            timeseries.save(timeseries.update(series, procesadas))
+    # El índice se actualiza después de escribir: si el proceso se interrumpe
+    # antes, la próxima ejecución vuelve a procesar el lote en lugar de perderlo
+    indice.add(claves[nuevas])
+    print(f"{len(df)} filas anexadas a {salida}")
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta incremental de nuevas exportaciones de comentarios")
+    parser.add_argument('--input', default=None, help="Exportación nueva (mismo formato que twitter_coms.csv)")
+    parser.add_argument('--output', default=prep_db.URL_OUTPUT)
+    parser.add_argument('--index-dir', default=INDEX_DIR)
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help="Reconstruir el índice de duplicados a partir de la base final")
+    parser.add_argument('--dry-run', action='store_true', help="Solo contar las filas nuevas")
+    parser.add_argument('--profile', default=None, metavar='RUTA',
+                        help="Guardar los tiempos por etapa (.json o .prom para Prometheus)")
+    args = parser.parse_args()
+
+    if args.rebuild_index:
+        rebuild_index(args.output, args.index_dir)
+    if args.input:
+        ingest(args.input, args.output, args.index_dir, args.dry_run)
+    elif not args.rebuild_index:
+        parser.error("Indica --input o --rebuild-index")
+
+    if args.profile:
+        profiling.export(args.profile)
+
+
+if __name__ == '__main__':
+    main()
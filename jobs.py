@@ -0,0 +1,180 @@
+# Cola de trabajos pesados en segundo plano compartida por todas las sesiones.
+# Los cálculos costosos (embeddings, proyección 2D, índice de vecinos, nubes de
+# palabras) se envían a un pool acotado de hilos en lugar de ejecutarse en el
+# hilo del script de cada sesión:
+# - Peticiones idénticas simultáneas (misma clave) comparten un solo cálculo.
+# - Cada trabajo corre con un presupuesto de hilos para torch/BLAS/OpenMP, así
+#   varios trabajos no se reparten de más los núcleos.
+# - La cola de pendientes tiene un tope; al superarlo se rechaza la petición.
+# Configuración: CARTAGENA_JOB_WORKERS (trabajos simultáneos),
+# CARTAGENA_JOB_THREADS (hilos por trabajo) y CARTAGENA_JOB_QUEUE (pendientes).
+# Si CARTAGENA_INTRA_OP_THREADS fija los hilos de torch (inference.py), la cola
+# no los cambia.
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+
+CPUS = os.cpu_count() or 1
+MAX_TRABAJADORES = int(os.environ.get('CARTAGENA_JOB_WORKERS', min(2, CPUS)))
+HILOS_POR_TRABAJO = int(os.environ.get('CARTAGENA_JOB_THREADS', max(1, CPUS // MAX_TRABAJADORES)))
+MAX_PENDIENTES = int(os.environ.get('CARTAGENA_JOB_QUEUE', 16))
+# Trabajos terminados que se conservan para las sesiones que aún no los leyeron
+MAX_TERMINADOS = 64
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+_hilos_lock = threading.Lock()
+_torch_configurado = False
+
+
+def _iniciar_trabajador(hilos):
+    # threadpoolctl limita BLAS y OpenMP. Los límites son del proceso, así que
+    # se fijan al iniciar cada trabajador y no se restauran: restaurarlos al
+    # terminar un trabajo los cambiaría bajo los que siguen corriendo
+    from threadpoolctl import threadpool_limits
+
+    threadpool_limits(limits=hilos)
+    _limitar_torch(hilos)
+    # Varios trabajos corren a la vez: el pico de memoria no sería de cada etapa
+    profiling.disable_memory()
+
+
+def _limitar_torch(hilos):
+    # torch tiene su propio pool intra-op y se importa tarde (al cargar un
+    # modelo): su límite se fija una sola vez, la primera vez que aparece
+    global _torch_configurado
+    if _torch_configurado or 'torch' not in sys.modules:
+        return
+    from threadpoolctl import threadpool_limits
+
+    with _hilos_lock:
+        if _torch_configurado:
+            return
+        # Las bibliotecas OpenMP que trae torch también quedan limitadas
+        threadpool_limits(limits=hilos)
+        if not os.environ.get('CARTAGENA_INTRA_OP_THREADS'):
+            sys.modules['torch'].set_num_threads(hilos)
+        _torch_configurado = True
+
+
+class JobQueue:
+
+    def __init__(self, max_workers=MAX_TRABAJADORES, threads_per_job=HILOS_POR_TRABAJO,
+                 max_pending=MAX_PENDIENTES):
+        self.max_workers = max_workers
+        self.threads_per_job = threads_per_job
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cartagena-job',
+                                        initializer=_iniciar_trabajador, initargs=(threads_per_job,))
+        # Reentrante: add_done_callback ejecuta la llamada en el acto si el
+        # trabajo ya terminó
+        self._lock = threading.RLock()
+        self._activos = {}
+        self._terminados = OrderedDict()
+        self._ejecutando = set()
+        self._stats = {'submitted': 0, 'coalesced': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def submit(self, clave, funcion, *args, **kwargs):
+        # Devuelve el Future del trabajo con esa clave: el que ya está en curso,
+        # el último terminado o uno nuevo. Un trabajo fallido se reintenta
+        with self._lock:
+            trabajo = self._activos.get(clave)
+            if trabajo is None and clave in self._terminados:
+                trabajo = self._terminados[clave]
+                if trabajo.exception() is None:
+                    self._terminados.move_to_end(clave)
+                else:
+                    del self._terminados[clave]
+                    trabajo = None
+            if trabajo is not None:
+                self._stats['coalesced'] += 1
+                return trabajo
+
+            if len(self._activos) >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise JobQueueFull(f"Hay {len(self._activos)} trabajos pendientes")
+            trabajo = self._pool.submit(self._ejecutar, clave, funcion, args, kwargs)
+            self._activos[clave] = trabajo
+            self._stats['submitted'] += 1
+            trabajo.add_done_callback(lambda t: self._terminar(clave, t))
+            return trabajo
+
+    def _ejecutar(self, clave, funcion, args, kwargs):
+        nombre = clave[0] if isinstance(clave, tuple) else clave
+        with self._lock:
+            self._ejecutando.add(clave)
+        try:
+            _limitar_torch(self.threads_per_job)
+            with profiling.stage(f"job.{nombre}"):
+                return funcion(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._ejecutando.discard(clave)
+
+    def _terminar(self, clave, trabajo):
+        with self._lock:
+            if self._activos.get(clave) is trabajo:
+                del self._activos[clave]
+            self._terminados[clave] = trabajo
+            while len(self._terminados) > MAX_TERMINADOS:
+                self._terminados.popitem(last=False)
+            self._stats['failed' if trabajo.exception() is not None else 'completed'] += 1
+
+    def status(self, clave):
+        # 'en cola', 'calculando', 'listo', 'error' o None si no se conoce
+        with self._lock:
+            if clave in self._ejecutando:
+                return 'calculando'
+            if clave in self._activos:
+                return 'en cola'
+            trabajo = self._terminados.get(clave)
+        if trabajo is None:
+            return None
+        return 'error' if trabajo.exception() is not None else 'listo'
+
+    def wait_idle(self, timeout=None):
+        # Espera a que no queden trabajos pendientes (scripts y pruebas)
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                pendientes = list(self._activos.values())
+            if not pendientes:
+                return True
+            restante = None if limite is None else limite - time.monotonic()
+            if restante is not None and restante <= 0:
+                return False
+            try:
+                pendientes[0].exception(timeout=restante)
+            except TimeoutError:
+                return False
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                running=len(self._ejecutando),
+                queued=len(self._activos) - len(self._ejecutando),
+                workers=self.max_workers,
+                threads_per_job=self.threads_per_job,
+            )
+
+
+_cola = None
+_cola_lock = threading.Lock()
+
+
+def get_queue():
+    # Cola única del proceso, compartida por todas las sesiones del servidor
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = JobQueue()
+        return _cola
@@ -0,0 +1,128 @@
+# Etapa de etiquetado de sentimiento con BETO.
+# Los comentarios se envían al modelo en lotes ordenados por longitud (menos
+# relleno por lote) y los resultados se guardan por hash del comentario, de modo
+# que una nueva ejecución solo clasifica los comentarios que no ha visto.
+import argparse
+import glob
+import os
+import time
+
+import pandas as pd
+
+import models
+import profiling
+import utils
+
+URL_DATA = './databases/db_final.csv'
+LABELS_DIR = os.path.join(utils.CACHE_DIR, 'sentimiento')
+
+ETIQUETAS = ['pos', 'neg', 'neu']
+SENT_MAP = {'pos': 1, 'neu': 0, 'neg': -1}
+COLUMNAS_CACHE = ['clave', 'sentimiento'] + [f'prob_{e}' for e in ETIQUETAS]
+
+
+def load_labels(labels_dir=LABELS_DIR):
+    partes = sorted(glob.glob(os.path.join(labels_dir, 'part-*.parquet')))
+    if not partes:
+        return pd.DataFrame(columns=COLUMNAS_CACHE)
+    cache = pd.concat([pd.read_parquet(p) for p in partes], ignore_index=True)
+    return cache.drop_duplicates('clave', keep='last')
+
+
+def _save_part(filas, labels_dir):
+    os.makedirs(labels_dir, exist_ok=True)
+    nombre = f"part-{time.time_ns()}.parquet"
+    pd.DataFrame(filas, columns=COLUMNAS_CACHE).to_parquet(
+        os.path.join(labels_dir, nombre), index=False
+    )
+
+
+def compact_labels(labels_dir=LABELS_DIR):
+    # Une todas las partes en una sola para que la próxima lectura sea rápida
+    partes = sorted(glob.glob(os.path.join(labels_dir, 'part-*.parquet')))
+    if len(partes) <= 1:
+        return
+    cache = load_labels(labels_dir)
+    _save_part(cache.to_dict('records'), labels_dir)
+    for p in partes:
+        os.remove(p)
+
+
+def _fila(clave, scores):
+    # scores: lista de {'label': 'POS', 'score': ...} con todas las clases
+    probs = {s['label'].lower(): float(s['score']) for s in scores}
+    etiqueta = max(probs, key=probs.get)
+    return [clave, etiqueta] + [probs.get(e, 0.0) for e in ETIQUETAS]
+
+
+def classify(textos, claves, pipe, batch_size=32, labels_dir=LABELS_DIR, flush_every=50):
+    # Ordenar por longitud para que cada lote tenga textos de tamaño parecido
+    orden = sorted(range(len(textos)), key=lambda i: len(textos[i]))
+    filas = []
+
+    with profiling.stage('sentiment.classify', filas=len(textos)):
+        for n, inicio in enumerate(range(0, len(orden), batch_size), start=1):
+            lote = orden[inicio:inicio + batch_size]
+            resultados = pipe(
+                [textos[i] for i in lote],
+                batch_size=len(lote),
+                top_k=None,
+                truncation=True,
+            )
+            filas.extend(_fila(claves[i], r) for i, r in zip(lote, resultados))
+
+            # Guardar el progreso periódicamente para no perderlo si se interrumpe
+            if n % flush_every == 0:
+                _save_part(filas, labels_dir)
+                filas = []
+
+    if filas:
+        _save_part(filas, labels_dir)
+
+
+def label_dataframe(df, batch_size=32, labels_dir=LABELS_DIR, pipe=None):
+    claves = [utils.comment_hash(t, models.SENTIMENT_MODEL) for t in df['comentario']]
+    cache = load_labels(labels_dir)
+    vistos = set(cache['clave'])
+
+    # Comentarios únicos que aún no tienen etiqueta
+    pendientes = {}
+    for clave, texto in zip(claves, df['comentario']):
+        if clave not in vistos and clave not in pendientes:
+            pendientes[clave] = utils.normalize_comment(texto)
+
+    if pendientes:
+        if pipe is None:
+            pipe = models.get_model(models.SENTIMIENTO)
+        classify(list(pendientes.values()), list(pendientes.keys()), pipe, batch_size, labels_dir)
+        compact_labels(labels_dir)
+        cache = load_labels(labels_dir)
+
+    etiquetas = cache.set_index('clave').reindex(claves)
+    for col in COLUMNAS_CACHE[1:]:
+        df[col] = etiquetas[col].to_numpy()
+    df['sentimiento_valor'] = df['sentimiento'].map(SENT_MAP)
+    # Conteos para quien llama (la CLI los muestra)
+    df.attrs['etiquetado'] = {'rows': len(df), 'classified': len(pendientes)}
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Etiqueta el sentimiento de los comentarios con BETO")
+    parser.add_argument('--input', default=URL_DATA)
+    parser.add_argument('--output', default=None, help="Por defecto se sobrescribe el archivo de entrada")
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    df = utils.read_csv_auto(args.input)
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {args.input}")
+
+    df = label_dataframe(df, batch_size=args.batch_size)
+    conteos = df.attrs['etiquetado']
+    print(f"{conteos['rows']} comentarios, {conteos['classified']} clasificados")
+    df.to_csv(args.output or args.input, index=False)
+
+
+if __name__ == '__main__':
+    main()
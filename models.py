@@ -0,0 +1,130 @@
+# Registro de modelos compartido por todo el proceso.
+# Cada modelo se carga de forma perezosa una sola vez y lo reutilizan todas las
+# sesiones y reruns del servidor; la carga está protegida con un lock por modelo.
+# CARTAGENA_INFERENCE elige el backend de inferencia (ver inference.py):
+# torch (fp32, por defecto), int8, onnx u onnx-int8.
+import os
+import threading
+import time
+
+import profiling
+
+EMBEDDINGS = 'embeddings'
+SENTIMIENTO = 'sentimiento'
+
+BACKEND = os.environ.get('CARTAGENA_INFERENCE', 'torch')
+
+EMBEDDING_MODEL_ID = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+SENTIMENT_MODEL_ID = 'finiteautomata/beto-sentiment-analysis'
+
+
+def _namespace(model_id, backend=BACKEND):
+    # Un backend cuantizado no da exactamente los mismos resultados que fp32:
+    # el sufijo separa sus cachés (embeddings, etiquetas, clusters, layout)
+    return model_id if backend == 'torch' else f"{model_id}@{backend}"
+
+
+# Nombres con los que se identifican los resultados de cada modelo en las cachés
+EMBEDDING_MODEL = _namespace(EMBEDDING_MODEL_ID)
+SENTIMENT_MODEL = _namespace(SENTIMENT_MODEL_ID)
+
+
+def _load_embeddings(backend=BACKEND):
+    if backend != 'torch':
+        import inference
+        return inference.load_embeddings(EMBEDDING_MODEL_ID, backend)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_ID)
+
+
+def _load_sentiment(backend=BACKEND):
+    if backend != 'torch':
+        import inference
+        return inference.load_sentiment(SENTIMENT_MODEL_ID, backend)
+    from transformers import pipeline
+    return pipeline("sentiment-analysis", model=SENTIMENT_MODEL_ID)
+
+
+_LOADERS = {
+    EMBEDDINGS: _load_embeddings,
+    SENTIMIENTO: _load_sentiment,
+}
+
+_registry_lock = threading.Lock()
+_locks = {}
+_models = {}
+_stats = {}
+
+
+def _lock_for(nombre):
+    with _registry_lock:
+        return _locks.setdefault(nombre, threading.Lock())
+
+
+def _param_bytes(modelo):
+    # Peso de los parámetros del modelo torch subyacente
+    modulo = getattr(modelo, 'model', modelo)
+    try:
+        return sum(p.numel() * p.element_size() for p in modulo.parameters())
+    except AttributeError:
+        return None
+
+
+def get_model(nombre):
+    if nombre not in _LOADERS:
+        raise KeyError(f"Modelo desconocido: {nombre!r}")
+
+    modelo = _models.get(nombre)
+    if modelo is not None:
+        return modelo
+
+    # Doble comprobación: solo un hilo carga el modelo, el resto espera y lo reutiliza
+    with _lock_for(nombre):
+        modelo = _models.get(nombre)
+        if modelo is None:
+            rss_antes = profiling.rss_bytes()
+            inicio = time.perf_counter()
+            modelo = _LOADERS[nombre]()
+            rss_despues = profiling.rss_bytes()
+            _stats[nombre] = {
+                'backend': BACKEND,
+                'load_seconds': time.perf_counter() - inicio,
+                'param_bytes': _param_bytes(modelo),
+                'rss_delta_bytes': (
+                    rss_despues - rss_antes
+                    if rss_antes is not None and rss_despues is not None else None
+                ),
+            }
+            _models[nombre] = modelo
+    return modelo
+
+
+def load_model(nombre, backend=BACKEND):
+    # Instancia nueva fuera del registro (p. ej. para comparar backends)
+    if nombre not in _LOADERS:
+        raise KeyError(f"Modelo desconocido: {nombre!r}")
+    return _LOADERS[nombre](backend)
+
+
+def is_loaded(nombre):
+    return nombre in _models
+
+
+def warm_up(nombres=None):
+    # Carga los modelos y ejecuta una inferencia mínima para inicializar
+    # tokenizadores y kernels antes de la primera petición real
+    for nombre in nombres or list(_LOADERS):
+        modelo = get_model(nombre)
+        inicio = time.perf_counter()
+        if nombre == EMBEDDINGS:
+            modelo.encode(["calentamiento"], convert_to_numpy=True)
+        else:
+            modelo("calentamiento")
+        _stats[nombre]['warmup_seconds'] = time.perf_counter() - inicio
+
+
+def memory_stats():
+    return {
+        'rss_bytes': profiling.rss_bytes(),
+        'models': {nombre: dict(_stats[nombre]) for nombre in _models},
+    }
@@ -0,0 +1,130 @@
+# Motor de normalización de texto basado en reglas declaradas.
+# Las mismas reglas sirven para la limpieza por lotes (prep_db.py) y para el
+# texto ad hoc del dashboard, de modo que la lógica no se duplica.
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class CleaningRules:
+    lowercase: bool = True
+    strip: bool = True
+    # Contenido de la clase de caracteres permitidos; None desactiva el filtro
+    allowed_chars: str = "a-z0-9áéíóúüñ "
+    # Reemplazos de valores completos aplicados después de limpiar
+    aliases: dict = field(default_factory=dict)
+
+    @property
+    def disallowed_pattern(self):
+        return f"[^{self.allowed_chars}]" if self.allowed_chars is not None else None
+
+
+REGLAS_TEXTO = CleaningRules()
+REGLAS_PAIS = CleaningRules(aliases={'estados unidos': 'usa', 'brazil': 'brasil'})
+
+# A partir de este tamaño se reparte el trabajo entre procesos
+MIN_FILAS_POR_PROCESO = 200_000
+
+_patrones = {}
+
+
+def _patron(reglas):
+    patron = reglas.disallowed_pattern
+    if patron not in _patrones:
+        _patrones[patron] = re.compile(patron)
+    return _patrones[patron]
+
+
+def normalize_text(texto, reglas=REGLAS_TEXTO):
+    # Versión escalar para texto suelto (consultas, filtros del dashboard)
+    if texto is None or (isinstance(texto, float) and np.isnan(texto)):
+        return texto
+    texto = str(texto)
+    if reglas.lowercase:
+        texto = texto.lower()
+    if reglas.strip:
+        texto = texto.strip()
+    if reglas.allowed_chars is not None:
+        texto = _patron(reglas).sub("", texto)
+    return reglas.aliases.get(texto, texto)
+
+
+def _aplicar_alias(serie, reglas):
+    for alias, valor in reglas.aliases.items():
+        serie = serie.replace(alias, valor)
+    return serie
+
+
+def _normalize_pandas(serie, reglas):
+    if reglas.lowercase:
+        serie = serie.str.lower()
+    if reglas.strip:
+        serie = serie.str.strip()
+    if reglas.allowed_chars is not None:
+        serie = serie.str.replace(reglas.disallowed_pattern, "", regex=True)
+    return _aplicar_alias(serie, reglas)
+
+
+def _normalize_arrow(serie, reglas):
+    # Kernels de cadenas de Arrow: se ejecutan en C++ sobre buffers contiguos
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    arr = pa.array(serie, type=pa.string(), from_pandas=True)
+    if reglas.lowercase:
+        arr = pc.utf8_lower(arr)
+    if reglas.strip:
+        arr = pc.utf8_trim_whitespace(arr)
+    if reglas.allowed_chars is not None:
+        arr = pc.replace_substring_regex(arr, pattern=reglas.disallowed_pattern, replacement="")
+    resultado = pd.Series(arr.to_numpy(zero_copy_only=False), index=serie.index, name=serie.name)
+    resultado = resultado.where(resultado.notna(), np.nan)
+    return _aplicar_alias(resultado, reglas)
+
+
+def _normalize_processes(serie, reglas, n_jobs):
+    n_jobs = n_jobs or os.cpu_count() or 1
+    partes = np.array_split(np.arange(len(serie)), n_jobs)
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        resultados = pool.map(
+            _normalize_pandas,
+            [serie.iloc[p] for p in partes if len(p)],
+            [reglas] * n_jobs,
+        )
+        return pd.concat(list(resultados))
+
+
+def normalize_series(serie, reglas=REGLAS_TEXTO, engine='auto', n_jobs=None):
+    # engine: 'pandas' (un núcleo), 'arrow' (kernels de Arrow), 'processes'
+    # (pool de procesos) o 'auto' (Arrow si está disponible)
+    if engine == 'auto':
+        try:
+            import pyarrow  # noqa: F401
+            engine = 'arrow'
+        except ImportError:
+            engine = 'processes' if len(serie) >= MIN_FILAS_POR_PROCESO else 'pandas'
+
+    if engine == 'arrow':
+        try:
+            return _normalize_arrow(serie, reglas)
+        except (TypeError, ValueError, ImportError):
+            # Columnas con valores que no son texto: se recurre a pandas
+            return _normalize_pandas(serie, reglas)
+    if engine == 'processes':
+        return _normalize_processes(serie, reglas, n_jobs)
+    if engine == 'pandas':
+        return _normalize_pandas(serie, reglas)
+    raise ValueError(f"Motor de normalización desconocido: {engine!r}")
+
+
+def normalize_frame(df, reglas_por_columna, engine='auto', n_jobs=None):
+    # Aplica en el sitio las reglas declaradas solo a las columnas indicadas
+    for col, reglas in reglas_por_columna.items():
+        if col in df.columns:
+            df[col] = normalize_series(df[col], reglas, engine, n_jobs)
+    return df
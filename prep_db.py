@@ -1,33 +1,129 @@
+import argparse
+import os
+
+import pandas as pd
+
+import normalization
+import profiling
+import timeseries
+import utils
 from utils import read_csv_auto
 
 URL_DATA = './databases/twitter_coms.csv'
+URL_OUTPUT = './databases/db_final.csv'
+
+# Columnas que no se conservan en la base final (el nombre se fusiona con el
+# usuario); fecha, plataforma y ciudad se conservan con tipo para las series
+# de tiempo
+COLUMNAS_ELIMINADAS = ['nombre']
+
+# Reglas de limpieza declaradas por columna: solo se procesan estas columnas
+# (minúsculas, espacios, caracteres especiales y alias de países)
+REGLAS = {
+    'usuario': normalization.REGLAS_TEXTO,
+    'comentario': normalization.REGLAS_TEXTO,
+    'pais': normalization.REGLAS_PAIS,
+    'ciudad': normalization.REGLAS_TEXTO,
+}
+
+
+def limpiar(df, engine='auto', n_jobs=None):
+    # Limpia el DataFrame en el sitio, sin copias intermedias
+
+    with profiling.stage('prep_db.fill_usuario', filas=len(df)):
+        # Rellenar valores faltantes en 'usuario' usando 'nombre'
+        df['usuario'] = df['usuario'].fillna(df['nombre'])
+
+        # Eliminar columnas innecesarias
+        df.drop(columns=COLUMNAS_ELIMINADAS, inplace=True)
+
+    with profiling.stage('prep_db.normalize', filas=len(df)):
+        normalization.normalize_frame(df, REGLAS, engine=engine, n_jobs=n_jobs)
+
+    with profiling.stage('prep_db.types', filas=len(df)):
+        return set_types(df)
+
+
+def set_types(df):
+    # Fecha como fecha (día/mes/año en la exportación, ISO en la base final) y
+    # plataforma como categoría, sin alterar sus valores
+    if 'fecha' in df.columns:
+        df['fecha'] = timeseries.parse_dates(df['fecha'])
+    if 'plataforma' in df.columns:
+        df['plataforma'] = df['plataforma'].astype('string').str.strip().astype('category')
+    return df
+
+
+def procesar(entrada=URL_DATA, salida=URL_OUTPUT, engine='auto', n_jobs=None):
+    df = read_csv_auto(entrada)
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {entrada}")
+
+    limpiar(df, engine, n_jobs)
+    with profiling.stage('prep_db.write', filas=len(df)):
+        df.to_csv(salida, index=False)
+
+
+def _procesar_bloques(entrada, tmp, sep, encoding, chunksize, engine, n_jobs):
+    lector = pd.read_csv(
+        entrada,
+        sep=sep,
+        encoding=encoding,
+        on_bad_lines='skip',
+        dtype=str,
+        chunksize=chunksize,
+    )
+    filas = 0
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        for i, bloque in enumerate(lector):
+            limpiar(bloque, engine, n_jobs)
+            with profiling.stage('prep_db.write', filas=len(bloque)):
+                bloque.to_csv(f, header=(i == 0), index=False)
+            filas += len(bloque)
+    return filas
+
 
-df = read_csv_auto(URL_DATA)
+def procesar_streaming(entrada=URL_DATA, salida=URL_OUTPUT, chunksize=100_000, engine='auto', n_jobs=None):
+    # Lee la exportación por bloques de tamaño fijo y agrega cada bloque limpio
+    # a la salida, de modo que la memoria no depende del tamaño de la entrada
+    if not os.path.exists(entrada):
+        raise SystemExit(f"No se encontró el archivo: {entrada}")
+    info = utils.sniff_csv(entrada)
 
-# Rellenar valores faltantes en 'usuario' usando 'nombre'
-df['usuario'] = df['usuario'].fillna(df['nombre'])
-        
-# Eliminar columnas innecesarias
-df_no_city = df.drop('ciudad', axis=1)
-df_no_date = df_no_city.drop('fecha', axis=1)
-df_no_platform = df_no_date.drop('plataforma', axis=1)
-df_no_name = df_no_platform.drop('nombre', axis=1)
+    # Se escribe en un temporal para no dejar una salida a medias si falla
+    tmp = salida + '.tmp'
+    try:
+        filas = _procesar_bloques(entrada, tmp, info['sep'], info['encoding'], chunksize, engine, n_jobs)
+    except UnicodeDecodeError:
+        # La codificación de la muestra no sirve para el resto del archivo:
+        # se detecta con el archivo completo y se vuelve a empezar
+        filas = _procesar_bloques(entrada, tmp, info['sep'], utils.detect_encoding(entrada), chunksize,
+                                  engine, n_jobs)
+    os.replace(tmp, salida)
+    print(f"{filas} filas procesadas")
 
-strip_df = df_no_name.copy()
 
-# Columnas de texto a limpiar
-columnas_texto = strip_df.select_dtypes(include='object').columns
-print(columnas_texto)
+def main():
+    parser = argparse.ArgumentParser(description="Limpieza de la base de comentarios")
+    parser.add_argument('--input', default=URL_DATA)
+    parser.add_argument('--output', default=URL_OUTPUT)
+    parser.add_argument('--streaming', action='store_true', help="Procesar la entrada por bloques")
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--engine', default='auto', choices=['auto', 'arrow', 'processes', 'pandas'],
+                        help="Motor de normalización de texto")
+    parser.add_argument('--jobs', type=int, default=None, help="Procesos para --engine processes")
+    parser.add_argument('--profile', default=None, metavar='RUTA',
+                        help="Guardar los tiempos por etapa (.json o .prom para Prometheus)")
+    args = parser.parse_args()
 
-# Limpieza de texto: minúsculas, espacios, caracteres especiales
-for col in columnas_texto:
-    strip_df[col] = strip_df[col].str.lower().str.strip()
-    strip_df[col] = strip_df[col].str.replace(r"[^a-z0-9áéíóúüñ ]", "", regex=True)
+    if args.streaming:
+        procesar_streaming(args.input, args.output, args.chunksize, args.engine, args.jobs)
+    else:
+        procesar(args.input, args.output, args.engine, args.jobs)
 
-clean_df = strip_df.copy()
+    if args.profile:
+        profiling.export(args.profile)
 
-# Normalización de nombres de países
-clean_df['pais'] = clean_df['pais'].replace('estados unidos', "usa")
-clean_df['pais'] = clean_df['pais'].replace('brazil', 'brasil')
 
-clean_df.to_csv('./databases/db_final.csv', index=False)
+if __name__ == '__main__':
+    main()
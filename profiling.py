@@ -0,0 +1,240 @@
+# Instrumentación de las etapas del pipeline.
+# `stage(nombre)` mide un bloque de código: tiempo de pared, memoria y filas
+# procesadas. Los registros se guardan en memoria (compartidos por el proceso)
+# y se exportan como JSON o en formato de texto de Prometheus.
+# - CARTAGENA_PROFILE=0 desactiva la medición.
+# - CARTAGENA_PROFILE_MEMORY=1 activa tracemalloc para medir el pico de memoria
+#   de cada etapa (tiene un coste apreciable; sin él solo se mide el RSS).
+#   El pico de tracemalloc es de todo el proceso: solo es válido si un único
+#   hilo ejecuta etapas. Una etapa que empieza mientras otro hilo tiene etapas
+#   abiertas no mide memoria, las que ya la medían quedan sin pico
+#   (peak_bytes=None) y los hilos de trabajos (jobs.py) nunca la miden.
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MAX_REGISTROS = 5000
+ENABLED = os.environ.get('CARTAGENA_PROFILE', '1') != '0'
+
+if os.environ.get('CARTAGENA_PROFILE_MEMORY') == '1' and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+_lock = threading.Lock()
+_local = threading.local()
+_registros = deque(maxlen=MAX_REGISTROS)
+# Etapas abiertas por hilo y marcos que miden memoria en este momento
+_abiertas = {}
+_midiendo = []
+
+
+def rss_bytes():
+    # Memoria residente actual del proceso (Linux); None si no está disponible
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def object_bytes(obj, _vistos=None):
+    # Tamaño aproximado en memoria de DataFrames, arrays y contenedores; los
+    # arrays mapeados desde disco (memmap) no cuentan
+    vistos = set() if _vistos is None else _vistos
+    if id(obj) in vistos:
+        return 0
+    vistos.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.memmap):
+        return 0
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            object_bytes(k, vistos) + object_bytes(v, vistos) for k, v in obj.items()
+        )
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(object_bytes(v, vistos) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def max_rss_bytes():
+    # Pico de memoria residente del proceso desde su inicio (ru_maxrss está en KB en Linux)
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def stage(nombre, filas=None):
+    # Uso:
+    #     with profiling.stage('prep_db.read') as etapa:
+    #         df = ...
+    #         etapa['rows'] = len(df)
+    registro = {'stage': nombre, 'rows': filas}
+    if not ENABLED:
+        yield registro
+        return
+
+    hilo = threading.get_ident()
+    pila = _pila()
+    marco = None
+    with _lock:
+        otros = any(n for h, n in _abiertas.items() if h != hilo)
+        _abiertas[hilo] = _abiertas.get(hilo, 0) + 1
+        if otros:
+            # Las etapas de otros hilos ya no miden solo sus asignaciones
+            for abierto in _midiendo:
+                if abierto['hilo'] != hilo:
+                    abierto['valido'] = False
+        elif tracemalloc.is_tracing() and not getattr(_local, 'sin_memoria', False):
+            # El pico de tracemalloc es global: antes de reiniciarlo se traslada
+            # a la etapa que contiene a esta, y al salir se le suma el de esta
+            if pila:
+                pila[-1]['pico'] = max(pila[-1]['pico'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            actual = tracemalloc.get_traced_memory()[0]
+            marco = {'base': actual, 'pico': actual, 'hilo': hilo, 'valido': True}
+            pila.append(marco)
+            _midiendo.append(marco)
+    rss_antes = rss_bytes()
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        registro['seconds'] = time.perf_counter() - inicio
+        registro['peak_bytes'] = None
+        with _lock:
+            if marco is not None:
+                pila.pop()
+                _midiendo.remove(marco)
+                pico = max(marco['pico'], tracemalloc.get_traced_memory()[1])
+                if pila:
+                    pila[-1]['pico'] = max(pila[-1]['pico'], pico)
+                    pila[-1]['valido'] &= marco['valido']
+                if marco['valido']:
+                    registro['peak_bytes'] = pico - marco['base']
+            _abiertas[hilo] -= 1
+            if not _abiertas[hilo]:
+                del _abiertas[hilo]
+        rss_despues = rss_bytes()
+        registro['rss_delta_bytes'] = (
+            rss_despues - rss_antes if rss_antes is not None and rss_despues is not None else None
+        )
+        registro['max_rss_bytes'] = max_rss_bytes()
+        registro['timestamp'] = time.time()
+        with _lock:
+            _registros.append(registro)
+
+
+def disable_memory():
+    # Las etapas del hilo actual no miden memoria (hilos de trabajos en
+    # paralelo, donde el pico global mezclaría las asignaciones de todos)
+    _local.sin_memoria = True
+
+
+def _pila():
+    # Etapas abiertas en el hilo actual
+    if not hasattr(_local, 'pila'):
+        _local.pila = []
+    return _local.pila
+
+
+def records():
+    with _lock:
+        return [dict(r) for r in _registros]
+
+
+def reset():
+    with _lock:
+        _registros.clear()
+
+
+def _percentil(valores, q):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(q * (len(ordenados) - 1))))]
+
+
+def summary():
+    # Una fila por etapa con llamadas, tiempos (total, medio, p95, máximo),
+    # filas procesadas y el mayor pico de memoria observado
+    por_etapa = {}
+    for r in records():
+        por_etapa.setdefault(r['stage'], []).append(r)
+
+    resumen = []
+    for nombre, regs in por_etapa.items():
+        tiempos = [r['seconds'] for r in regs]
+        filas = [r['rows'] for r in regs if r['rows'] is not None]
+        picos = [r['peak_bytes'] for r in regs if r['peak_bytes'] is not None]
+        total = sum(tiempos)
+        resumen.append({
+            'stage': nombre,
+            'calls': len(regs),
+            'total_seconds': total,
+            'mean_seconds': total / len(regs),
+            'p95_seconds': _percentil(tiempos, 0.95),
+            'max_seconds': max(tiempos),
+            'rows': sum(filas) if filas else None,
+            'rows_per_second': sum(filas) / total if filas and total > 0 else None,
+            'peak_bytes': max(picos) if picos else None,
+            'max_rss_bytes': max((r['max_rss_bytes'] for r in regs if r['max_rss_bytes'] is not None), default=None),
+        })
+    return sorted(resumen, key=lambda r: r['total_seconds'], reverse=True)
+
+
+def to_json(indent=2):
+    return json.dumps({'summary': summary(), 'records': records()}, indent=indent, ensure_ascii=False)
+
+
+def _etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(prefijo='cartagena'):
+    # Formato de exposición de texto de Prometheus, una serie por etapa
+    metricas = [
+        ('stage_seconds_total', 'counter', 'Tiempo de pared acumulado por etapa', 'total_seconds'),
+        ('stage_calls_total', 'counter', 'Ejecuciones por etapa', 'calls'),
+        ('stage_seconds_max', 'gauge', 'Mayor tiempo de pared de una ejecución', 'max_seconds'),
+        ('stage_seconds_p95', 'gauge', 'Percentil 95 del tiempo de pared', 'p95_seconds'),
+        ('stage_rows_total', 'counter', 'Filas procesadas por etapa', 'rows'),
+        ('stage_peak_bytes', 'gauge', 'Mayor pico de memoria (tracemalloc) por etapa', 'peak_bytes'),
+    ]
+    resumen = summary()
+    lineas = []
+    for nombre, tipo, ayuda, campo in metricas:
+        lineas.append(f"# HELP {prefijo}_{nombre} {ayuda}")
+        lineas.append(f"# TYPE {prefijo}_{nombre} {tipo}")
+        for r in resumen:
+            if r[campo] is not None:
+                lineas.append(f'{prefijo}_{nombre}{{stage="{_etiqueta(r["stage"])}"}} {r[campo]}')
+    pico = max_rss_bytes()
+    if pico is not None:
+        lineas.append(f"# HELP {prefijo}_process_max_rss_bytes Pico de memoria residente del proceso")
+        lineas.append(f"# TYPE {prefijo}_process_max_rss_bytes gauge")
+        lineas.append(f"{prefijo}_process_max_rss_bytes {pico}")
+    return '\n'.join(lineas) + '\n'
+
+
+def export(path):
+    # Guarda el resumen según la extensión: .prom (Prometheus) o JSON
+    contenido = to_prometheus() if path.endswith('.prom') else to_json()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(contenido)
@@ -0,0 +1,187 @@
+# Proyección 2D de los embeddings para el mapa de comentarios.
+# - Reducción previa con PCA y t-SNE Barnes-Hut inicializado con PCA.
+# - Con corpus grandes, t-SNE se ajusta sobre una muestra de puntos de
+#   referencia y el resto se ubica por interpolación de sus vecinos cercanos.
+# - El layout se guarda por clave de comentario: los comentarios nuevos se
+#   ubican dentro del layout existente sin recalcularlo, y al recalcularlo
+#   se conservan los comentarios guardados que no estaban en la llamada.
+import hashlib
+import os
+import re
+
+import numpy as np
+
+import profiling
+import utils
+
+LAYOUTS_DIR = os.path.join(utils.CACHE_DIR, 'layouts')
+
+PCA_DIMS = 50
+MAX_TSNE = 20_000
+N_VECINOS = 10
+# Si la proporción de comentarios nuevos supera este umbral se recalcula todo
+MAX_FRACCION_NUEVOS = 0.5
+
+
+def _normalizar(X):
+    X = np.asarray(X, dtype=np.float32)
+    normas = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.maximum(normas, 1e-12)
+
+
+def fingerprint(claves):
+    # Huella del conjunto de embeddings (independiente del orden)
+    h = hashlib.blake2b(digest_size=16)
+    for k in sorted(set(claves)):
+        h.update(k if isinstance(k, bytes) else k.encode('ascii'))
+    return h.hexdigest()
+
+
+def _interpolar(X_ref, Y_ref, X_nuevos, n_vecinos=N_VECINOS):
+    # Ubica cada punto nuevo en el promedio ponderado de las coordenadas de sus
+    # vecinos más cercanos (similitud coseno) entre los puntos ya ubicados
+    from sklearn.neighbors import NearestNeighbors
+
+    n_vecinos = min(n_vecinos, len(X_ref))
+    nn = NearestNeighbors(n_neighbors=n_vecinos, metric='euclidean').fit(X_ref)
+    dist, idx = nn.kneighbors(X_nuevos)
+    pesos = 1.0 / np.maximum(dist, 1e-6)
+    pesos /= pesos.sum(axis=1, keepdims=True)
+    return np.einsum('ij,ijk->ik', pesos, Y_ref[idx]).astype(np.float32)
+
+
+def compute_layout(X, random_state=42, perplexity=30, max_iter=1000, max_tsne=MAX_TSNE):
+    from sklearn.decomposition import PCA
+    from sklearn.manifold import TSNE
+
+    X = _normalizar(X)
+    n = len(X)
+    if n < 3:
+        return np.zeros((n, 2), dtype=np.float32)
+
+    if X.shape[1] > PCA_DIMS and n > PCA_DIMS:
+        with profiling.stage('projection.pca', filas=n):
+            X = PCA(n_components=PCA_DIMS, random_state=random_state).fit_transform(X).astype(np.float32)
+
+    # Puntos de referencia: todos si caben, si no una muestra aleatoria
+    rng = np.random.default_rng(random_state)
+    ref = np.arange(n) if n <= max_tsne else np.sort(rng.choice(n, max_tsne, replace=False))
+
+    tsne = TSNE(
+        n_components=2,
+        random_state=random_state,
+        perplexity=min(perplexity, len(ref) - 1),
+        max_iter=max_iter,
+        init='pca',
+        method='barnes_hut',
+    )
+    Y = np.empty((n, 2), dtype=np.float32)
+    with profiling.stage('projection.tsne', filas=len(ref)):
+        Y[ref] = tsne.fit_transform(X[ref])
+
+    if len(ref) < n:
+        resto = np.setdiff1d(np.arange(n), ref)
+        with profiling.stage('projection.interpolate', filas=len(resto)):
+            Y[resto] = _interpolar(X[ref], Y[ref], X[resto])
+    return Y
+
+
+class LayoutStore:
+    # Layout persistente (clave de comentario -> coordenadas) por modelo
+
+    def __init__(self, model_name, cache_dir=LAYOUTS_DIR):
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f"{slug}.npz")
+        # Bloqueo entre procesos para las escrituras (dashboard, build_artifacts.py)
+        self.lock_path = os.path.join(cache_dir, f"{slug}.lock")
+        self.reload()
+
+    def reload(self):
+        self.keys = np.empty(0, dtype='S32')
+        self.coords = np.empty((0, 2), dtype=np.float32)
+        self.fingerprint = None
+        if os.path.exists(self.path):
+            datos = np.load(self.path)
+            self.keys, self.coords = datos['keys'], datos['coords']
+            self.fingerprint = str(datos['fingerprint'])
+        self._pos = {k: i for i, k in enumerate(self.keys.tolist())}
+
+    def save(self, keys, coords):
+        self.keys = np.asarray(keys, dtype='S32')
+        self.coords = np.asarray(coords, dtype=np.float32)
+        self.fingerprint = fingerprint(self.keys.tolist())
+        self._pos = {k: i for i, k in enumerate(self.keys.tolist())}
+        tmp = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, keys=self.keys, coords=self.coords, fingerprint=self.fingerprint)
+        os.replace(tmp, self.path)
+
+    def lookup(self, claves):
+        return np.array([self._pos.get(k, -1) for k in claves], dtype=np.int64)
+
+
+def _alinear(origen, destino, puntos):
+    # Transformación de semejanza (escala, rotación o reflexión y traslación)
+    # que mejor lleva `origen` sobre `destino` (Procrustes), aplicada a `puntos`
+    media_o, media_d = origen.mean(axis=0), destino.mean(axis=0)
+    o, d = origen - media_o, destino - media_d
+    u, sv, vt = np.linalg.svd(o.T @ d)
+    rotacion = u @ vt
+    escala = sv.sum() / max(float((o ** 2).sum()), 1e-12)
+    return ((puntos - media_o) * escala @ rotacion + media_d).astype(np.float32)
+
+
+def _fusionar(store, claves, Y):
+    # Un layout recalculado no descarta los comentarios guardados que no están
+    # en esta llamada: se llevan a las coordenadas nuevas alineando los
+    # comentarios comunes a los dos layouts. Sin al menos 3 en común no hay
+    # transformación que estimar y conservan sus coordenadas
+    nuevas = {k: i for i, k in enumerate(claves)}
+    comunes = np.array([k in nuevas for k in store.keys.tolist()], dtype=bool)
+    if comunes.all():
+        return claves, Y
+    Y_resto = store.coords[~comunes]
+    if comunes.sum() >= 3:
+        destino = Y[[nuevas[k] for k in store.keys[comunes].tolist()]]
+        Y_resto = _alinear(store.coords[comunes], destino, Y_resto)
+    return list(claves) + store.keys[~comunes].tolist(), np.vstack([Y, Y_resto])
+
+
+def project(X, claves, model_name, cache_dir=LAYOUTS_DIR, **kwargs):
+    # Devuelve coordenadas 2D (n, 2) para los embeddings X, reutilizando el
+    # layout guardado y ubicando solo los comentarios que no tiene
+    claves = [k if isinstance(k, bytes) else k.encode('ascii') for k in claves]
+    store = LayoutStore(model_name, cache_dir)
+
+    pos = store.lookup(claves)
+    if (pos >= 0).all():
+        return store.coords[pos]
+
+    # Otro proceso puede estar ubicando los mismos comentarios: se vuelve a
+    # leer el layout con el bloqueo tomado y se escribe antes de soltarlo
+    with utils.file_lock(store.lock_path):
+        store.reload()
+        pos = store.lookup(claves)
+        if (pos >= 0).all():
+            return store.coords[pos]
+
+        # Primera vez o demasiados cambios: recalcular el layout completo
+        primera = {}
+        for i, k in enumerate(claves):
+            primera.setdefault(k, i)
+        nuevos_idx = [i for k, i in primera.items() if k not in store._pos]
+        if len(store.keys) == 0 or len(nuevos_idx) / len(primera) > MAX_FRACCION_NUEVOS:
+            Y = compute_layout(np.asarray(X)[list(primera.values())], **kwargs)
+            store.save(*_fusionar(store, list(primera), Y))
+            return store.coords[store.lookup(claves)]
+
+        # Ubicación incremental: los puntos existentes no se mueven
+        X = _normalizar(X)
+        conocidos = [i for k, i in primera.items() if k in store._pos]
+
+        Y_nuevos = _interpolar(X[conocidos], store.coords[pos[conocidos]], X[nuevos_idx])
+        store.save(
+            np.concatenate([store.keys, np.array([claves[i] for i in nuevos_idx], dtype='S32')]),
+            np.vstack([store.coords, Y_nuevos]),
+        )
+        return store.coords[store.lookup(claves)]
@@ -0,0 +1,116 @@
+# Nivel de detalle para el mapa 2D de comentarios.
+# El navegador nunca recibe el corpus completo:
+# - vista general: muestra estratificada por cluster y sentimiento;
+# - vista alejada: celdas de densidad calculadas en el servidor;
+# - región seleccionada: todos los puntos dentro del recuadro (con tope).
+# Los datos de cada punto (sentimiento, país, comentario) se consultan solo
+# para los puntos que el usuario selecciona.
+import numpy as np
+import pandas as pd
+
+MAX_PUNTOS = 20_000
+MAX_PUNTOS_REGION = 50_000
+# Puntos garantizados por estrato para que los grupos pequeños sigan visibles
+MIN_POR_ESTRATO = 20
+CELDAS = 80
+
+
+def stratified_sample(df, estratos, max_puntos=MAX_PUNTOS, min_por_estrato=MIN_POR_ESTRATO, random_state=42):
+    # Índices (posicionales) de una muestra proporcional al tamaño de cada estrato
+    if len(df) <= max_puntos:
+        return np.arange(len(df))
+
+    grupos = df.groupby(estratos, observed=True, dropna=False, sort=False).indices
+    tamanos = np.array([len(v) for v in grupos.values()])
+    # Primero el mínimo de cada estrato; el resto del cupo se reparte en
+    # proporción a lo que le queda a cada uno
+    minimo = np.minimum(tamanos, min(min_por_estrato, max_puntos // len(grupos)))
+    restante = tamanos - minimo
+    cupo = max_puntos - minimo.sum()
+    cuota = minimo + np.floor(restante * cupo / max(restante.sum(), 1)).astype(np.int64)
+
+    rng = np.random.default_rng(random_state)
+    partes = [
+        filas if len(filas) <= n else rng.choice(filas, n, replace=False)
+        for filas, n in zip(grupos.values(), cuota)
+    ]
+    return np.sort(np.concatenate(partes))
+
+
+def density_tiles(x, y, celdas=CELDAS, etiquetas=None):
+    # Conteo de puntos por celda de una rejilla regular; con `etiquetas` se
+    # añade la etiqueta más frecuente de cada celda
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if len(x) == 0:
+        return pd.DataFrame(columns=['x', 'y', 'ancho', 'alto', 'cuenta'])
+
+    bordes_x = np.linspace(x.min(), x.max() + 1e-9, celdas + 1)
+    bordes_y = np.linspace(y.min(), y.max() + 1e-9, celdas + 1)
+    ix = np.clip(np.searchsorted(bordes_x, x, side='right') - 1, 0, celdas - 1)
+    iy = np.clip(np.searchsorted(bordes_y, y, side='right') - 1, 0, celdas - 1)
+    celda = ix * celdas + iy
+
+    ocupadas, cuenta = np.unique(celda, return_counts=True)
+    cx, cy = np.divmod(ocupadas, celdas)
+    ancho, alto = bordes_x[1] - bordes_x[0], bordes_y[1] - bordes_y[0]
+    tiles = pd.DataFrame({
+        'x': bordes_x[cx] + ancho / 2,
+        'y': bordes_y[cy] + alto / 2,
+        'ancho': ancho,
+        'alto': alto,
+        'cuenta': cuenta,
+    })
+
+    if etiquetas is not None:
+        moda = (
+            pd.DataFrame({'celda': celda, 'etiqueta': np.asarray(etiquetas)})
+            .groupby(['celda', 'etiqueta'], observed=True).size()
+            .reset_index(name='n')
+            .sort_values('n', ascending=False, kind='stable')
+            .drop_duplicates('celda')
+            .set_index('celda')['etiqueta']
+        )
+        tiles['etiqueta'] = moda.reindex(ocupadas).to_numpy()
+    return tiles
+
+
+def points_in_region(x, y, x_rango, y_rango, max_puntos=MAX_PUNTOS_REGION, random_state=42):
+    # Índices de los puntos dentro del recuadro; si son demasiados se toma una
+    # muestra uniforme. Devuelve también el total real de la región
+    x, y = np.asarray(x), np.asarray(y)
+    x0, x1 = sorted(x_rango)
+    y0, y1 = sorted(y_rango)
+    dentro = np.flatnonzero((x >= x0) & (x <= x1) & (y >= y0) & (y <= y1))
+    total = len(dentro)
+    if total > max_puntos:
+        rng = np.random.default_rng(random_state)
+        dentro = np.sort(rng.choice(dentro, max_puntos, replace=False))
+    return dentro, total
+
+
+def selection_box(evento):
+    # Rango (x, y) del recuadro o lazo seleccionado en un st.plotly_chart
+    if not evento:
+        return None
+    seleccion = evento.get('selection') or {}
+    for tipo in ('box', 'lasso'):
+        for forma in seleccion.get(tipo, []) or []:
+            xs, ys = forma.get('x'), forma.get('y')
+            if xs and ys:
+                return (min(xs), max(xs)), (min(ys), max(ys))
+    return None
+
+
+def selected_rows(evento):
+    # Filas del DataFrame original de los puntos seleccionados (via customdata)
+    if not evento:
+        return []
+    seleccion = evento.get('selection') or {}
+    filas = []
+    for punto in seleccion.get('points', []) or []:
+        dato = punto.get('customdata')
+        if isinstance(dato, (list, tuple)):
+            dato = dato[0] if dato else None
+        if dato is not None:
+            filas.append(int(dato))
+    return filas
@@ -0,0 +1,143 @@
+# Almacenamiento columnar (Parquet) del conjunto de datos limpio.
+# Las columnas categóricas se guardan con codificación de diccionario, las
+# numéricas con tipos enteros y el conjunto se particiona por sentimiento para
+# poder leer solo las columnas y particiones necesarias.
+import argparse
+import os
+import shutil
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import timeseries
+import utils
+
+URL_CSV = './databases/db_final.csv'
+DATASET_DIR = './databases/db_final.parquet'
+
+PARTITION_COLS = ['sentimiento']
+CATEGORICAS = ['pais', 'sentimiento', 'plataforma', 'ciudad']
+FECHAS = ['fecha']
+ENTEROS = {
+    'longitud': pa.int32(),
+    'cluster_dbscan': pa.int32(),
+    'sentimiento_valor': pa.int8(),
+    'fila': pa.int32(),
+}
+FLOTANTES = ['prob_pos', 'prob_neg', 'prob_neu']
+
+# Tipos compactos en memoria: categorías para las columnas con valores
+# repetidos y cadenas respaldadas por Arrow para el texto libre
+CATEGORICAS_MEMORIA = ['pais', 'sentimiento', 'usuario', 'origen', 'plataforma', 'ciudad']
+TEXTO = ['comentario']
+
+
+def _schema(df):
+    campos = []
+    for col in df.columns:
+        if col in CATEGORICAS:
+            tipo = pa.dictionary(pa.int32(), pa.string())
+        elif col in ENTEROS:
+            tipo = ENTEROS[col]
+        elif col in FECHAS:
+            tipo = pa.date32()
+        elif col in FLOTANTES:
+            tipo = pa.float32()
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(col, tipo))
+    return pa.schema(campos)
+
+
+def to_arrow(df):
+    df = df.copy()
+    for col in df.columns:
+        if col in ENTEROS:
+            serie = pd.to_numeric(df[col], errors='coerce')
+            df[col] = serie.astype('Int64' if serie.isna().any() else 'int64')
+        elif col in CATEGORICAS:
+            df[col] = df[col].astype('string').astype('category')
+        elif col in FECHAS:
+            df[col] = timeseries.parse_dates(df[col]).dt.date
+    return pa.Table.from_pandas(df, schema=_schema(df), preserve_index=False)
+
+
+def write_dataset(df, path=DATASET_DIR, partition_cols=PARTITION_COLS, mode='overwrite'):
+    # mode='overwrite' reemplaza el conjunto completo; mode='append' agrega
+    # nuevos archivos sin tocar los existentes
+    if mode not in ('overwrite', 'append'):
+        raise ValueError(f"Modo no soportado: {mode!r}")
+    if mode == 'overwrite' and os.path.exists(path):
+        shutil.rmtree(path)
+
+    particiones = [c for c in partition_cols if c in df.columns]
+    pq.write_to_dataset(
+        to_arrow(df),
+        root_path=path,
+        partition_cols=particiones or None,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+def dataset_exists(path=DATASET_DIR):
+    return os.path.isdir(path) and any(
+        f.endswith('.parquet') for _, _, archivos in os.walk(path) for f in archivos
+    )
+
+
+def dataset_columns(path=DATASET_DIR):
+    # Columnas del conjunto (incluidas las de partición) sin leer los datos
+    return pq.ParquetDataset(path, partitioning='hive').schema.names
+
+
+def dataset_version(path=DATASET_DIR):
+    # Marca de versión barata: fecha de modificación más reciente de los archivos
+    return max(
+        (os.path.getmtime(os.path.join(raiz, f)) for raiz, _, archivos in os.walk(path) for f in archivos),
+        default=0.0,
+    )
+
+
+def compact_frame(df):
+    # Convierte en el sitio; las columnas que ya tienen el tipo no se copian
+    for col in df.columns:
+        if col in CATEGORICAS_MEMORIA and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+        elif col in TEXTO and df[col].dtype != 'string[pyarrow]':
+            df[col] = df[col].astype('string[pyarrow]')
+    return df
+
+
+def read_dataset(path=DATASET_DIR, columns=None, filters=None):
+    # Proyección de columnas y filtros (p. ej. [('sentimiento', 'in', ['pos'])])
+    # se resuelven en la lectura: solo se leen las particiones y columnas pedidas
+    tabla = pq.read_table(path, columns=columns, filters=filters, partitioning='hive')
+    # Fechas como datetime64 (no objetos date de Python)
+    df = tabla.to_pandas(date_as_object=False)
+    for col in df.select_dtypes(include='category').columns:
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte el conjunto limpio entre CSV y Parquet")
+    parser.add_argument('--to-csv', action='store_true', help="Exporta el Parquet a CSV")
+    parser.add_argument('--csv', default=URL_CSV)
+    parser.add_argument('--parquet', default=DATASET_DIR)
+    args = parser.parse_args()
+
+    if args.to_csv:
+        read_dataset(args.parquet).to_csv(args.csv, index=False)
+        return
+
+    df = utils.read_csv_auto(args.csv)
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {args.csv}")
+    write_dataset(df, args.parquet)
+
+
+if __name__ == '__main__':
+    main()
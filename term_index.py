@@ -0,0 +1,150 @@
+# Índice de frecuencias de términos para las nubes de palabras.
+# Los comentarios se tokenizan una sola vez (tokenizer.py) y se guardan los
+# conteos por sentimiento, cluster y país en formato largo (dimensión, valor,
+# término, forma, cuenta). Los términos se guardan con su grafía original y
+# `forma` es la variante con más apariciones de su forma sin tildes en todo el
+# índice, recalculada a partir de los conteos sumados en cada construcción o
+# actualización: así una actualización incremental y una reconstrucción
+# completa muestran las mismas palabras, y las consultas solo agrupan las filas
+# seleccionadas. Las nubes se dibujan con `generate_from_frequencies` y un
+# comentario nuevo solo actualiza los conteos.
+import argparse
+import os
+
+import pandas as pd
+
+import tokenizer
+import utils
+
+INDEX_PATH = os.path.join(utils.CACHE_DIR, 'term_index.parquet')
+
+DIMENSIONES = ['sentimiento', 'cluster_dbscan', 'pais']
+COLUMNAS = ['dimension', 'valor', 'termino', 'forma', 'cuenta']
+# Columnas que identifican una fila del índice
+CLAVES = ['dimension', 'valor', 'termino']
+
+
+def tokenize(serie):
+    # Serie de términos con el índice de la fila de origen (una fila por término)
+    return tokenizer.default().tokenize(serie)
+
+
+def build(df, dimensiones=DIMENSIONES):
+    terminos = tokenize(df['comentario']).rename('termino')
+    partes = []
+    for dim in dimensiones:
+        if dim not in df.columns:
+            continue
+        valores = df[dim].astype(str).reindex(terminos.index).rename('valor')
+        conteo = (
+            pd.concat([valores, terminos], axis=1)
+            .groupby(['valor', 'termino'], sort=False)
+            .size()
+            .reset_index(name='cuenta')
+        )
+        conteo.insert(0, 'dimension', dim)
+        partes.append(conteo)
+
+    if not partes:
+        return _vacio()
+    return _compactar(pd.concat(partes, ignore_index=True))
+
+
+def _vacio():
+    return _compactar(pd.DataFrame(columns=CLAVES + ['cuenta']))
+
+
+def _compactar(indice):
+    # Diccionario para las columnas repetidas y enteros de 32 bits para los conteos
+    indice = indice[CLAVES + ['cuenta']].copy()
+    indice['forma'] = canonical_terms(indice)
+    indice = indice[COLUMNAS]
+    for col in COLUMNAS[:4]:
+        indice[col] = indice[col].astype(str).astype('category')
+    indice['cuenta'] = indice['cuenta'].astype('int32')
+    return indice.reset_index(drop=True)
+
+
+def update(indice, df_nuevo, dimensiones=DIMENSIONES):
+    # Suma los conteos de los comentarios nuevos sin volver a tokenizar el corpus
+    delta = build(df_nuevo, dimensiones)
+    combinado = pd.concat(
+        [indice[CLAVES + ['cuenta']].astype({c: str for c in CLAVES}),
+         delta[CLAVES + ['cuenta']].astype({c: str for c in CLAVES})],
+        ignore_index=True,
+    )
+    combinado = combinado.groupby(CLAVES, sort=False, as_index=False)['cuenta'].sum()
+    return _compactar(combinado)
+
+
+def _normalizar_plurales(frecuencias):
+    # Igual que WordCloud: "playas" se suma a "playa" si ambas aparecen
+    resultado = dict(frecuencias)
+    for termino, cuenta in frecuencias.items():
+        if termino.endswith('s') and not termino.endswith('ss'):
+            singular = termino[:-1]
+            if singular in resultado:
+                resultado[singular] += cuenta
+                del resultado[termino]
+    return resultado
+
+
+def canonical_terms(indice):
+    # Grafía de cada fila: la variante de su forma plegada con más apariciones
+    # en todo el índice (cada aparición cuenta una vez por dimensión, lo que no
+    # cambia el orden entre variantes)
+    return tokenizer.default().canonical(indice['termino'].astype(str), indice['cuenta'])
+
+
+def frequencies(indice, dimension, valor, stopwords=(), normalize_plurals=True):
+    # Las stopwords se comparan sin tildes: "más" también descarta "mas"
+    seleccion = ((indice['dimension'] == dimension) & (indice['valor'] == str(valor))).to_numpy()
+    if 'forma' in indice.columns:
+        terminos = indice['forma'][seleccion].astype(str)
+    else:
+        # Índice guardado antes de la columna `forma`
+        terminos = canonical_terms(indice)[seleccion]
+    vacias = tokenizer.Tokenizer(stopwords).stopword_mask(terminos)
+    conteos = (
+        pd.Series(indice['cuenta'].to_numpy()[seleccion][~vacias])
+        .groupby(terminos.to_numpy()[~vacias], sort=False)
+        .sum()
+    )
+    frecuencias = {t: int(c) for t, c in conteos.items()}
+    if normalize_plurals:
+        frecuencias = _normalizar_plurales(frecuencias)
+    return frecuencias
+
+
+def save(indice, path=INDEX_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    indice.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def load(path=INDEX_PATH):
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def index_version(path=INDEX_PATH):
+    # Fecha de modificación del índice guardado; 0.0 si no existe
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye el índice de frecuencias de términos")
+    parser.add_argument('--input', default='./databases/db_final.csv')
+    parser.add_argument('--output', default=INDEX_PATH)
+    args = parser.parse_args()
+
+    df = utils.read_csv_auto(args.input)
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {args.input}")
+    save(build(df), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import codecs
+
+import numpy as np
+
+import ingest
+import utils
+from test_utils import TWITTER
+
+
+def test_reingesta_utf8_sin_bom(tmp_path):
+    # La base ya contiene las filas de la exportación; volver a ingerirla sin
+    # BOM no debe encontrar filas nuevas
+    datos = open(TWITTER, 'rb').read()
+    datos = datos[len(codecs.BOM_UTF8):] if datos.startswith(codecs.BOM_UTF8) else datos
+    exportacion = tmp_path / 'exportacion.csv'
+    exportacion.write_bytes(datos)
+
+    # Índice con las claves de la exportación original (con BOM, sin ambigüedad)
+    base = utils.read_csv_auto(TWITTER)
+    indice = tmp_path / 'indice'
+    ingest.DedupIndex(str(indice)).rebuild(
+        ingest.record_keys(base['usuario'].fillna(base['nombre']), base['comentario']))
+    salida = tmp_path / 'db_final.csv'
+    assert ingest.ingest(str(exportacion), str(salida), str(indice)) == 0
+
+
+def _claves(inicio, fin):
+    return np.array([i.to_bytes(ingest.TAMANO_CLAVE, 'big') for i in range(inicio, fin)],
+                    dtype=f'S{ingest.TAMANO_CLAVE}')
+
+
+def test_indice_delta_y_fusion(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'DELTA_MINIMO', 10)
+    indice = ingest.DedupIndex(str(tmp_path))
+    indice.rebuild(_claves(0, 100)[::-1])
+    assert indice.add(_claves(95, 103)) == 3
+    assert len(indice) == 103
+
+    # Las claves del delta se encuentran al reabrir el índice
+    indice = ingest.DedupIndex(str(tmp_path))
+    assert indice.contains(_claves(98, 106)).tolist() == [True] * 5 + [False] * 3
+    assert indice.add(_claves(103, 115)) == 12
+
+    # El delta pasó del mínimo: se fundió en una base ordenada
+    assert not (tmp_path / 'delta.bin').exists()
+    base = np.fromfile(tmp_path / 'base.bin', dtype=f'S{ingest.TAMANO_CLAVE}')
+    assert base.tolist() == _claves(0, 115).tolist()
+
+
+def test_migra_el_formato_anterior(tmp_path):
+    _claves(0, 20)[::-1].tofile(tmp_path / 'claves.bin')
+    indice = ingest.DedupIndex(str(tmp_path))
+    assert len(indice) == 20 and indice.contains(_claves(19, 21)).tolist() == [True, False]
+    assert not (tmp_path / 'claves.bin').exists()
@@ -0,0 +1,57 @@
+import codecs
+import os
+
+import utils
+
+TWITTER = os.path.join(os.path.dirname(utils.STOPWORDS_PATH), 'twitter_coms.csv')
+
+FILAS = [
+    ('Ana', 'La gastronomía de Cartagena es increíble', 'Positivo'),
+    ('Luis', 'El tráfico en la mañana fue pésimo', 'Negativo'),
+    ('Sofía', 'Buen servicio en el hotel, volvería', 'Positivo'),
+]
+
+
+def _escribir(ruta, repeticiones=1, encoding='utf-8'):
+    lineas = ['usuario;comentario;sentimiento']
+    lineas += [';'.join(fila) for fila in FILAS] * repeticiones
+    ruta.write_bytes(('\n'.join(lineas) + '\n').encode(encoding))
+
+
+def test_utf8_sin_bom_con_acentos(tmp_path):
+    # chardet confunde UTF-8 sin BOM con MacRoman o Windows-125x
+    for repeticiones in (1, 500):
+        ruta = tmp_path / f'sin_bom_{repeticiones}.csv'
+        _escribir(ruta, repeticiones)
+        assert utils.sniff_csv(ruta)['encoding'] == 'utf-8'
+        df = utils.read_csv_auto(str(ruta))
+        assert df['comentario'].iloc[0] == 'La gastronomía de Cartagena es increíble'
+        assert df['usuario'].iloc[2] == 'Sofía'
+
+
+def test_exportacion_sin_bom(tmp_path):
+    # La exportación del repositorio sin su BOM, de una y de varias veces su tamaño
+    datos = open(TWITTER, 'rb').read()
+    datos = datos[len(codecs.BOM_UTF8):] if datos.startswith(codecs.BOM_UTF8) else datos
+    cabecera, _, cuerpo = datos.partition(b'\n')
+    esperado = utils.read_csv_auto(TWITTER)
+    for repeticiones in (1, 5, 20):
+        ruta = tmp_path / f'twitter_{repeticiones}.csv'
+        ruta.write_bytes(cabecera + b'\n' + cuerpo * repeticiones)
+        assert utils.sniff_csv(ruta)['encoding'] == 'utf-8'
+        df = utils.read_csv_auto(str(ruta))
+        assert df['comentario'].head(len(esperado)).tolist() == esperado['comentario'].tolist()
+
+
+def test_muestra_con_caracter_partido(tmp_path):
+    # Sin saltos de línea la muestra se corta en medio de un carácter multibyte
+    ruta = tmp_path / 'partido.csv'
+    ruta.write_bytes(('a;b\n' + 'á' * utils.SAMPLE_BYTES).encode('utf-8'))
+    assert utils.sniff_csv(ruta)['encoding'] == 'utf-8'
+
+
+def test_cp1252_con_acento_despues_de_la_muestra(tmp_path):
+    ruta = tmp_path / 'cp1252.csv'
+    ruta.write_bytes(('a;b\n' + 'x;y\n' * 40000 + 'canción;más\n').encode('cp1252'))
+    df = utils.read_csv_auto(str(ruta))
+    assert df.iloc[-1].tolist() == ['canción', 'más']
@@ -0,0 +1,169 @@
+# Series de tiempo de sentimiento a partir de la fecha de cada comentario.
+# Se guardan conteos agregados (rollups) por día y por semana, por periodo x
+# sentimiento x país x plataforma x cluster. Los comentarios nuevos solo suman
+# su delta (`update`), y las consultas por rango de fechas se responden desde
+# los rollups sin leer las filas.
+#
+#   python timeseries.py --input ./databases/db_final.csv
+import argparse
+import os
+
+import pandas as pd
+
+import utils
+
+SERIES_DIR = os.path.join(utils.CACHE_DIR, 'series')
+
+GRANULARIDADES = ['dia', 'semana']
+DIMENSIONES = ['sentimiento', 'pais', 'plataforma', 'cluster_dbscan']
+# Columnas de la base que necesitan los rollups
+COLUMNAS = ['fecha'] + DIMENSIONES
+
+# Formatos de la exportación (día/mes/año, sin relleno) y el ISO con que
+# prep_db.py escribe la base final
+FORMATOS_FECHA = ['%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y']
+# Origen de los números de serie de fecha de Excel
+ORIGEN_EXCEL = pd.Timestamp('1899-12-30')
+
+
+def parse_dates(serie):
+    # Lo que no se reconoce queda NaT
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    # Sin la hora que agregan algunas filas ("7/01/2024 0:00")
+    texto = serie.astype('string').str.strip().str.split(' ').str[0]
+    fechas = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+    for formato in FORMATOS_FECHA:
+        fechas = fechas.fillna(pd.to_datetime(texto, format=formato, errors='coerce'))
+    serial = pd.to_numeric(texto.where(texto.str.fullmatch(r'\d{5}', na=False)), errors='coerce')
+    return fechas.fillna(ORIGEN_EXCEL + pd.to_timedelta(serial, unit='D'))
+
+
+def _periodos(fechas, granularidad):
+    if granularidad == 'dia':
+        return fechas.dt.normalize()
+    # Semanas de lunes a domingo, identificadas por su lunes
+    return fechas.dt.to_period('W-SUN').dt.start_time
+
+
+def _compactar(tabla):
+    tabla = tabla.copy()
+    for col in DIMENSIONES:
+        if col == 'cluster_dbscan':
+            tabla[col] = tabla[col].astype('Int32')
+        else:
+            tabla[col] = tabla[col].astype('string').astype('category')
+    tabla['cuenta'] = tabla['cuenta'].astype('int32')
+    return tabla.sort_values('periodo', kind='stable').reset_index(drop=True)
+
+
+def _sumar(partes):
+    datos = pd.concat(partes, ignore_index=True)
+    for col in DIMENSIONES:
+        if col != 'cluster_dbscan':
+            datos[col] = datos[col].astype('string')
+    tabla = datos.groupby(['periodo'] + DIMENSIONES, dropna=False, sort=False)['cuenta'].sum().reset_index()
+    return _compactar(tabla)
+
+
+def build(df):
+    # Rollups de los comentarios con fecha; None si la base no tiene fechas
+    if 'fecha' not in df.columns:
+        return None
+    fechas = parse_dates(df['fecha'])
+    validas = fechas.notna().to_numpy()
+    fechas = fechas[validas]
+
+    datos = pd.DataFrame(index=fechas.index)
+    for col in DIMENSIONES:
+        if col not in df.columns:
+            datos[col] = pd.NA
+        elif col == 'cluster_dbscan':
+            datos[col] = pd.to_numeric(df[col][validas], errors='coerce').astype('Int32')
+        else:
+            datos[col] = df[col][validas].astype('string').str.strip()
+
+    return {
+        granularidad: _sumar([datos.assign(periodo=_periodos(fechas, granularidad), cuenta=1)])
+        for granularidad in GRANULARIDADES
+    }
+
+
+def update(rollups, df_nuevo):
+    # Suma los conteos de los comentarios nuevos sin recorrer el histórico
+    delta = build(df_nuevo)
+    if delta is None:
+        return rollups
+    return {g: _sumar([rollups[g], delta[g]]) for g in GRANULARIDADES}
+
+
+def date_range(rollups):
+    periodos = rollups['dia']['periodo']
+    if periodos.empty:
+        return None, None
+    return periodos.min(), periodos.max()
+
+
+def query(rollups, granularidad='semana', desde=None, hasta=None, por='sentimiento', filtros=None):
+    # Conteos por periodo y por los valores de `por` dentro del rango de fechas,
+    # con filtros opcionales {dimensión: valores}
+    datos = rollups[granularidad]
+    mascara = pd.Series(True, index=datos.index)
+    if desde is not None:
+        # Incluye el periodo (p. ej. la semana) que contiene la fecha inicial
+        desde = _periodos(pd.Series([pd.Timestamp(desde)]), granularidad).iloc[0]
+        mascara &= datos['periodo'] >= desde
+    if hasta is not None:
+        mascara &= datos['periodo'] <= pd.Timestamp(hasta)
+    for dim, valores in (filtros or {}).items():
+        mascara &= datos[dim].isin(list(valores))
+    columnas = ['periodo'] + ([por] if por else [])
+    return datos[mascara].groupby(columnas, observed=True)['cuenta'].sum().reset_index()
+
+
+def save(rollups, path=SERIES_DIR):
+    os.makedirs(path, exist_ok=True)
+    for granularidad, tabla in rollups.items():
+        destino = os.path.join(path, f'{granularidad}.parquet')
+        tabla.to_parquet(destino + '.tmp', index=False)
+        os.replace(destino + '.tmp', destino)
+
+
+def _archivos(path):
+    return {g: os.path.join(path, f'{g}.parquet') for g in GRANULARIDADES}
+
+
+def load(path=SERIES_DIR):
+    archivos = _archivos(path)
+    if not all(os.path.exists(ruta) for ruta in archivos.values()):
+        return None
+    return {clave: pd.read_parquet(ruta) for clave, ruta in archivos.items()}
+
+
+def store_version(path=SERIES_DIR):
+    # Fecha de modificación del archivo más antiguo; 0.0 si falta alguno
+    try:
+        return min(os.path.getmtime(ruta) for ruta in _archivos(path).values())
+    except FileNotFoundError:
+        return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye los rollups diarios y semanales de sentimiento")
+    parser.add_argument('--input', default='./databases/db_final.csv')
+    parser.add_argument('--output', default=SERIES_DIR)
+    args = parser.parse_args()
+
+    df = utils.read_csv_auto(args.input)
+    if df is None:
+        raise SystemExit(f"No se encontró o no se pudo leer el archivo: {args.input}")
+    rollups = build(df)
+    if rollups is None:
+        raise SystemExit(f"{args.input} no tiene columna 'fecha': regenérala con prep_db.py")
+    save(rollups, args.output)
+    inicio, fin = date_range(rollups)
+    print(f"Rollups guardados en {args.output} ({inicio:%Y-%m-%d} a {fin:%Y-%m-%d})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# Tokenización y normalización de términos compartida por las nubes de palabras
+# y el índice de frecuencias (term_index.py).
+# El patrón se compila una sola vez, las variantes con y sin tilde se pliegan a
+# la misma forma ("más"/"mas", "guía"/"guia"; la ñ se conserva) y las stopwords
+# se guardan plegadas en un frozenset, de modo que todas las vistas cuentan
+# los mismos términos.
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+# Mismo patrón de palabras que usa WordCloud por defecto
+PATRON = re.compile(r"\w[\w']*")
+POSESIVO = re.compile(r"'s$")
+
+# Vocales con tilde, diéresis o acento grave -> vocal simple
+_PLIEGUE = str.maketrans('áéíóúüàèìòùâêîôûäëïö', 'aeiouuaeiouaeiouaeio')
+
+
+def fold(texto):
+    return texto.lower().translate(_PLIEGUE)
+
+
+def fold_series(serie):
+    return serie.str.lower().str.translate(_PLIEGUE)
+
+
+class Tokenizer:
+
+    def __init__(self, stopwords=()):
+        self.stopwords = frozenset(fold(w) for w in stopwords)
+
+    def tokenize(self, serie):
+        # Serie de términos (en minúsculas, sin plegar) con el índice de la fila
+        # de origen: una fila por término. WordCloud descarta los números
+        terminos = serie.fillna('').astype(str).str.lower().str.findall(PATRON).explode().dropna()
+        terminos = terminos.str.replace(POSESIVO, '', regex=True)
+        return terminos[~terminos.str.isdigit() & (terminos != '')]
+
+    def canonical(self, terminos, pesos=None):
+        # Reemplaza cada término por la variante más frecuente de su forma
+        # plegada: las cuentas se unen y se muestra la grafía habitual. Con
+        # `pesos` (p. ej. conteos ya agregados) gana la variante de mayor suma.
+        # Los empates se resuelven por orden alfabético, así el resultado no
+        # depende del orden de las filas
+        plegados = fold_series(terminos)
+        pares = pd.DataFrame({
+            'plegado': plegados.to_numpy(),
+            'termino': terminos.to_numpy(),
+            'peso': 1 if pesos is None else np.asarray(pesos),
+        })
+        formas = (
+            pares.groupby(['plegado', 'termino'], sort=False)['peso'].sum()
+            .reset_index()
+            .sort_values(['peso', 'termino'], ascending=[False, True], kind='stable')
+            .drop_duplicates('plegado')
+            .set_index('plegado')['termino']
+        )
+        return pd.Series(plegados.map(formas).to_numpy(), index=terminos.index, name=terminos.name)
+
+    def stopword_mask(self, terminos):
+        return fold_series(pd.Series(terminos, dtype=object)).isin(self.stopwords).to_numpy()
+
+
+@functools.lru_cache(maxsize=1)
+def default():
+    # Tokenizador con las stopwords del proyecto, compartido por todo el proceso
+    return Tokenizer(utils.load_stopwords())
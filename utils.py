@@ -1,21 +1,34 @@
 # Imports necesarios para procesamiento de texto, manejo de datos y detección de codificación
-import nltk
-from nltk.corpus import stopwords
-
 import pandas as pd
 import chardet
+import codecs
+import contextlib
+import hashlib
 import os
+import re
+import unicodedata
+
+import profiling
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+
+# Directorio base para cachés y artefactos generados (no versionados)
+CACHE_DIR = './databases/cache'
+
+# Lista de stopwords en español de NLTK (Snowball) incluida en el repositorio,
+# así cargarla no importa nltk ni hace descargas
+STOPWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'databases', 'stopwords_es.txt')
 
 
 def load_stopwords():
-    # Verificar si los stopwords de NLTK están disponibles, si no, descargarlos
-    try:
-        nltk.data.find('corpora/stopwords')
-    except LookupError:
-        nltk.download('stopwords')
+    with open(STOPWORDS_PATH, encoding='utf-8') as f:
+        stopwords_es = {linea.strip() for linea in f if linea.strip()}
 
-    # Crear conjunto de stopwords en español y agregar palabras frecuentes irrelevantes para análisis
-    stopwords_es = set(stopwords.words('spanish'))
+    # Agregar palabras frecuentes irrelevantes para análisis
     stopwords_es.update([
         "playa", "blanca", "cartagena", "gracias", "pues", "muy", "cómo",
         "más", "menos", "ser", "estar", "tener", "hacer", "ir", "aquí","que","los",
@@ -28,23 +41,183 @@ def load_stopwords():
     return stopwords_es
 
 
-def read_csv_auto(filename):
+# Tamaño de la muestra inicial usada para detectar codificación y separador
+SAMPLE_BYTES = 64 * 1024
+SEPARADORES = [',', ';', '\t']
+
+
+def _es_utf8(muestra, recortada):
+    # Decodificación estricta: un archivo en codificación de un byte con acentos
+    # casi nunca es UTF-8 válido, mientras que chardet suele confundir UTF-8
+    # sin BOM con MacRoman o Windows-125x
+    try:
+        muestra.decode('utf-8')
+        return True
+    except UnicodeDecodeError as error:
+        # Si la muestra está recortada, el último carácter puede quedar partido
+        return recortada and error.reason == 'unexpected end of data' and error.start >= len(muestra) - 3
+
+
+def sniff_csv(filename, sample_size=SAMPLE_BYTES):
+    # Detectar codificación y separador leyendo solo un prefijo acotado del archivo
+    with open(filename, 'rb') as f:
+        muestra = f.read(sample_size)
+
+    # Cortar en el último salto de línea para no partir un carácter multibyte
+    recortada = len(muestra) == sample_size
+    if recortada:
+        corte = muestra.rfind(b'\n')
+        if corte > 0:
+            muestra = muestra[:corte]
+
+    if muestra.startswith(codecs.BOM_UTF8):
+        enc = 'utf-8-sig'
+    elif _es_utf8(muestra, recortada):
+        enc = 'utf-8'
+    else:
+        enc = chardet.detect(muestra)['encoding'] or 'utf-8'
+
+    # El separador es el candidato que más columnas produce en la cabecera
+    cabecera = muestra.decode(enc, errors='replace').splitlines()[0] if muestra else ''
+    conteos = [cabecera.count(sep) for sep in SEPARADORES]
+    sep = SEPARADORES[conteos.index(max(conteos))]
+
+    return {'encoding': enc, 'sep': sep, 'columns': max(conteos) + 1, 'sample_bytes': len(muestra)}
+
+
+def read_csv_auto(filename, engine='c', **kwargs):
+    with profiling.stage('read_csv_auto') as etapa:
+        df = _read_csv(filename, engine, **kwargs)
+        etapa['rows'] = None if df is None else len(df)
+    return df
+
+
+def detect_encoding(filename, bloque=SAMPLE_BYTES):
+    # Detección con el archivo completo (por bloques): solo se usa cuando la
+    # codificación de la muestra no sirve para leerlo. Primero UTF-8 estricto,
+    # igual que en sniff_csv
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    detector = chardet.UniversalDetector()
+    with open(filename, 'rb') as f:
+        for parte in iter(lambda: f.read(bloque), b''):
+            if utf8 is not None:
+                try:
+                    utf8.decode(parte)
+                except UnicodeDecodeError:
+                    utf8 = None
+            if not detector.done:
+                detector.feed(parte)
+    if utf8 is not None:
+        try:
+            utf8.decode(b'', final=True)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+    detector.close()
+    enc = detector.result['encoding'] or 'utf-8'
+    return 'utf-8' if enc.lower() == 'ascii' else enc
+
+
+def _tiene_binarias(df):
+    # Con bytes inválidos para la codificación Arrow no falla: deja la columna
+    # como binaria
+    for col in df.select_dtypes(include='object').columns:
+        valores = df[col].dropna()
+        if not valores.empty and isinstance(valores.iloc[0], bytes):
+            return True
+    return False
+
+
+def _leer_csv(filename, info, engine, **kwargs):
+    # Devuelve el DataFrame y el motor que lo leyó
+    enc = info['encoding']
+    if engine == 'pyarrow':
+        try:
+            # Arrow descarta el BOM por su cuenta
+            df = pd.read_csv(filename, sep=info['sep'], encoding='utf-8' if enc == 'utf-8-sig' else enc,
+                             engine='pyarrow', on_bad_lines='skip', **kwargs)
+            if not _tiene_binarias(df):
+                return df, 'pyarrow'
+        except Exception:
+            # El motor de Arrow no admite saltos de línea dentro de campos
+            # entrecomillados
+            pass
+        engine = 'c'
+    return pd.read_csv(filename, sep=info['sep'], encoding=enc, engine=engine,
+                       on_bad_lines='skip', **kwargs), engine
+
+
+def _read_csv(filename, engine='c', **kwargs):
     # Retornar None si el archivo no existe
     if not os.path.exists(filename):
         return None
 
-    # Detectar codificación automáticamente
-    with open(filename, 'rb') as f:
-        enc = chardet.detect(f.read())['encoding']
+    # Detectar codificación y separador con una muestra, luego leer una sola vez
+    info = sniff_csv(filename)
+    if info['columns'] <= 1:
+        return None
 
-    # Intentar leer el CSV con distintos separadores comunes
-    for sep in [',', ';', '\t']:
+    try:
         try:
-            df_temp = pd.read_csv(filename, sep=sep, encoding=enc, on_bad_lines='skip')
-            # Validar que tenga más de una columna para considerar que la lectura fue correcta
-            if df_temp.shape[1] > 1:
-                return df_temp
-        except Exception:
-            continue
+            df, engine = _leer_csv(filename, info, engine, **kwargs)
+        except UnicodeDecodeError:
+            # La muestra puede no tener bytes fuera de ASCII aunque el resto sí
+            # (p. ej. una exportación cp1252 con el primer acento más adelante):
+            # se detecta con el archivo completo y, si aun así falla, se
+            # reemplazan los bytes inválidos en lugar de descartar el archivo
+            info = dict(info, encoding=detect_encoding(filename), full_detection=True)
+            try:
+                df, engine = _leer_csv(filename, info, engine, **kwargs)
+            except UnicodeDecodeError:
+                info['encoding_errors'] = 'replace'
+                df, engine = _leer_csv(filename, info, engine, encoding_errors='replace', **kwargs)
+    except Exception:
+        return None
+
+    # Validar que tenga más de una columna para considerar que la lectura fue correcta
+    if df.shape[1] <= 1:
+        return None
+
+    # Dejar constancia de lo detectado para diagnóstico
+    df.attrs['csv'] = dict(info, engine=engine)
+    return df
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    # Bloqueo exclusivo entre procesos (dashboard, ingest.py, build_artifacts.py)
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalize_comment(texto):
+    # Forma canónica del comentario: Unicode NFC, sin espacios repetidos ni en los extremos
+    if texto is None or (isinstance(texto, float) and pd.isna(texto)):
+        return ""
+    texto = unicodedata.normalize("NFC", str(texto))
+    return _ESPACIOS.sub(" ", texto).strip()
+
+
+def comment_hash(texto, namespace=""):
+    # Hash estable del comentario normalizado; el namespace (p. ej. el nombre
+    # del modelo) permite que distintas etapas no compartan claves
+    h = hashlib.blake2b(digest_size=16)
+    h.update(namespace.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(normalize_comment(texto).encode("utf-8"))
+    return h.hexdigest()
+
 
-    return None
+def dataset_fingerprint(df):
+    # Huella del contenido del DataFrame (no depende del índice)
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()